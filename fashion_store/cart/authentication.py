@@ -0,0 +1,41 @@
+"""
+Token authentication for the cart read views.
+
+JWTStatelessUserAuthentication trusts the token's user id without loading
+the user, which keeps a cached cart read free of queries but would also let a
+deactivated or deleted user's unexpired token read and create carts. Here the
+account is checked against an is_active flag kept in the cart cache, filled
+from the database on a miss and dropped whenever the user is saved or deleted
+(see cart.signals), so a cache hit still touches no table.
+"""
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from . import cart_cache
+
+ACTIVE_KEY = 'cart:user-active:{}'
+# Safety net for writes that skip signals (queryset updates)
+ACTIVE_TIMEOUT = 5 * 60
+
+
+def user_is_active(user_id):
+    key = ACTIVE_KEY.format(user_id)
+    active = cart_cache.backend().get(key)
+    if active is None:
+        active = get_user_model().objects.filter(id=user_id, is_active=True).exists()
+        cart_cache.backend().set(key, active, ACTIVE_TIMEOUT)
+    return active
+
+
+def forget_user(user_id):
+    cart_cache.backend().delete(ACTIVE_KEY.format(user_id))
+
+
+class CachedActiveUserJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not user_is_active(user.id):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -0,0 +1,104 @@
+"""
+Several cart changes in one request.
+
+Operations are folded per variant in order (add, set, remove) into the final
+quantity of each line, checked against stock read under one
+select_for_update over the involved variants, and written with at most one
+bulk_create, one bulk_update and one DELETE, all in one transaction.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import ProductVariant
+from . import cart_cache
+from .guest import max_items
+from .models import CartItem
+
+MAX_OPERATIONS = 100
+
+
+class BatchError(ValueError):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def fold(operations, quantities):
+    """
+    Final {variant id: quantity} after applying operations to quantities;
+    0 means the line goes away
+    """
+    quantities = dict(quantities)
+    for operation in operations:
+        variant_id = operation['product_variant_id']
+        if operation['op'] == 'add':
+            quantities[variant_id] = quantities.get(variant_id, 0) + operation['quantity']
+        elif operation['op'] == 'set':
+            quantities[variant_id] = operation['quantity']
+        else:
+            quantities[variant_id] = 0
+    return quantities
+
+
+def check_stock(quantities, stock):
+    for variant_id, quantity in quantities.items():
+        if variant_id not in stock:
+            raise BatchError(f'Product variant {variant_id} not found', status_code=404)
+        if quantity > stock[variant_id]:
+            raise BatchError(f'Only {stock[variant_id]} items available in stock for variant {variant_id}')
+
+
+def apply_operations(cart, operations):
+    """
+    Apply operations to a user's cart; raises BatchError and changes nothing
+    if any line would exceed stock
+    """
+    variant_ids = {operation['product_variant_id'] for operation in operations}
+    with transaction.atomic():
+        # Locked in id order so concurrent batches cannot deadlock
+        stock = dict(
+            ProductVariant.objects.select_for_update().filter(id__in=variant_ids)
+            .order_by('id').values_list('id', 'stock_quantity')
+        )
+        existing = {item.product_variant_id: item for item in cart.items.filter(product_variant_id__in=variant_ids)}
+        quantities = fold(operations, {variant_id: item.quantity for variant_id, item in existing.items()})
+        check_stock({variant_id: quantity for variant_id, quantity in quantities.items() if quantity}, stock)
+
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        to_delete = []
+        for variant_id, quantity in quantities.items():
+            item = existing.get(variant_id)
+            if item is None:
+                if quantity:
+                    to_create.append(CartItem(cart=cart, product_variant_id=variant_id, quantity=quantity))
+            elif not quantity:
+                to_delete.append(item.id)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                # bulk_update does not run auto_now
+                item.updated_at = now
+                to_update.append(item)
+
+        CartItem.objects.bulk_create(to_create)
+        CartItem.objects.bulk_update(to_update, ['quantity', 'updated_at'])
+        if to_delete:
+            CartItem.objects.filter(id__in=to_delete).delete()
+        cart_cache.invalidate_on_commit(cart.user_id)
+    return {'created': len(to_create), 'updated': len(to_update), 'removed': len(to_delete)}
+
+
+def apply_guest_operations(guest, operations):
+    """
+    Same for a guest cart, checked against current stock
+    """
+    variant_ids = {operation['product_variant_id'] for operation in operations}
+    quantities = fold(operations, guest.quantities)
+    stock = dict(ProductVariant.objects.filter(id__in=variant_ids).values_list('id', 'stock_quantity'))
+    check_stock({variant_id: quantities[variant_id] for variant_id in variant_ids if quantities[variant_id]}, stock)
+    lines = {variant_id: quantity for variant_id, quantity in quantities.items() if quantity}
+    if len(lines) > max(len(guest.quantities), max_items()):
+        raise BatchError('Your cart is full. Please login to add more items.')
+    guest.quantities = lines
+    guest.save()
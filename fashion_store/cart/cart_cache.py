@@ -0,0 +1,109 @@
+"""
+Write-through cache of rendered cart payloads.
+
+Each user's cart JSON is cached under a stamp made of a per-user version and
+a global generation, both counters in the cart cache. Cart mutations bump the
+user's version on commit and then store the freshly serialized cart under the
+new stamp; a payload written under an older stamp is simply never served, so
+racing writers cannot leave a stale cart behind. Catalog changes that show in
+carts (product name, prices and images, variant attributes) bump every user
+whose cart holds an affected variant, found through CartItem's variant index
+(see cart.signals); bulk catalog writes bump the generation instead.
+
+The backend is the Django cache alias named by CART_CACHE_ALIAS, so it can be
+pointed at Redis, Memcached or the file-based cache independently of the
+catalog caches. It must be shared by every worker process (see cart/checks.py).
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from products.catalog_cache import initial_version
+
+GENERATION_KEY = 'cart:generation'
+VERSION_KEY = 'cart:version:{}'
+PAYLOAD_KEY = 'cart:payload:{}'
+# Safety net only; entries normally die by version bump
+PAYLOAD_TIMEOUT = 60 * 60
+
+
+def backend():
+    return caches[getattr(settings, 'CART_CACHE_ALIAS', 'default')]
+
+
+def get_version(key):
+    return backend().get_or_set(key, initial_version, timeout=None)
+
+
+def bump_version(key):
+    try:
+        return backend().incr(key)
+    except ValueError:
+        version = initial_version()
+        backend().set(key, version, timeout=None)
+        return version
+
+
+def invalidate(user_id):
+    bump_version(VERSION_KEY.format(user_id))
+
+
+def invalidate_users(user_ids):
+    for user_id in set(user_ids):
+        invalidate(user_id)
+
+
+def invalidate_on_commit(user_id):
+    transaction.on_commit(lambda: invalidate(user_id))
+
+
+def invalidate_all():
+    bump_version(GENERATION_KEY)
+
+
+def lookup(user_id, host):
+    """
+    (stamp, body) for the user's cart as rendered for host. body is None on
+    a miss; the stamp is what a rebuilt payload must be stored under.
+    """
+    version_key = VERSION_KEY.format(user_id)
+    payload_key = PAYLOAD_KEY.format(user_id)
+    values = backend().get_many([GENERATION_KEY, version_key, payload_key])
+    stamp = (
+        values.get(GENERATION_KEY) or get_version(GENERATION_KEY),
+        values.get(version_key) or get_version(version_key),
+    )
+    payload = values.get(payload_key)
+    if payload is not None and payload['stamp'] == stamp:
+        return stamp, payload['bodies'].get(host)
+    return stamp, None
+
+
+def store(user_id, stamp, host, data):
+    """
+    Render data, cache it under stamp for host and return the bytes
+    """
+    body = JSONRenderer().render(data)
+    payload_key = PAYLOAD_KEY.format(user_id)
+    payload = backend().get(payload_key)
+    if payload is None or payload['stamp'] != stamp:
+        payload = {'stamp': stamp, 'bodies': {}}
+    # Absolute image URLs depend on the host
+    payload['bodies'][host] = body
+    backend().set(payload_key, payload, timeout=PAYLOAD_TIMEOUT)
+    return body
+
+
+def cached_cart_response(request, build, status_code=200):
+    """
+    Serve request.user's cart from the cache, building it with build() on a
+    miss. Call outside any transaction, after the change being shown has
+    committed and bumped the user's version.
+    """
+    host = request.build_absolute_uri('/')
+    stamp, body = lookup(request.user.id, host)
+    if body is None:
+        body = store(request.user.id, stamp, host, build())
+    return HttpResponse(body, status=status_code, content_type='application/json')
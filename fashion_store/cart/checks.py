@@ -0,0 +1,28 @@
+"""
+System checks for the cart app.
+"""
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+from . import cart_cache
+
+# Backends whose entries no other worker process can read
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+@register(Tags.caches)
+def check_cart_cache_is_shared(app_configs, **kwargs):
+    """
+    Guest carts exist only in the cart cache, and cart payloads are
+    invalidated through it, so every worker must read the same one
+    """
+    backend = cart_cache.backend()
+    if not isinstance(backend, PROCESS_LOCAL_BACKENDS):
+        return []
+    return [Error(
+        f'The cart cache uses {type(backend).__name__}, which other worker processes cannot read.',
+        hint='Point the CACHES alias named by CART_CACHE_ALIAS at Redis, Memcached, or a '
+             'FileBasedCache directory that every worker shares.',
+        id='cart.E001',
+    )]
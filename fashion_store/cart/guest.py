@@ -0,0 +1,172 @@
+"""
+Carts for anonymous shoppers.
+
+A guest cart is a {variant id: quantity} dict in the cart cache under a
+random token that the client keeps and sends back in the X-Cart-Token
+header, so visitors who never sign in cost no database writes. The cart
+cache holds the only copy, which is why it must be shared by every worker
+(see cart/checks.py). At login or registration the guest cart is merged into
+the user's Cart with a single bulk upsert, capping each line at the
+variant's stock.
+"""
+import logging
+import re
+import secrets
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from products.models import ProductImage, ProductVariant
+from . import cart_cache
+from .models import Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'HTTP_X_CART_TOKEN'
+TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{20,64}$')
+CACHE_KEY = 'cart:guest:{}'
+
+
+def timeout():
+    return getattr(settings, 'GUEST_CART_TIMEOUT', 7 * 24 * 60 * 60)
+
+
+def max_items():
+    return getattr(settings, 'GUEST_CART_MAX_ITEMS', 50)
+
+
+def request_token(request):
+    """
+    Guest cart token from the X-Cart-Token header or a cart_token field
+    """
+    token = request.META.get(TOKEN_HEADER) or request.data.get('cart_token')
+    if isinstance(token, str) and TOKEN_RE.match(token):
+        return token
+    return None
+
+
+class GuestCart:
+    """
+    Quacks like Cart for CartSerializer. Items are unsaved CartItems whose id
+    is the variant id, which is what the item endpoints take for guests.
+    """
+    id = None
+
+    def __init__(self, token=None, quantities=None, updated_at=None):
+        self.token = token
+        self.quantities = quantities or {}
+        self.updated_at = updated_at or timezone.now()
+        self._items = None
+
+    @classmethod
+    def load(cls, token):
+        data = cart_cache.backend().get(CACHE_KEY.format(token)) if token else None
+        if data is None:
+            return cls()
+        return cls(token, data['items'], data['updated_at'])
+
+    def save(self):
+        if self.token is None:
+            self.token = secrets.token_urlsafe(24)
+        self.updated_at = timezone.now()
+        self._items = None
+        cart_cache.backend().set(CACHE_KEY.format(self.token), {'items': self.quantities, 'updated_at': self.updated_at}, timeout())
+
+    def delete(self):
+        if self.token is not None:
+            cart_cache.backend().delete(CACHE_KEY.format(self.token))
+        self.quantities = {}
+        self._items = None
+
+    def is_full_for(self, variant_id):
+        return variant_id not in self.quantities and len(self.quantities) >= max_items()
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = self.load_items()
+        return self._items
+
+    def load_items(self):
+        # One query for variants, products and primary image names
+        primary_image = ProductImage.objects.filter(product_id=OuterRef('product_id')).order_by('-is_primary', 'id')
+        variants = ProductVariant.objects.filter(id__in=list(self.quantities)).select_related('product').annotate(
+            primary_image=Subquery(primary_image.values('image')[:1])
+        ).order_by('id') if self.quantities else []
+        items = []
+        for variant in variants:
+            item = CartItem(id=variant.id, product_variant=variant, quantity=self.quantities[variant.id])
+            item.primary_image = variant.primary_image
+            items.append(item)
+        return items
+
+    @property
+    def total_items(self):
+        return sum(item.quantity for item in self.items)
+
+    @property
+    def total_price(self):
+        return sum((item.subtotal for item in self.items), Decimal('0.00'))
+
+    def summary(self):
+        """
+        Item count and total without building the items, in at most one query
+        """
+        if not self.quantities:
+            return {'total_items': 0, 'total_price': Decimal('0.00')}
+        prices = ProductVariant.objects.filter(id__in=list(self.quantities)).values_list(
+            'id', 'product__effective_price'
+        )
+        return {
+            'total_items': sum(self.quantities.values()),
+            'total_price': sum((price * self.quantities[variant_id] for variant_id, price in prices), Decimal('0.00')),
+        }
+
+
+def merge_into_user(user, token):
+    """
+    Move a guest cart into the user's Cart and return the number of lines
+    written. Quantities add up, capped at stock.
+    """
+    guest = GuestCart.load(token)
+    if not guest.quantities:
+        return 0
+
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
+        stock = dict(ProductVariant.objects.filter(id__in=list(guest.quantities)).values_list('id', 'stock_quantity'))
+        existing = dict(cart.items.filter(product_variant_id__in=list(stock)).values_list('product_variant_id', 'quantity'))
+        items = []
+        for variant_id, quantity in guest.quantities.items():
+            merged = min(existing.get(variant_id, 0) + quantity, stock.get(variant_id, 0))
+            if merged > 0 and merged != existing.get(variant_id):
+                items.append(CartItem(cart=cart, product_variant_id=variant_id, quantity=merged))
+        if items:
+            # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+            unique_fields = ['cart', 'product_variant'] if connection.features.supports_update_conflicts_with_target else None
+            CartItem.objects.bulk_create(
+                items, update_conflicts=True, unique_fields=unique_fields, update_fields=['quantity', 'updated_at']
+            )
+        transaction.on_commit(guest.delete)
+        transaction.on_commit(lambda: cart_cache.invalidate(user.id))
+    return len(items)
+
+
+def merge_request_cart(request, user):
+    """
+    Merge the guest cart named by the request, if any. Never fails the
+    login it is part of.
+    """
+    token = request_token(request)
+    if token is None:
+        return 0
+    try:
+        merged = merge_into_user(user, token)
+        logger.info(f"Merged {merged} guest cart lines into cart for user {user.id}")
+        return merged
+    except Exception as e:
+        logger.error(f"Error merging guest cart for user {user.id}: {str(e)}")
+        return 0
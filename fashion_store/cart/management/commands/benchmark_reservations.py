@@ -0,0 +1,92 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from cart import reservations
+from cart.models import Cart, CartItem, StockReservation
+from products.models import Category, Product, ProductVariant
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Start many concurrent checkouts of one hot SKU against the configured database, '
+        'report throughput and check nothing was oversold. Creates and removes its own data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--stock', type=int, default=100, help='Units of the hot SKU')
+        parser.add_argument('--quantity', type=int, default=1, help='Units each checkout asks for')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:12]
+        category = Category.objects.create(name=f'Reservation benchmark {tag}', is_active=False)
+        product = Product.objects.create(
+            name=f'Reservation benchmark {tag}', description='Benchmark fixture', category=category,
+            price='100.00', gender='unisex', brand='Benchmark', is_active=False
+        )
+        variant = ProductVariant.objects.create(
+            product=product, size='M', color='Black', stock_quantity=options['stock'], sku=f'BENCH-{tag}'
+        )
+        # Re-read after bulk_create, which does not set ids on every backend
+        User.objects.bulk_create([
+            User(username=f'bench-{tag}-{number}', email=f'bench-{tag}-{number}@example.com')
+            for number in range(options['checkouts'])
+        ])
+        users = User.objects.filter(username__startswith=f'bench-{tag}-')
+        Cart.objects.bulk_create([Cart(user=user) for user in users])
+        carts = list(Cart.objects.filter(user__in=users))
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_variant=variant, quantity=options['quantity']) for cart in carts
+        ])
+
+        def checkout(cart):
+            started = time.monotonic()
+            try:
+                reservations.reserve(cart)
+                outcome = 'reserved'
+            except reservations.InsufficientStock:
+                outcome = 'sold out'
+            except Exception as e:
+                outcome = f'error: {e.__class__.__name__}'
+            finally:
+                connection.close()
+            return outcome, time.monotonic() - started
+
+        try:
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                results = list(executor.map(checkout, carts))
+            elapsed = time.monotonic() - started
+
+            outcomes = {}
+            for outcome, duration in results:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            latencies = sorted(duration for outcome, duration in results)
+            held = StockReservation.objects.filter(
+                product_variant=variant, expires_at__gt=timezone.now()
+            ).aggregate(held=Sum('quantity'))['held'] or 0
+
+            self.stdout.write(
+                f'{len(carts)} checkouts on {options["workers"]} workers ({connection.vendor}) in {elapsed:.2f}s: '
+                f'{len(carts) / elapsed:.0f} checkouts/s, p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, '
+                f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms'
+            )
+            self.stdout.write(', '.join(f'{outcome}: {count}' for outcome, count in sorted(outcomes.items())))
+            if held > options['stock']:
+                self.stdout.write(self.style.ERROR(f'Oversold: {held} units held of {options["stock"]}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{held} of {options["stock"]} units held, none oversold'))
+        finally:
+            users.delete()
+            product.delete()
+            category.delete()
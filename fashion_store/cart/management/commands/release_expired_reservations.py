@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cart import reservations
+
+
+class Command(BaseCommand):
+    help = 'Delete expired checkout stock holds in batches (run periodically, or with --interval as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=reservations.SWEEP_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, help='Keep sweeping, sleeping this many seconds between runs')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            released = reservations.release_expired(batch_size=options['batch_size'])
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations in {elapsed:.2f}s'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
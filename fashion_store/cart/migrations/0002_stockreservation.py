@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_effective_price'),
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='cart.cart')),
+                ('product_variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.productvariant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product_variant', 'expires_at', 'quantity'], name='reservation_active_idx'), models.Index(fields=['expires_at'], name='reservation_expiry_idx')],
+                'unique_together': {('cart', 'product_variant')},
+            },
+        ),
+    ]
@@ -1,9 +1,28 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
 from products.models import ProductVariant
 
 User = get_user_model()
 
+def cart_totals(items):
+    """
+    {'total_items', 'total_price'} for a CartItem queryset in one aggregate query.
+    Product.effective_price is the stored Coalesce of discount and list price.
+    """
+    money = models.DecimalField(max_digits=12, decimal_places=2)
+    return items.aggregate(
+        total_items=Coalesce(Sum('quantity'), 0),
+        total_price=Coalesce(
+            Sum(F('quantity') * F('product_variant__product__effective_price'), output_field=money),
+            Value(Decimal('0.00')),
+            output_field=money,
+        ),
+    )
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -12,13 +31,24 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    @cached_property
+    def totals(self):
+        items = getattr(self, '_prefetched_objects_cache', {}).get('items')
+        if items is not None:
+            # Already loaded for serialization
+            return {
+                'total_items': sum(item.quantity for item in items),
+                'total_price': sum((item.subtotal for item in items), Decimal('0.00')),
+            }
+        return cart_totals(self.items.all())
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.totals['total_items']
 
     @property
     def total_price(self):
-        return sum(item.subtotal for item in self.items.all())
+        return self.totals['total_price']
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -37,6 +67,28 @@ class CartItem(models.Model):
     def subtotal(self):
         return self.product_variant.product.current_price * self.quantity
 
+class StockReservation(models.Model):
+    """
+    Stock held for a cart while it checks out (see cart/reservations.py).
+    Holds past expires_at no longer count and are swept in batches.
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('cart', 'product_variant')
+        indexes = [
+            # Covers the active-holds-per-variant aggregate
+            models.Index(fields=['product_variant', 'expires_at', 'quantity'], name='reservation_active_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_variant_id} x {self.quantity} for cart {self.cart_id}"
+
 class DiscountCode(models.Model):
     code = models.CharField(max_length=50, unique=True)
     discount_percent = models.DecimalField(max_digits=5, decimal_places=2)
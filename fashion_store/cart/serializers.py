@@ -1,5 +1,9 @@
 from rest_framework import serializers
+from django.core.files.storage import default_storage
+from django.db.models import OuterRef, Prefetch, Subquery
+from .batch import MAX_OPERATIONS
 from .models import Cart, CartItem, DiscountCode
+from products.models import ProductImage
 from products.serializers import ProductListSerializer
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -21,15 +25,19 @@ class CartItemSerializer(serializers.ModelSerializer):
         return obj.product_variant.product.current_price
     
     def get_product_image(self, obj):
-        # Get the first product image
-        if obj.product_variant.product.images.exists():
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(
-                    obj.product_variant.product.images.first().image.url
-                )
-            return obj.product_variant.product.images.first().image.url
-        return None
+        # Primary image first, then the oldest one; annotated by CartSerializer.setup_eager_loading
+        if hasattr(obj, 'primary_image'):
+            name = obj.primary_image
+        else:
+            image = obj.product_variant.product.images.order_by('-is_primary', 'id').first()
+            name = image.image.name if image else None
+        if not name:
+            return None
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(url)
+        return url
     
     def get_size(self, obj):
         # Directly access the CharField value
@@ -48,6 +56,21 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ['id', 'items', 'total_items', 'total_price', 'updated_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load the cart payload in two queries: the cart, then its items joined
+        to variant and product with the primary image name as a subquery.
+        Totals are computed from the same prefetched items.
+        """
+        primary_image = ProductImage.objects.filter(
+            product_id=OuterRef('product_variant__product_id')
+        ).order_by('-is_primary', 'id')
+        items = CartItem.objects.select_related('product_variant__product').annotate(
+            primary_image=Subquery(primary_image.values('image')[:1])
+        ).order_by('id')
+        return queryset.prefetch_related(Prefetch('items', queryset=items))
+
 class AddToCartSerializer(serializers.Serializer):
     product_variant_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
@@ -55,6 +78,29 @@ class AddToCartSerializer(serializers.Serializer):
 class UpdateCartItemSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=1)
 
+class CartOperationSerializer(serializers.Serializer):
+    OPERATIONS = ('add', 'set', 'remove')
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    product_variant_id = serializers.IntegerField()
+    # add needs at least 1; set to 0 removes the line
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, data):
+        if data['op'] != 'remove' and 'quantity' not in data:
+            raise serializers.ValidationError({'quantity': 'This field is required.'})
+        if data['op'] == 'add' and data['quantity'] < 1:
+            raise serializers.ValidationError({'quantity': 'Ensure this value is greater than or equal to 1.'})
+        return data
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, value):
+        if len(value) > MAX_OPERATIONS:
+            raise serializers.ValidationError(f'At most {MAX_OPERATIONS} operations per request.')
+        return value
+
 class DiscountCodeSerializer(serializers.ModelSerializer):
     class Meta:
         model = DiscountCode
@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from products.models import Product, ProductImage, ProductVariant
+from products.signals import products_bulk_updated, variant_attributes_changed
+from . import authentication, cart_cache
+from .models import Cart
+
+# Past this many products a bulk change drops every cached cart instead
+MAX_FAN_OUT_PRODUCTS = 1000
+
+
+def cart_owners(**filters):
+    # Reverse lookup through CartItem's variant index
+    lookups = {f'items__product_variant__{field}': value for field, value in filters.items()}
+    return list(Cart.objects.filter(**lookups).values_list('user_id', flat=True).distinct())
+
+
+def invalidate_carts_on_commit(**filters):
+    transaction.on_commit(lambda: cart_cache.invalidate_users(cart_owners(**filters)))
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_user_active_flag(sender, instance, **kwargs):
+    # Cart reads trust the cached flag (see cart/authentication.py)
+    user_id = instance.id
+    transaction.on_commit(lambda: authentication.forget_user(user_id))
+
+
+@receiver(post_save, sender=Product)
+def invalidate_carts_for_product(sender, instance, **kwargs):
+    # Name and prices show in carts
+    invalidate_carts_on_commit(product_id=instance.id)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_carts_for_image(sender, instance, **kwargs):
+    invalidate_carts_on_commit(product_id=instance.product_id)
+
+
+@receiver(post_save, sender=ProductVariant)
+def invalidate_carts_for_variant(sender, instance, **kwargs):
+    # Size, color or crossing in/out of stock; other stock moves do not show
+    if variant_attributes_changed(instance):
+        invalidate_carts_on_commit(id=instance.id)
+
+
+@receiver(pre_delete, sender=Product)
+@receiver(pre_delete, sender=ProductVariant)
+def invalidate_carts_before_delete(sender, instance, **kwargs):
+    # The cascade removes the cart items, so look the owners up first
+    field = 'product_id' if sender is Product else 'id'
+    user_ids = cart_owners(**{field: instance.id})
+    if user_ids:
+        transaction.on_commit(lambda: cart_cache.invalidate_users(user_ids))
+
+
+@receiver(products_bulk_updated)
+def invalidate_carts_for_bulk_update(sender, product_ids=None, **kwargs):
+    if product_ids is None or len(product_ids) > MAX_FAN_OUT_PRODUCTS:
+        cart_cache.invalidate_all()
+    else:
+        cart_cache.invalidate_users(cart_owners(product_id__in=product_ids))
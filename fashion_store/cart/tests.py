@@ -1,3 +1,392 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from products import bulk
+from products.models import Category, Product, ProductImage, ProductVariant
+from users.models import UserAddress
+
+from . import cart_cache, checks, reservations
+from .models import Cart, CartItem, StockReservation
+from .serializers import CartSerializer
+
+User = get_user_model()
+
+
+def make_user(username='shopper'):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345')
+
+
+def make_variant(category, index, stock_quantity=10, **kwargs):
+    product = Product.objects.create(
+        name=f'Shirt {index}', description='A plain cotton shirt', category=category,
+        price='100.00', gender='men', brand='Acme', **kwargs
+    )
+    return ProductVariant.objects.create(
+        product=product, size='M', color='Blue', stock_quantity=stock_quantity, sku=f'CART{index}'
+    )
+
+
+class CartQueryTests(TestCase):
+    def setUp(self):
+        cart_cache.backend().clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Shirts')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill(self, count, start=0):
+        for index in range(start, start + count):
+            variant = make_variant(self.category, index, discount_price='80.00' if index % 2 else None)
+            ProductImage.objects.create(product=variant.product, image=f'products/{index}-back.jpg')
+            ProductImage.objects.create(product=variant.product, image=f'products/{index}.jpg', is_primary=True)
+            CartItem.objects.create(cart=self.cart, product_variant=variant, quantity=2)
+        cart_cache.invalidate(self.user.id)
+
+    def test_cart_loads_in_two_queries_whatever_its_size(self):
+        self.fill(1)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.client.get('/api/cart/').json()['items']), 1)
+        self.fill(5, start=1)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.client.get('/api/cart/').json()['items']), 6)
+
+    def test_payload_and_totals(self):
+        self.fill(2)
+        data = self.client.get('/api/cart/').json()
+        self.assertEqual(data['total_items'], 4)
+        self.assertEqual(data['total_price'], 360.0)
+        first = data['items'][0]
+        self.assertEqual((first['product_name'], first['size'], first['color']), ('Shirt 0', 'M', 'Blue'))
+        self.assertEqual(first['product_image'], 'http://testserver/media/products/0.jpg')
+
+    def test_mutations_return_the_eager_loaded_cart(self):
+        self.fill(3)
+        item = CartItem.objects.order_by('id').first()
+        # Item lookup, savepoint, update, release, then the two cart queries
+        with self.assertNumQueries(6):
+            response = self.client.put(f'/api/cart/items/{item.id}/update/', {'quantity': 3}, format='json')
+        self.assertEqual(response.json()['total_items'], 7)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cart_cache.backend().clear()
+        self.client = APIClient()
+        category = Category.objects.create(name='Shirts')
+        self.shirt = make_variant(category, 1, stock_quantity=5)
+        self.polo = make_variant(category, 2, stock_quantity=5)
+
+    def add(self, variant, quantity, token=None):
+        headers = {'HTTP_X_CART_TOKEN': token} if token else {}
+        return self.client.post('/api/cart/add/', {'product_variant_id': variant.id, 'quantity': quantity},
+                                format='json', **headers)
+
+    def test_guest_cart_lives_in_the_cache(self):
+        with self.assertNumQueries(2):
+            response = self.add(self.shirt, 2)
+        self.assertEqual(response.status_code, 201)
+        token = response.json()['cart_token']
+        self.add(self.polo, 1, token)
+        self.assertFalse(Cart.objects.exists())
+
+        data = self.client.get('/api/cart/', HTTP_X_CART_TOKEN=token).json()
+        self.assertEqual([(item['id'], item['quantity']) for item in data['items']],
+                         [(self.shirt.id, 2), (self.polo.id, 1)])
+        self.assertEqual(data['total_items'], 3)
+        self.assertEqual(self.add(self.shirt, 4, token).status_code, 400)
+
+        response = self.client.put(f'/api/cart/items/{self.shirt.id}/update/', {'quantity': 5},
+                                   format='json', HTTP_X_CART_TOKEN=token)
+        self.assertEqual(response.json()['total_items'], 6)
+        response = self.client.delete(f'/api/cart/items/{self.polo.id}/remove/', HTTP_X_CART_TOKEN=token)
+        self.assertEqual(response.json()['total_items'], 5)
+        self.assertEqual(self.client.get('/api/cart/').json()['items'], [])
+
+    def test_login_merges_guest_cart_capped_at_stock(self):
+        token = self.add(self.shirt, 4).json()['cart_token']
+        self.add(self.polo, 1, token)
+        user = make_user()
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product_variant=self.shirt, quantity=3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/login/', {
+                'email': user.email, 'password': 'pass12345', 'cart_token': token
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(cart.items.values_list('product_variant_id', 'quantity')),
+                         {self.shirt.id: 5, self.polo.id: 1})
+        self.assertEqual(self.client.get('/api/cart/', HTTP_X_CART_TOKEN=token).json()['items'], [])
+
+
+class CartCacheTests(TransactionTestCase):
+    # Real commits, so on_commit invalidation runs before the write-through
+    def setUp(self):
+        cart_cache.backend().clear()
+        self.category = Category.objects.create(name='Shirts')
+        self.shirt = make_variant(self.category, 1)
+        self.polo = make_variant(self.category, 2)
+        self.user = make_user()
+        self.other = make_user('other')
+        for user in (self.user, self.other):
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product_variant=self.shirt, quantity=1)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def get(self, client=None):
+        return (client or self.client).get('/api/cart/').json()
+
+    def test_reads_are_served_from_the_cache(self):
+        self.assertEqual(self.get()['total_items'], 1)
+        # Stateless token auth plus a cache hit: no query at all
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get()['total_items'], 1)
+
+    def test_deactivated_and_deleted_users_are_refused(self):
+        self.assertEqual(self.get()['total_items'], 1)
+        self.user.is_active = False
+        self.user.save()
+        for url in ('/api/cart/', '/api/cart/summary/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 401)
+
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.other).access_token}')
+        self.assertEqual(self.get(other_client)['total_items'], 1)
+        self.other.delete()
+        self.assertEqual(other_client.get('/api/cart/').status_code, 401)
+        self.assertFalse(Cart.objects.filter(user_id=self.other.id).exists())
+
+    def test_mutations_write_through(self):
+        self.get()
+        response = self.client.post('/api/cart/add/', {'product_variant_id': self.polo.id, 'quantity': 2}, format='json')
+        self.assertEqual(response.json()['total_items'], 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get()['total_items'], 3)
+
+    def test_catalog_changes_invalidate_only_affected_carts(self):
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.other).access_token}')
+        self.get()
+        self.get(other_client)
+        CartItem.objects.filter(cart__user=self.other).update(product_variant=self.polo)
+        cart_cache.invalidate(self.other.id)
+        self.get(other_client)
+
+        product = self.shirt.product
+        product.price = '90.00'
+        product.save()
+        self.assertEqual(self.get()['items'][0]['product_price'], 90.0)
+        with self.assertNumQueries(0):
+            self.get(other_client)
+
+        bulk.apply_changes(bulk.select_products(ids=[self.polo.product_id]), discount_percent=50)
+        self.assertEqual(self.get(other_client)['total_price'], 50.0)
+
+    def test_file_based_backend(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        carts = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                                       'carts': carts}):
+            self.get()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get()['total_items'], 1)
+
+
+class CartCacheCheckTests(SimpleTestCase):
+    def test_process_local_cart_cache_is_an_error(self):
+        self.assertEqual(checks.check_cart_cache_is_shared(None), [])
+        for backend in ('locmem.LocMemCache', 'dummy.DummyCache'):
+            carts = {'BACKEND': f'django.core.cache.backends.{backend}'}
+            with self.subTest(backend=backend), override_settings(CACHES={'default': carts, 'carts': carts}):
+                self.assertEqual([error.id for error in checks.check_cart_cache_is_shared(None)], ['cart.E001'])
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        cart_cache.backend().clear()
+        category = Category.objects.create(name='Shirts')
+        self.variants = [make_variant(category, index, stock_quantity=5) for index in range(4)]
+        self.user = make_user()
+        self.cart = Cart.objects.create(user=self.user)
+        for variant in self.variants[:2]:
+            CartItem.objects.create(cart=self.cart, product_variant=variant, quantity=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, operations, client=None):
+        return (client or self.client).post('/api/cart/batch/', {'operations': operations}, format='json')
+
+    def test_operations_apply_in_one_transaction(self):
+        first, second, third, fourth = (variant.id for variant in self.variants)
+        operations = [
+            {'op': 'set', 'product_variant_id': first, 'quantity': 4},
+            {'op': 'remove', 'product_variant_id': second},
+            {'op': 'add', 'product_variant_id': third, 'quantity': 1},
+            {'op': 'add', 'product_variant_id': third, 'quantity': 2},
+            {'op': 'add', 'product_variant_id': fourth, 'quantity': 1},
+        ]
+        # Savepoint, locked variants, existing lines, INSERT, UPDATE, DELETE, release, then the cart
+        with self.assertNumQueries(10):
+            response = self.post(operations)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(self.cart.items.values_list('product_variant_id', 'quantity')),
+                         {first: 4, third: 3, fourth: 1})
+        self.assertEqual(response.json()['total_items'], 8)
+
+    def test_stock_failure_changes_nothing(self):
+        first, second = self.variants[0].id, self.variants[1].id
+        response = self.post([
+            {'op': 'remove', 'product_variant_id': first},
+            {'op': 'add', 'product_variant_id': second, 'quantity': 4},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertEqual(self.post([{'op': 'add', 'product_variant_id': 999, 'quantity': 1}]).status_code, 404)
+        self.assertEqual(self.post([{'op': 'set', 'product_variant_id': first}]).status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+
+    def test_guest_batch(self):
+        guest = APIClient()
+        response = self.post([{'op': 'add', 'product_variant_id': variant.id, 'quantity': 1} for variant in self.variants],
+                             client=guest)
+        self.assertEqual(response.json()['total_items'], 4)
+        token = response.json()['cart_token']
+        guest.credentials(HTTP_X_CART_TOKEN=token)
+        response = self.post([{'op': 'set', 'product_variant_id': self.variants[0].id, 'quantity': 0}], client=guest)
+        self.assertEqual(response.json()['total_items'], 3)
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        cart_cache.backend().clear()
+        category = Category.objects.create(name='Shirts')
+        self.full_price = make_variant(category, 1)
+        self.discounted = make_variant(category, 2, discount_price='80.00')
+        self.user = make_user()
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product_variant=self.full_price, quantity=2)
+        CartItem.objects.create(cart=self.cart, product_variant=self.discounted, quantity=3)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_totals_in_one_aggregate_query(self):
+        cart = Cart.objects.get(id=self.cart.id)
+        with self.assertNumQueries(1):
+            self.assertEqual((cart.total_items, cart.total_price), (5, Decimal('440.00')))
+        # Items prefetched for serialization are reused
+        prefetched = CartSerializer.setup_eager_loading(Cart.objects.filter(id=self.cart.id)).get()
+        with self.assertNumQueries(0):
+            self.assertEqual((prefetched.total_items, prefetched.total_price), (5, Decimal('440.00')))
+
+    def test_summary_endpoint(self):
+        # The token user's is_active flag, then one aggregate; the flag stays cached
+        with self.assertNumQueries(2):
+            self.client.get('/api/cart/summary/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.json(), {'total_items': 5, 'total_price': 440.0})
+
+        guest = APIClient()
+        token = guest.post('/api/cart/add/', {'product_variant_id': self.discounted.id, 'quantity': 2},
+                           format='json').json()['cart_token']
+        with self.assertNumQueries(1):
+            response = guest.get('/api/cart/summary/', HTTP_X_CART_TOKEN=token)
+        self.assertEqual(response.json(), {'total_items': 2, 'total_price': 160.0})
+        with self.assertNumQueries(0):
+            self.assertEqual(APIClient().get('/api/cart/summary/').json()['total_items'], 0)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        cart_cache.backend().clear()
+        self.variant = make_variant(Category.objects.create(name='Shirts'), 1, stock_quantity=5)
+        self.user = make_user()
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product_variant=self.variant, quantity=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.other = Cart.objects.create(user=make_user('rival'))
+        CartItem.objects.create(cart=self.other, product_variant=self.variant, quantity=3)
+
+    def test_holds_count_against_other_carts_until_they_expire(self):
+        response = self.client.post('/api/cart/reserve/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('expires_at', response.json())
+        self.assertEqual(reservations.available_stock([self.variant.id]), {self.variant.id: 2})
+        self.assertEqual(reservations.available_stock([self.variant.id], exclude_cart_id=self.cart.id), {self.variant.id: 5})
+
+        with self.assertRaises(reservations.InsufficientStock) as raised:
+            reservations.reserve(self.other)
+        self.assertEqual(raised.exception.shortages, {self.variant.id: 2})
+        self.assertFalse(StockReservation.objects.filter(cart=self.other).exists())
+
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        reservations.reserve(self.other)
+        self.assertEqual(reservations.available_stock([self.variant.id]), {self.variant.id: 2})
+
+    def test_reserving_again_replaces_holds_and_delete_releases(self):
+        reservations.reserve(self.cart)
+        self.cart.items.update(quantity=1)
+        reservations.reserve(self.cart)
+        self.assertEqual(list(StockReservation.objects.values_list('quantity', flat=True)), [1])
+
+        self.cart.items.update(quantity=5)
+        reservations.reserve(self.other)
+        response = self.client.post('/api/cart/reserve/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['available'], {str(self.variant.id): 2})
+
+        self.assertEqual(self.client.delete('/api/cart/reserve/').json(), {'released': 1})
+        self.assertEqual(StockReservation.objects.filter(cart=self.cart).count(), 0)
+
+    def test_sweeper_deletes_expired_holds_in_batches(self):
+        expired = timezone.now() - timedelta(minutes=1)
+        for number in range(5):
+            cart = Cart.objects.create(user=make_user(f'sweep{number}'))
+            StockReservation.objects.create(cart=cart, product_variant=self.variant, quantity=1, expires_at=expired)
+        reservations.reserve(self.cart)
+
+        self.assertEqual(reservations.release_expired(batch_size=2), 5)
+        self.assertEqual(list(StockReservation.objects.values_list('cart_id', flat=True)), [self.cart.id])
+        call_command('release_expired_reservations', stdout=open(os.devnull, 'w'))
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_order_respects_other_holds_and_releases_its_own(self):
+        address = UserAddress.objects.create(
+            user=self.user, label='Home', full_name='Shopper', phone='9999999999', address_line1='1 Main Street',
+            city='Pune', state='MH', postal_code='411001'
+        )
+        # CreateOrderSerializer requires the shipping fields even with a saved address
+        order = {
+            'use_saved_address': True, 'saved_address_id': address.id, 'payment_method': 'cod',
+            'shipping_name': 'Shopper', 'shipping_email': 'shopper@example.com', 'shipping_phone': '9999999999',
+            'shipping_address_line1': '1 Main Street', 'shipping_city': 'Pune', 'shipping_state': 'MH',
+            'shipping_postal_code': '411001',
+        }
+        reservations.reserve(self.other)
+        response = self.client.post('/api/orders/create/', order, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Shirt 1', response.json()['error'])
+
+        StockReservation.objects.all().delete()
+        reservations.reserve(self.cart)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/create/', order, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock_quantity, 2)
+        self.assertFalse(StockReservation.objects.exists())
@@ -1,54 +1,65 @@
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.db import IntegrityError, transaction
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from .models import Cart, CartItem, DiscountCode
+from . import batch, cart_cache, reservations
+from .authentication import CachedActiveUserJWTAuthentication
+from .guest import GuestCart, request_token
+from .models import Cart, CartItem, DiscountCode, cart_totals
 from products.models import ProductVariant
 from .serializers import (
     CartSerializer, AddToCartSerializer, UpdateCartItemSerializer,
-    DiscountCodeSerializer, ApplyDiscountSerializer
+    DiscountCodeSerializer, ApplyDiscountSerializer, CartBatchSerializer
 )
 import logging
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-def validate_user_exists(user):
+def load_cart(cart_id):
     """
-    Validate that the user actually exists in the database
+    Cart with everything CartSerializer needs, in two queries
     """
-    try:
-        User.objects.get(id=user.id)
-        return True
-    except User.DoesNotExist:
-        logger.error(f"User with ID {user.id} does not exist in database")
-        return False
-    except Exception as e:
-        logger.error(f"Error validating user {user.id}: {str(e)}")
-        return False
+    return CartSerializer.setup_eager_loading(Cart.objects.filter(id=cart_id)).get()
+
+def cart_response(request, cart_id, status_code=status.HTTP_200_OK):
+    """
+    Cart payload after a committed change, written through to the cart cache
+    """
+    return cart_cache.cached_cart_response(
+        request, lambda: CartSerializer(load_cart(cart_id), context={'request': request}).data, status_code
+    )
+
+def guest_cart_response(request, guest, status_code=status.HTTP_200_OK):
+    """
+    Serialized guest cart plus the token the client must send back
+    """
+    data = CartSerializer(guest, context={'request': request}).data
+    data['cart_token'] = guest.token
+    return Response(data, status=status_code)
 
-def get_or_create_user_cart(user):
+def get_or_create_user_cart(user, with_items=False):
     """
-    Safely get or create cart for user with comprehensive error handling
+    Safely get or create cart for user with comprehensive error handling.
+    With with_items the cart comes ready for CartSerializer.
     """
     try:
-        # Validate user exists first
-        if not validate_user_exists(user):
-            raise ValueError(f"User with ID {user.id} does not exist")
-        
-        # Try to get existing cart first
-        cart = Cart.objects.filter(user=user).first()
+        # Try to get existing cart first; by id, as user may be a stateless token user
+        carts = Cart.objects.filter(user_id=user.id)
+        if with_items:
+            carts = CartSerializer.setup_eager_loading(carts)
+        cart = carts.first()
         if cart:
             logger.info(f"Retrieved existing cart {cart.id} for user {user.id}")
             return cart, False
         
         # Create new cart with atomic transaction
         with transaction.atomic():
-            cart = Cart.objects.create(user=user)
+            cart = Cart.objects.create(user_id=user.id)
             logger.info(f"Created new cart {cart.id} for user {user.id}")
             return cart, True
             
@@ -56,7 +67,7 @@ def get_or_create_user_cart(user):
         logger.error(f"IntegrityError creating cart for user {user.id}: {str(e)}")
         
         # Try to get the cart again in case it was created by another process
-        cart = Cart.objects.filter(user=user).first()
+        cart = Cart.objects.filter(user_id=user.id).first()
         if cart:
             logger.info(f"Retrieved cart {cart.id} after IntegrityError for user {user.id}")
             return cart, False
@@ -73,28 +84,25 @@ def get_or_create_user_cart(user):
         raise ValueError("Unexpected error occurred while managing cart")
 
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
+# Checks the token's user against a cached is_active flag, so a cache hit touches no table
+@authentication_classes([CachedActiveUserJWTAuthentication])
+@permission_classes([AllowAny])
 def get_cart_view(request):
     """
-    Get user's cart with improved error handling
+    Get user's cart (or the guest cart for anonymous shoppers) with improved error handling
     """
     try:
-        # Validate user authentication
-        if not request.user or not request.user.is_authenticated:
-            return Response(
-                {'error': 'Authentication required'}, 
-                status=status.HTTP_401_UNAUTHORIZED
-            )
+        if not request.user.is_authenticated:
+            return guest_cart_response(request, GuestCart.load(request_token(request)))
         
-        logger.info(f"Getting cart for user {request.user.id}")
-        cart, created = get_or_create_user_cart(request.user)
+        def build():
+            logger.info(f"Loading cart for user {request.user.id}")
+            cart, created = get_or_create_user_cart(request.user, with_items=True)
+            if created:
+                logger.info(f"New cart created for user {request.user.id}")
+            return CartSerializer(cart, context={'request': request}).data
         
-        serializer = CartSerializer(cart, context={'request': request})
-        
-        if created:
-            logger.info(f"New cart created for user {request.user.id}")
-        
-        return Response(serializer.data)
+        return cart_cache.cached_cart_response(request, build)
         
     except ValueError as e:
         logger.error(f"ValueError in get_cart_view for user {request.user.id}: {str(e)}")
@@ -110,8 +118,29 @@ def get_cart_view(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@authentication_classes([CachedActiveUserJWTAuthentication])
+@permission_classes([AllowAny])
+def cart_summary_view(request):
+    """
+    Item count and total for the navbar badge, in at most one query
+    """
+    try:
+        if not request.user.is_authenticated:
+            summary = GuestCart.load(request_token(request)).summary()
+        else:
+            summary = cart_totals(CartItem.objects.filter(cart__user_id=request.user.id))
+        return Response(summary)
+        
+    except Exception as e:
+        logger.error(f"Error loading cart summary for user {request.user.id}: {str(e)}")
+        return Response(
+            {'error': 'Failed to retrieve cart summary'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([AllowAny])
 def add_to_cart_view(request):
     """
     Add item to cart with comprehensive error handling
@@ -126,13 +155,6 @@ def add_to_cart_view(request):
     quantity = serializer.validated_data['quantity']
     
     try:
-        # Validate user authentication
-        if not request.user or not request.user.is_authenticated:
-            return Response(
-                {'error': 'Authentication required'}, 
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-        
         logger.info(f"Add to cart - User: {request.user.id}, Variant: {product_variant_id}, Qty: {quantity}")
         
         # Get product variant with error handling
@@ -153,6 +175,23 @@ def add_to_cart_view(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if not request.user.is_authenticated:
+            guest = GuestCart.load(request_token(request))
+            if guest.is_full_for(product_variant.id):
+                return Response(
+                    {'error': 'Your cart is full. Please login to add more items.'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            new_quantity = guest.quantities.get(product_variant.id, 0) + quantity
+            if product_variant.stock_quantity < new_quantity:
+                return Response(
+                    {'error': f'Only {product_variant.stock_quantity} items available in stock'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            guest.quantities[product_variant.id] = new_quantity
+            guest.save()
+            return guest_cart_response(request, guest, status.HTTP_201_CREATED)
+        
         # Get or create cart with comprehensive error handling
         try:
             cart, cart_created = get_or_create_user_cart(request.user)
@@ -184,10 +223,10 @@ def add_to_cart_view(request):
                 logger.info(f"Updated cart item {cart_item.id} - New quantity: {cart_item.quantity}")
             else:
                 logger.info(f"Created new cart item {cart_item.id}")
+            cart_cache.invalidate_on_commit(request.user.id)
         
         # Return updated cart
-        cart_serializer = CartSerializer(cart, context={'request': request})
-        return Response(cart_serializer.data, status=status.HTTP_201_CREATED)
+        return cart_response(request, cart.id, status.HTTP_201_CREATED)
         
     except IntegrityError as e:
         logger.error(f"IntegrityError in add_to_cart_view for user {request.user.id}: {str(e)}")
@@ -203,12 +242,41 @@ def add_to_cart_view(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+def update_guest_cart_item(request, variant_id):
+    """
+    Update a guest cart line; guest cart items are keyed by variant id
+    """
+    guest = GuestCart.load(request_token(request))
+    if variant_id not in guest.quantities:
+        return Response(
+            {'error': 'Cart item not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    serializer = UpdateCartItemSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    quantity = serializer.validated_data['quantity']
+    stock_quantity = ProductVariant.objects.filter(id=variant_id).values_list('stock_quantity', flat=True).first() or 0
+    if stock_quantity < quantity:
+        return Response(
+            {'error': f'Only {stock_quantity} items available in stock'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    guest.quantities[variant_id] = quantity
+    guest.save()
+    return guest_cart_response(request, guest)
+
 @api_view(['PUT'])
-@permission_classes([IsAuthenticated])
+@permission_classes([AllowAny])
 def update_cart_item_view(request, item_id):
     """
     Update cart item quantity with error handling
     """
+    if not request.user.is_authenticated:
+        return update_guest_cart_item(request, item_id)
+
     try:
         cart_item = CartItem.objects.select_related('product_variant', 'cart').get(
             id=item_id, 
@@ -231,27 +299,24 @@ def update_cart_item_view(request, item_id):
         with transaction.atomic():
             if quantity <= 0:
                 # Remove the item if quantity is 0 or negative
-                cart = cart_item.cart
                 cart_item.delete()
                 logger.info(f"Removed cart item {item_id} for user {request.user.id}")
+            else:
+                # Check stock availability
+                if cart_item.product_variant.stock_quantity < quantity:
+                    return Response(
+                        {'error': f'Only {cart_item.product_variant.stock_quantity} items available in stock'}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
                 
-                cart_serializer = CartSerializer(cart, context={'request': request})
-                return Response(cart_serializer.data)
-            
-            # Check stock availability
-            if cart_item.product_variant.stock_quantity < quantity:
-                return Response(
-                    {'error': f'Only {cart_item.product_variant.stock_quantity} items available in stock'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Update quantity
-            cart_item.quantity = quantity
-            cart_item.save()
-            logger.info(f"Updated cart item {item_id} quantity to {quantity} for user {request.user.id}")
-            
-            cart_serializer = CartSerializer(cart_item.cart, context={'request': request})
-            return Response(cart_serializer.data)
+                # Update quantity
+                cart_item.quantity = quantity
+                cart_item.save()
+                logger.info(f"Updated cart item {item_id} quantity to {quantity} for user {request.user.id}")
+            cart_cache.invalidate_on_commit(request.user.id)
+        
+        # Serialized after commit so the cached copy matches the database
+        return cart_response(request, cart_item.cart_id)
             
     except Exception as e:
         logger.error(f"Error updating cart item {item_id} for user {request.user.id}: {str(e)}")
@@ -261,11 +326,22 @@ def update_cart_item_view(request, item_id):
         )
 
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([AllowAny])
 def remove_from_cart_view(request, item_id):
     """
     Remove item from cart with error handling
     """
+    if not request.user.is_authenticated:
+        # Guest cart items are keyed by variant id
+        guest = GuestCart.load(request_token(request))
+        if guest.quantities.pop(item_id, None) is None:
+            return Response(
+                {'error': 'Cart item not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        guest.save()
+        return guest_cart_response(request, guest)
+
     try:
         with transaction.atomic():
             cart_item = CartItem.objects.select_related('cart').get(
@@ -274,11 +350,11 @@ def remove_from_cart_view(request, item_id):
             )
             cart = cart_item.cart
             cart_item.delete()
+            cart_cache.invalidate_on_commit(request.user.id)
             
             logger.info(f"Removed cart item {item_id} for user {request.user.id}")
-            
-            cart_serializer = CartSerializer(cart, context={'request': request})
-            return Response(cart_serializer.data)
+        
+        return cart_response(request, cart.id)
             
     except CartItem.DoesNotExist:
         logger.error(f"Cart item {item_id} not found for user {request.user.id}")
@@ -293,22 +369,104 @@ def remove_from_cart_view(request, item_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-@api_view(['DELETE'])
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def batch_cart_view(request):
+    """
+    Apply a list of add / set / remove operations (by variant id) in one
+    transaction and return the cart once
+    """
+    serializer = CartBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    operations = serializer.validated_data['operations']
+    
+    try:
+        if not request.user.is_authenticated:
+            guest = GuestCart.load(request_token(request))
+            batch.apply_guest_operations(guest, operations)
+            return guest_cart_response(request, guest)
+        
+        cart, cart_created = get_or_create_user_cart(request.user)
+        summary = batch.apply_operations(cart, operations)
+        logger.info(f"Applied {len(operations)} cart operations for user {request.user.id}: {summary}")
+        return cart_response(request, cart.id)
+        
+    except batch.BatchError as e:
+        return Response({'error': str(e)}, status=e.status_code)
+    
+    except ValueError as e:
+        logger.error(f"Cart access failed for user {request.user.id}: {str(e)}")
+        return Response(
+            {'error': 'Unable to access your cart. Please logout and login again.'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    except Exception as e:
+        logger.error(f"Error applying cart operations for user {request.user.id}: {str(e)}")
+        return Response(
+            {'error': 'Failed to update cart'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['POST', 'DELETE'])
 @permission_classes([IsAuthenticated])
+def checkout_reservation_view(request):
+    """
+    POST holds the cart's quantities for checkout until the returned
+    expires_at; DELETE releases them
+    """
+    try:
+        cart = Cart.objects.get(user=request.user)
+    except Cart.DoesNotExist:
+        return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.method == 'DELETE':
+        released = reservations.release(cart)
+        return Response({'released': released})
+
+    try:
+        expires_at = reservations.reserve(cart)
+        logger.info(f"Reserved stock for cart {cart.id} until {expires_at}")
+        return Response({'expires_at': expires_at})
+
+    except reservations.InsufficientStock as e:
+        return Response(
+            {
+                'error': 'Some items are no longer available in the requested quantity',
+                'available': {str(variant_id): available for variant_id, available in e.shortages.items()},
+            },
+            status=status.HTTP_409_CONFLICT
+        )
+
+    except Exception as e:
+        logger.error(f"Error reserving stock for user {request.user.id}: {str(e)}")
+        return Response(
+            {'error': 'Failed to reserve stock'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['DELETE'])
+@permission_classes([AllowAny])
 def clear_cart_view(request):
     """
     Clear all items from cart with error handling
     """
+    if not request.user.is_authenticated:
+        guest = GuestCart.load(request_token(request))
+        guest.delete()
+        return guest_cart_response(request, guest)
+
     try:
         with transaction.atomic():
             cart = Cart.objects.get(user=request.user)
-            items_count = cart.items.count()
-            cart.items.all().delete()
+            items_count, _ = cart.items.all().delete()
+            cart_cache.invalidate_on_commit(request.user.id)
             
             logger.info(f"Cleared {items_count} items from cart for user {request.user.id}")
-            
-            cart_serializer = CartSerializer(cart, context={'request': request})
-            return Response(cart_serializer.data)
+        
+        return cart_response(request, cart.id)
             
     except Cart.DoesNotExist:
         logger.info(f"No cart found for user {request.user.id} - returning empty cart message")
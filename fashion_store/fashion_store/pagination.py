@@ -0,0 +1,193 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over the queryset's own ordering.
+
+    The cursor stores the ordering values of the last row served, so every
+    page is a range scan on the ordering index whatever the depth. The primary
+    key is appended as a tiebreaker to keep the order total. Querysets ordered
+    by an expression (e.g. search relevance) fall back to an offset cursor.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'with_count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('true', '1'):
+            self.count = queryset.count()
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor.get('r'))
+
+        if self.ordering is None:
+            return self.paginate_by_offset(queryset, cursor)
+
+        order_by = [self.reversed_field(field) if reverse else field for field in self.ordering]
+        queryset = queryset.order_by(*order_by)
+        if cursor:
+            queryset = queryset.filter(self.seek_filter(queryset.model, order_by, cursor.get('v')))
+
+        # One extra row tells us whether there is another page in this direction
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_position = self.position(rows[-1]) if rows and (has_more or reverse) else None
+        self.previous_position = self.position(rows[0]) if rows and (cursor and (not reverse or has_more)) else None
+        self.next_offset = self.previous_offset = None
+        return rows
+
+    def paginate_by_offset(self, queryset, cursor):
+        offset = cursor.get('o', 0) if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.next_position = self.previous_position = None
+        self.next_offset = offset + self.page_size if has_more else None
+        self.previous_offset = max(offset - self.page_size, 0) if offset else None
+        return rows[:self.page_size]
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return payload
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset):
+        query = queryset.query
+        ordering = list(query.order_by or (queryset.model._meta.ordering if query.default_ordering else []))
+        if not all(isinstance(field, str) and field.lstrip('-') != '?' for field in ordering):
+            return None
+        ordering = [self.normalize_field(queryset.model, field) for field in ordering]
+        if not any(field.lstrip('-') == 'pk' for field in ordering):
+            direction = '-' if ordering and ordering[-1].startswith('-') else ''
+            ordering.append(f'{direction}pk')
+        return ordering
+
+    @staticmethod
+    def normalize_field(model, field):
+        name = field.lstrip('-')
+        if name == model._meta.pk.name:
+            return field.replace(name, 'pk')
+        return field
+
+    @staticmethod
+    def reversed_field(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def position(self, instance):
+        values = []
+        for field in self.ordering:
+            value = instance
+            for part in field.lstrip('-').split('__'):
+                value = getattr(value, part)
+            values.append(None if value is None else str(value))
+        return values
+
+    def seek_filter(self, model, order_by, values):
+        """
+        (a, b, pk) > (x, y, z) expanded into OR-ed prefixes so each branch can
+        use the ordering index
+        """
+        if not isinstance(values, list) or len(values) != len(order_by):
+            raise NotFound(self.invalid_cursor_message)
+        values = [self.to_python(model, field, value) for field, value in zip(order_by, values)]
+        condition = Q()
+        equal = Q()
+        for field, value in zip(order_by, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def to_python(self, model, field, value):
+        name = field.lstrip('-')
+        try:
+            current = model
+            for part in name.split('__'):
+                target = current._meta.pk if part == 'pk' else current._meta.get_field(part)
+                if target.is_relation:
+                    current = target.related_model
+            return target.to_python(value)
+        except (FieldDoesNotExist, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(encoded + padding).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(cursor, dict):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, cursor):
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii').rstrip('='))
+
+    def get_next_link(self):
+        if self.next_position is not None:
+            return self.encode_cursor({'v': self.next_position})
+        if self.next_offset is not None:
+            return self.encode_cursor({'o': self.next_offset})
+        return None
+
+    def get_previous_link(self):
+        if self.previous_position is not None:
+            return self.encode_cursor({'v': self.previous_position, 'r': 1})
+        if self.previous_offset is not None:
+            if self.previous_offset == 0:
+                return remove_query_param(self.base_url, self.cursor_query_param)
+            return self.encode_cursor({'o': self.previous_offset})
+        return None
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -62,6 +64,8 @@ MIDDLEWARE = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True 
+# Guest carts are identified by this header (see cart/guest.py)
+CORS_ALLOW_HEADERS = (*default_headers, 'x-cart-token')
 
 ROOT_URLCONF = 'fashion_store.urls'
 
@@ -98,6 +102,26 @@ DATABASES = {
 }
 
 
+# Cache
+# Catalog response caching and index versioning live here. Point this at a
+# shared backend (Redis/Memcached) when running more than one process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fashion-store',
+    },
+    # Rendered user carts and guest carts (see cart/cart_cache.py). Every
+    # worker process must see the same entries (see cart/checks.py): Redis or
+    # Memcached across hosts, the file-based cache on a single host
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cart_cache',
+    },
+}
+CART_CACHE_ALIAS = 'carts'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -137,6 +161,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'fashion_store.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
 
 SIMPLE_JWT = {
@@ -163,6 +189,39 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Product image renditions (see products/images.py)
+IMAGE_RENDITIONS_ASYNC = True
+IMAGE_PROCESSING_WORKERS = 2
+
+# On-demand resized images (see products/image_cache.py)
+IMAGE_CACHE_DIR = BASE_DIR / 'image_cache'
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Product search index (see products/search.py)
+SEARCH_INDEX_PATH = BASE_DIR / 'search_index.pkl'
+SEARCH_MAX_RESULTS = 1000
+
+# Stale facet and autocomplete indexes are served while a thread rebuilds them (see products/rebuilds.py)
+INDEX_REBUILD_IN_BACKGROUND = True
+
+# Points SEARCH_INDEX_PATH and the cart cache at temporary files and rebuilds indexes inline
+# for the test run
+# (see fashion_store/test_runner.py)
+TEST_RUNNER = 'fashion_store.test_runner.TestRunner'
+
+# Trending scores (see products/trending.py)
+TRENDING_HALF_LIFE_HOURS = 72
+TRENDING_REVIEW_WEIGHT = 0.5
+# How far each run looks back past the previous one for late-committing orders and reviews
+TRENDING_OVERLAP_SECONDS = 15 * 60
+
+# Anonymous carts kept in the cache (see cart/guest.py)
+GUEST_CART_TIMEOUT = 7 * 24 * 60 * 60
+GUEST_CART_MAX_ITEMS = 50
+
+# Checkout stock holds, swept by release_expired_reservations (see cart/reservations.py)
+STOCK_RESERVATION_TTL = 10 * 60
+
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
@@ -0,0 +1,32 @@
+"""
+Test runner that keeps the suite away from files a dev server reads and
+rebuilds in-process indexes inline.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # get_index() saves a snapshot whenever it builds one; keep it out of BASE_DIR
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            SEARCH_INDEX_PATH=os.path.join(self.tmp_dir.name, 'search_index.pkl'),
+            CACHES={**settings.CACHES, settings.CART_CACHE_ALIAS: {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': os.path.join(self.tmp_dir.name, 'cart_cache'),
+            }},
+            # A rebuild thread cannot see data inside a test's transaction
+            INDEX_REBUILD_IN_BACKGROUND=False,
+        )
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,134 @@
+"""
+Turning a cart into an order in a fixed number of statements.
+
+The cart's variants are locked in id order, so concurrent orders and checkout
+holds on the same SKUs queue instead of deadlocking, and checked against stock
+less other carts' holds. Stock then comes off in one conditional UPDATE that
+only matches variants still holding enough units; if it matches fewer rows
+than the cart has lines the whole order rolls back. Order items go in with one
+bulk_create and the discount code's use count is bumped by an F() update that
+cannot pass max_uses. Queryset writes skip model signals, so the caches those
+signals would have invalidated are invalidated here on commit.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Now
+
+from cart import cart_cache, reservations
+from cart.models import DiscountCode
+from products import facets
+from products.models import Product, ProductVariant
+from products.signals import products_bulk_updated
+from .models import Order, OrderItem, OrderTracking
+
+FREE_SHIPPING_FROM = Decimal('500.00')
+SHIPPING_COST = Decimal('50.00')
+TAX_RATE = Decimal('0.18')  # 18% GST
+
+
+class OrderError(ValueError):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def decrement_stock(quantities):
+    """
+    Take {variant id: units} off stock in one UPDATE and return how many
+    variants had enough; the rest are left untouched
+    """
+    enough = Q()
+    for variant_id, quantity in quantities.items():
+        enough |= Q(id=variant_id, stock_quantity__gte=quantity)
+    units = Case(
+        *[When(id=variant_id, then=Value(quantity)) for variant_id, quantity in quantities.items()],
+        output_field=IntegerField()
+    )
+    # Queryset updates skip auto_now
+    return ProductVariant.objects.filter(enough).update(stock_quantity=F('stock_quantity') - units, updated_at=Now())
+
+
+def redeem_discount(code, subtotal):
+    """
+    (discount code, amount) for a code that applies to subtotal, counting
+    the use; (None, 0) when it does not apply or its last use was just taken
+    """
+    discount_code = DiscountCode.objects.filter(code=code).first() if code else None
+    if discount_code is None or not discount_code.is_valid or subtotal < discount_code.min_order_amount:
+        return None, Decimal('0.00')
+    claimed = DiscountCode.objects.filter(
+        Q(max_uses__isnull=True) | Q(used_count__lt=F('max_uses')), id=discount_code.id
+    ).update(used_count=F('used_count') + 1)
+    if not claimed:
+        return None, Decimal('0.00')
+    return discount_code, discount_code.calculate_discount(subtotal)
+
+
+def place_order(user, cart, shipping_data, payment_method, discount_code=None):
+    """
+    Create the order for everything in cart, take it off stock and empty
+    the cart. Raises OrderError and changes nothing if stock is short.
+    """
+    with transaction.atomic():
+        items = list(cart.items.select_related('product_variant__product').order_by('id'))
+        if not items:
+            raise OrderError('Cart is empty')
+        quantities = {item.product_variant_id: item.quantity for item in items}
+
+        # Lock in id order so concurrent orders cannot deadlock
+        stock = dict(
+            ProductVariant.objects.select_for_update().filter(id__in=list(quantities))
+            .order_by('id').values_list('id', 'stock_quantity')
+        )
+        try:
+            reservations.check(quantities, reservations.unheld(stock, exclude_cart_id=cart.id))
+        except reservations.InsufficientStock as e:
+            names = [item.product_variant.product.name for item in items if item.product_variant_id in e.shortages]
+            raise OrderError(f'Insufficient stock for {", ".join(names)}')
+        if decrement_stock(quantities) != len(quantities):
+            # Only reachable where the lock above is a no-op; undo the partial update
+            raise OrderError('Insufficient stock for some items, please try again', status_code=409)
+
+        subtotal = sum((item.subtotal for item in items), Decimal('0.00'))
+        shipping_cost = SHIPPING_COST if subtotal < FREE_SHIPPING_FROM else Decimal('0.00')
+        tax_amount = subtotal * TAX_RATE
+        discount_code_obj, discount_amount = redeem_discount(discount_code, subtotal)
+
+        order = Order.objects.create(
+            user=user,
+            subtotal=subtotal,
+            discount_code=discount_code_obj,
+            discount_amount=discount_amount,
+            shipping_cost=shipping_cost,
+            tax_amount=tax_amount,
+            total_amount=subtotal + shipping_cost + tax_amount - discount_amount,
+            payment_method=payment_method,
+            **shipping_data
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_variant=item.product_variant,
+                quantity=item.quantity,
+                price=item.product_variant.product.current_price
+            )
+            for item in items
+        ])
+        OrderTracking.objects.create(order=order, status='pending', message='Order placed successfully')
+
+        # Only the ordered lines; anything added meanwhile stays in the cart
+        cart.items.filter(id__in=[item.id for item in items]).delete()
+        reservations.release(cart)
+
+        user_id = user.id
+        sold_out = {
+            item.product_variant.product_id for item in items if stock[item.product_variant_id] == item.quantity
+        }
+        transaction.on_commit(lambda: cart_cache.invalidate(user_id))
+        if sold_out:
+            # In-stock facets and other carts' availability change only at zero
+            transaction.on_commit(facets.invalidate)
+            transaction.on_commit(lambda: products_bulk_updated.send(sender=Product, product_ids=list(sold_out)))
+    return order
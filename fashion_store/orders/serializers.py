@@ -1,5 +1,7 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Order, OrderItem, OrderTracking
+from products.models import ProductImage
 from products.serializers import ProductListSerializer
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -38,6 +40,20 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         model = Order
         fields = '__all__'
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load the order payload in a fixed number of queries, whatever its size
+        """
+        items = OrderItem.objects.select_related('product_variant__product__category').prefetch_related(
+            Prefetch(
+                'product_variant__product__images',
+                queryset=ProductImage.objects.order_by('-is_primary', 'id'),
+                to_attr='ordered_images'
+            )
+        )
+        return queryset.prefetch_related(Prefetch('items', queryset=items), 'tracking_updates')
+
 class CreateOrderSerializer(serializers.ModelSerializer):
     use_saved_address = serializers.BooleanField(required=False, default=False)
     saved_address_id = serializers.IntegerField(required=False, allow_null=True)
@@ -1,3 +1,140 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cart.models import Cart, CartItem, DiscountCode
+from products.models import Category, Product, ProductVariant
+from .models import Order, OrderItem
+from .placement import OrderError, decrement_stock, place_order
+
+User = get_user_model()
+
+SHIPPING = {
+    'shipping_name': 'Shopper', 'shipping_email': 'shopper@example.com', 'shipping_phone': '9999999999',
+    'shipping_address_line1': '1 Main Street', 'shipping_city': 'Pune', 'shipping_state': 'MH',
+    'shipping_postal_code': '411001',
+}
+
+
+def make_user(username='shopper'):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345')
+
+
+def make_variant(category, index, stock_quantity=10):
+    product = Product.objects.create(
+        name=f'Jacket {index}', description='A denim jacket', category=category,
+        price='100.00', gender='women', brand='Acme'
+    )
+    return ProductVariant.objects.create(
+        product=product, size='S', color='Indigo', stock_quantity=stock_quantity, sku=f'ORDER{index}'
+    )
+
+
+class OrderPlacementTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Jackets')
+        self.user = make_user()
+        self.cart = Cart.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill(self, count, start=0):
+        variants = [make_variant(self.category, index) for index in range(start, start + count)]
+        for variant in variants:
+            CartItem.objects.create(cart=self.cart, product_variant=variant, quantity=2)
+        return variants
+
+    def order(self, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/orders/create/', {**SHIPPING, 'payment_method': 'cod', **extra}, format='json')
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.fill(2)
+        with self.assertNumQueries(17):
+            self.assertEqual(self.order().status_code, 201)
+        self.fill(8, start=2)
+        with self.assertNumQueries(17):
+            response = self.order()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.json()['subtotal']), Decimal('1600.00'))
+        self.assertEqual(OrderItem.objects.filter(order_id=response.json()['id']).count(), 8)
+        self.assertEqual(set(ProductVariant.objects.values_list('stock_quantity', flat=True)), {8})
+        self.assertFalse(self.cart.items.exists())
+
+    def test_short_stock_changes_nothing(self):
+        plenty, scarce = self.fill(2)
+        ProductVariant.objects.filter(id=scarce.id).update(stock_quantity=1)
+        response = self.order()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Insufficient stock for Jacket 1')
+        plenty.refresh_from_db()
+        self.assertEqual(plenty.stock_quantity, 10)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_conditional_decrement_skips_short_variants(self):
+        plenty, scarce = self.fill(2)
+        self.assertEqual(decrement_stock({plenty.id: 3, scarce.id: 11}), 1)
+        self.assertEqual(
+            dict(ProductVariant.objects.values_list('id', 'stock_quantity')), {plenty.id: 7, scarce.id: 10}
+        )
+
+    def test_discount_use_is_counted_up_to_max_uses(self):
+        self.fill(1)
+        now = timezone.now()
+        DiscountCode.objects.create(
+            code='ONCE', discount_percent='10.00', max_uses=1,
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1)
+        )
+        response = self.order(discount_code='ONCE')
+        self.assertEqual(Decimal(response.json()['discount_amount']), Decimal('20.00'))
+        self.assertEqual(DiscountCode.objects.get(code='ONCE').used_count, 1)
+
+        self.fill(1, start=1)
+        response = self.order(discount_code='ONCE')
+        self.assertEqual(Decimal(response.json()['discount_amount']), Decimal('0.00'))
+        self.assertEqual(DiscountCode.objects.get(code='ONCE').used_count, 1)
+
+
+class ConcurrentOrderTests(TransactionTestCase):
+    # Checkouts must queue on the variant's row lock, as on MySQL; SQLite
+    # refuses a second writer outright instead, which is not what this asserts
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_hot_sku_is_never_oversold(self):
+        stock, shoppers = 5, 12
+        variant = make_variant(Category.objects.create(name='Jackets'), 1, stock_quantity=stock)
+        carts = []
+        for number in range(shoppers):
+            cart = Cart.objects.create(user=make_user(f'shopper{number}'))
+            CartItem.objects.create(cart=cart, product_variant=variant, quantity=1)
+            carts.append(cart)
+
+        outcomes = []
+        start = threading.Barrier(shoppers)
+
+        def checkout(cart):
+            start.wait()
+            try:
+                place_order(cart.user, cart, SHIPPING, 'cod')
+                outcomes.append('placed')
+            except OrderError:
+                outcomes.append('sold out')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['placed'] * stock + ['sold out'] * (shoppers - stock))
+        variant.refresh_from_db()
+        self.assertEqual(variant.stock_quantity, 0)
+        self.assertEqual(OrderItem.objects.count(), stock)
@@ -3,10 +3,9 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db import transaction
-from decimal import Decimal
-from .models import Order, OrderItem, OrderTracking, UserAddress
-from cart.models import Cart, DiscountCode
+from .models import Order, OrderTracking, UserAddress
+from .placement import OrderError, place_order
+from cart.models import Cart
 from .serializers import (
     OrderListSerializer, OrderDetailSerializer, CreateOrderSerializer,
     UpdateOrderStatusSerializer
@@ -24,7 +23,7 @@ class OrderDetailView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return OrderDetailSerializer.setup_eager_loading(Order.objects.filter(user=self.request.user))
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -66,74 +65,19 @@ def create_order_view(request):
         validated_data = serializer.validated_data.copy()
         validated_data.pop('use_saved_address', None)
         validated_data.pop('saved_address_id', None)
+        validated_data.pop('payment_method', None)
         shipping_data = validated_data
     
-    # Check stock availability
-    for cart_item in cart.items.all():
-        if cart_item.product_variant.stock_quantity < cart_item.quantity:
-            return Response({
-                'error': f'Insufficient stock for {cart_item.product_variant.product.name}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-    
-    with transaction.atomic():
-        # Calculate totals
-        subtotal = cart.total_price
-        shipping_cost = Decimal('50.00') if subtotal < 500 else Decimal('0.00')  # Free shipping over 500
-        tax_amount = subtotal * Decimal('0.18')  # 18% GST
-        
-        # Apply discount if provided
-        discount_amount = Decimal('0.00')
-        discount_code_obj = None
-        discount_code = request.data.get('discount_code')
-        
-        if discount_code:
-            try:
-                discount_code_obj = DiscountCode.objects.get(code=discount_code)
-                if discount_code_obj.is_valid and subtotal >= discount_code_obj.min_order_amount:
-                    discount_amount = discount_code_obj.calculate_discount(subtotal)
-                    discount_code_obj.used_count += 1
-                    discount_code_obj.save()
-            except DiscountCode.DoesNotExist:
-                pass
-        
-        total_amount = subtotal + shipping_cost + tax_amount - discount_amount
-        
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            subtotal=subtotal,
-            discount_code=discount_code_obj,
-            discount_amount=discount_amount,
-            shipping_cost=shipping_cost,
-            tax_amount=tax_amount,
-            total_amount=total_amount,
-            payment_method=request.data.get('payment_method'),
-            **shipping_data
-        )
-        
-        # Create order items and update stock
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product_variant=cart_item.product_variant,
-                quantity=cart_item.quantity,
-                price=cart_item.product_variant.product.current_price
-            )
-            
-            # Update stock
-            cart_item.product_variant.stock_quantity -= cart_item.quantity
-            cart_item.product_variant.save()
-        
-        # Clear cart
-        cart.items.all().delete()
-        
-        # Create initial tracking update
-        OrderTracking.objects.create(
-            order=order,
-            status='pending',
-            message='Order placed successfully'
+    try:
+        order = place_order(
+            request.user, cart, shipping_data,
+            payment_method=serializer.validated_data.get('payment_method'),
+            discount_code=request.data.get('discount_code')
         )
+    except OrderError as e:
+        return Response({'error': str(e)}, status=e.status_code)
     
+    order = OrderDetailSerializer.setup_eager_loading(Order.objects.filter(id=order.id)).get()
     return Response(OrderDetailSerializer(order).data, status=status.HTTP_201_CREATED)
 
 # Admin Views
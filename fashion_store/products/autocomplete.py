@@ -0,0 +1,297 @@
+"""
+Search-as-you-type suggestions for products, brands and categories.
+
+Every suggestion is indexed under each word-start of its label ("oxford
+linen shirt", "linen shirt", "shirt") in one sorted list, so a prefix is a
+bisect plus a scan of the matching range. Results for short prefixes, whose
+ranges are long, are ranked once and memoised until an entry under them
+changes.
+
+Popularity is the product's trending score plus a little weight per review;
+brands and categories add up their products. The index lives in process
+memory. Product and category saves append to a change log in Django's cache
+(see products.change_log) and every worker replays new entries into its own
+index on the next request; bulk writes call invalidate() to force a rebuild
+instead, which runs off the request path (see products.rebuilds).
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from . import change_log
+from .catalog_cache import bump_version, get_version
+from .rebuilds import IndexHolder
+
+KINDS = ('product', 'brand', 'category')
+MIN_PREFIX = 2
+# Prefixes up to this length have their ranked results memoised
+MEMO_PREFIX = 3
+MAX_LIMIT = 10
+# Terms are cut to this length to bound memory; longer queries match on it
+MAX_TERM = 32
+REVIEW_WEIGHT = 0.1
+
+VERSION_CACHE_KEY = 'products:autocomplete:version'
+CHANGE_SEQ_KEY = 'products:autocomplete:seq'
+CHANGE_KEY = 'products:autocomplete:change:{}'
+CHANGE_TIMEOUT = 24 * 60 * 60
+# Past this many pending changes a rebuild is cheaper than replaying them
+MAX_REPLAY = 500
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+def terms(label):
+    words = normalize(label).split(' ')
+    return {' '.join(words[i:])[:MAX_TERM] for i in range(len(words)) if words[i]}
+
+
+def product_popularity(trending_score, review_count):
+    return (trending_score or 0.0) + REVIEW_WEIGHT * review_count
+
+
+class AutocompleteIndex:
+    def __init__(self, version=None, seq=0):
+        self.version = version
+        self.seq = seq  # last change log entry reflected in the index
+        self.synced_at = time.time()  # when every entry up to seq was in the log
+        self.keys = []  # sorted (term, kind, key)
+        self.entries = {}  # (kind, key) -> [label, popularity]
+        self.products = {}  # product id -> (brand, category id, popularity)
+        self.brand_counts = {}  # brand -> active products
+        self.memo = {}  # (kind, prefix) -> ranked (kind, key) list
+        self.lock = threading.RLock()
+
+    @classmethod
+    def build(cls, version=None, seq=0):
+        from .models import Category, Product
+
+        index = cls(version, seq)
+        categories = dict(Category.objects.filter(is_active=True).values_list('id', 'name'))
+        for category_id, name in categories.items():
+            index.entries[('category', category_id)] = [name, 0.0]
+
+        rows = Product.objects.filter(is_active=True).values_list(
+            'id', 'name', 'brand', 'category_id', 'review_count', 'trending__score'
+        )
+        for product_id, name, brand, category_id, review_count, score in rows.iterator(chunk_size=5000):
+            popularity = product_popularity(score, review_count)
+            index.entries[('product', product_id)] = [name, popularity]
+            index.add_contribution(product_id, brand, category_id, popularity)
+
+        index.keys = sorted(
+            (term, kind, key) for (kind, key), (label, popularity) in index.entries.items() for term in terms(label)
+        )
+        return index
+
+    def add_contribution(self, product_id, brand, category_id, popularity, index_new=False):
+        """
+        Add a product's share to its brand and category; a brand seen for the
+        first time gets an entry, with keys too when index_new is set
+        """
+        self.products[product_id] = (brand, category_id, popularity)
+        if brand:
+            self.brand_counts[brand] = self.brand_counts.get(brand, 0) + 1
+            entry = self.entries.get(('brand', brand))
+            if entry is not None:
+                entry[1] += popularity
+            elif index_new:
+                self.add_entry('brand', brand, brand, popularity)
+            else:
+                self.entries[('brand', brand)] = [brand, popularity]
+        category = self.entries.get(('category', category_id))
+        if category is not None:
+            category[1] += popularity
+
+    def remove_contribution(self, product_id):
+        """
+        Take a product's share out of its brand and category. Returns the
+        entries whose popularity or presence changed.
+        """
+        touched = []
+        brand, category_id, popularity = self.products.pop(product_id, (None, None, 0.0))
+        if brand:
+            self.brand_counts[brand] -= 1
+            if self.brand_counts[brand]:
+                self.entries[('brand', brand)][1] -= popularity
+                touched.append(('brand', brand))
+            else:
+                del self.brand_counts[brand]
+                self.remove_entry('brand', brand)
+        category = self.entries.get(('category', category_id))
+        if category is not None:
+            category[1] -= popularity
+            touched.append(('category', category_id))
+        return touched
+
+    def add_entry(self, kind, key, label, popularity):
+        self.entries[(kind, key)] = [label, popularity]
+        for term in terms(label):
+            insort(self.keys, (term, kind, key))
+        self.forget(kind, key)
+
+    def remove_entry(self, kind, key):
+        entry = self.entries.pop((kind, key), None)
+        if entry is None:
+            return
+        self.forget(kind, key, entry[0])
+        for term in terms(entry[0]):
+            position = bisect_left(self.keys, (term, kind, key))
+            if position < len(self.keys) and self.keys[position] == (term, kind, key):
+                del self.keys[position]
+
+    def forget(self, kind, key, label=None):
+        """
+        Drop memoised rankings that the entry appears in
+        """
+        label = label if label is not None else self.entries[(kind, key)][0]
+        for term in terms(label):
+            for length in range(MIN_PREFIX, MEMO_PREFIX + 1):
+                self.memo.pop((kind, term[:length]), None)
+
+    def update_product(self, product_id, row):
+        """
+        Apply a product's current row (None when deleted or inactive)
+        """
+        touched = self.remove_contribution(product_id)
+        self.remove_entry('product', product_id)
+        if row is not None:
+            name, brand, category_id, popularity = row
+            self.add_contribution(product_id, brand, category_id, popularity, index_new=True)
+            touched += [('brand', brand), ('category', category_id)]
+            self.add_entry('product', product_id, name, popularity)
+        for kind, key in touched:
+            if (kind, key) in self.entries:
+                self.forget(kind, key)
+
+    def update_category(self, category_id, name):
+        """
+        Apply a category's current name (None when deleted or inactive)
+        """
+        popularity = sum(
+            popularity for brand, product_category, popularity in self.products.values() if product_category == category_id
+        )
+        self.remove_entry('category', category_id)
+        if name is not None:
+            self.add_entry('category', category_id, name, popularity)
+
+    def ranked(self, kind, prefix, limit):
+        start = bisect_left(self.keys, (prefix,))
+        matches = set()
+        for position in range(start, len(self.keys)):
+            term, entry_kind, key = self.keys[position]
+            if not term.startswith(prefix):
+                break
+            if entry_kind == kind:
+                matches.add(key)
+        return heapq.nsmallest(
+            limit, matches,
+            key=lambda key: (-self.entries[(kind, key)][1], len(self.entries[(kind, key)][0]), self.entries[(kind, key)][0])
+        )
+
+    def suggest(self, query, limit=MAX_LIMIT):
+        prefix = normalize(query)[:MAX_TERM]
+        if len(prefix) < MIN_PREFIX:
+            return {kind: [] for kind in KINDS}
+        results = {}
+        with self.lock:
+            for kind in KINDS:
+                if len(prefix) <= MEMO_PREFIX:
+                    keys = self.memo.get((kind, prefix))
+                    if keys is None:
+                        keys = self.memo[(kind, prefix)] = self.ranked(kind, prefix, MAX_LIMIT)
+                else:
+                    keys = self.ranked(kind, prefix, limit)
+                results[kind] = [(key, self.entries[(kind, key)][0]) for key in keys[:limit]]
+        return results
+
+
+def product_rows(product_ids):
+    from .models import Product
+
+    rows = Product.objects.filter(id__in=product_ids, is_active=True).values_list(
+        'id', 'name', 'brand', 'category_id', 'review_count', 'trending__score'
+    )
+    return {
+        product_id: (name, brand, category_id, product_popularity(score, review_count))
+        for product_id, name, brand, category_id, review_count, score in rows
+    }
+
+
+def apply_changes(index, changes):
+    from .models import Category
+
+    product_ids = {key for kind, key in changes if kind == 'product'}
+    category_ids = {key for kind, key in changes if kind == 'category'}
+    rows = product_rows(product_ids) if product_ids else {}
+    names = dict(Category.objects.filter(id__in=category_ids, is_active=True).values_list('id', 'name')) if category_ids else {}
+    with index.lock:
+        # Categories first, so re-added products count towards them
+        for category_id in category_ids:
+            index.update_category(category_id, names.get(category_id))
+        for product_id in product_ids:
+            index.update_product(product_id, rows.get(product_id))
+
+
+def record_change(kind, key):
+    """
+    Append a product or category change to the shared log (call on commit)
+    """
+    seq = change_log.append(CHANGE_SEQ_KEY, CHANGE_KEY, (kind, key), CHANGE_TIMEOUT)
+    if seq is None:
+        # The change is not in the log, so no worker could replay it
+        invalidate()
+    return seq
+
+
+_holder = IndexHolder('autocomplete')
+
+
+def current_version():
+    return get_version(VERSION_CACHE_KEY)
+
+
+def invalidate():
+    bump_version(VERSION_CACHE_KEY)
+
+
+def build_index():
+    # Read first: changes committed while building are replayed again, harmlessly
+    version = current_version()
+    return AutocompleteIndex.build(version, change_log.head(CHANGE_SEQ_KEY))
+
+
+def catch_up(index, version, seq, now):
+    """
+    Replay the change log into index; False when it needs a rebuild instead
+    """
+    if index.version != version or seq < index.seq:
+        # Invalidated, or the log was reset (cache cleared)
+        return False
+    if seq > index.seq:
+        changes = change_log.replay(CHANGE_KEY, index.seq, seq, index.synced_at, CHANGE_TIMEOUT, MAX_REPLAY)
+        if changes is None:
+            # Too far behind, or log entries may have expired
+            return False
+        apply_changes(index, changes)
+        index.seq, index.synced_at = seq, now
+    return True
+
+
+def get_index():
+    now = time.time()
+    version = current_version()
+    seq = change_log.head(CHANGE_SEQ_KEY)
+    return _holder.get(lambda index: catch_up(index, version, seq, now), build_index)
+
+
+def suggest(query, limit=MAX_LIMIT):
+    return get_index().suggest(query, min(max(limit, 1), MAX_LIMIT))
@@ -0,0 +1,102 @@
+"""
+Set-based admin mutations over many products at once.
+
+Every operation is a single UPDATE over the selected products (or their
+variants, through a subquery), all inside one transaction, so no statement
+carries the selection as a list of ids whatever its size. Queryset updates
+bypass model signals, so the facet index, autocomplete index and catalog
+caches are invalidated once on commit, and products_bulk_updated tells other
+apps what changed.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Now, Round
+
+from . import autocomplete, catalog_cache, facets
+from .models import Product, ProductVariant
+from .signals import products_bulk_updated
+
+# Larger selections are announced as "possibly all" rather than by id
+MAX_SIGNALLED_IDS = 1000
+
+
+def select_products(ids=None, filters=None):
+    """
+    Products by explicit ids or by catalog filters
+    """
+    products = Product.objects.all()
+    if ids is not None:
+        return products.filter(id__in=ids)
+    filters = filters or {}
+    if 'category' in filters:
+        products = products.filter(category_id=filters['category'])
+    for field in ('gender', 'brand', 'is_active', 'is_featured'):
+        if field in filters:
+            products = products.filter(**{field: filters[field]})
+    if 'min_price' in filters:
+        products = products.filter(effective_price__gte=filters['min_price'])
+    if 'max_price' in filters:
+        products = products.filter(effective_price__lte=filters['max_price'])
+    return products
+
+
+def apply_changes(products, discount_percent=None, clear_discount=False, stock_delta=None,
+                  is_active=None, is_featured=None):
+    """
+    Apply the requested changes to the products queryset and return a summary
+    """
+    summary = {'matched_products': 0, 'products_updated': 0, 'variants_updated': 0}
+    product_changes = {}
+    if clear_discount or discount_percent == 0:
+        product_changes['discount_price'] = None
+    elif discount_percent is not None:
+        factor = (Decimal(100) - discount_percent) / Decimal(100)
+        product_changes['discount_price'] = Round(F('price') * factor, 2)
+    if is_active is not None:
+        product_changes['is_active'] = is_active
+    if is_featured is not None:
+        product_changes['is_featured'] = is_featured
+
+    with transaction.atomic():
+        product_ids = list(products.values_list('id', flat=True)[:MAX_SIGNALLED_IDS + 1])
+        if len(product_ids) > MAX_SIGNALLED_IDS:
+            summary['matched_products'] = products.count()
+            product_ids = None
+        else:
+            summary['matched_products'] = len(product_ids)
+        if not summary['matched_products']:
+            return summary
+
+        # Variants first: the product UPDATE may change the columns the
+        # selection filters on (is_active, effective_price)
+        if stock_delta:
+            # Clamp before adding: stock_quantity is unsigned on MySQL, so a
+            # negative intermediate value is an out-of-range error there
+            stock = F('stock_quantity') + stock_delta
+            if stock_delta < 0:
+                stock = Case(When(stock_quantity__lte=-stock_delta, then=Value(0)), default=stock)
+            summary['variants_updated'] = ProductVariant.objects.filter(product__in=products.values('id')).update(
+                stock_quantity=stock, updated_at=Now()
+            )
+        if product_changes:
+            # Queryset updates skip auto_now; detail ETags depend on updated_at
+            summary['products_updated'] = products.update(updated_at=Now(), **product_changes)
+
+        products_changed = bool(product_changes)
+        transaction.on_commit(lambda: changed(product_ids, products_changed))
+    return summary
+
+
+def changed(product_ids, products_changed=True):
+    """
+    Invalidate what the bulk write made stale and tell other apps (product_ids
+    is None for a selection too large to list)
+    """
+    facets.invalidate()
+    if products_changed:
+        # Cached catalog payloads and suggestions hold no variant stock
+        autocomplete.invalidate()
+        catalog_cache.bump_catalog_version()
+    products_bulk_updated.send(sender=Product, product_ids=product_ids)
@@ -0,0 +1,58 @@
+"""
+Response cache for catalog endpoints that every homepage hit requests.
+
+Entries are keyed on a catalog version counter kept in Django's cache.
+Catalog signals bump the counter on commit (see products.signals), which
+makes every cached payload unreachable at once instead of waiting for a
+TTL. Payloads are stored as rendered JSON bytes so a hit skips both the
+database and the serializer.
+"""
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+VERSION_CACHE_KEY = 'catalog:version'
+# Safety net only; entries normally die by version bump
+PAYLOAD_TIMEOUT = 60 * 60
+
+
+def initial_version():
+    # Millisecond clock, so a counter lost to cache eviction restarts above
+    # every value handed out before it
+    return time.time_ns() // 1_000_000
+
+
+def get_version(key):
+    return cache.get_or_set(key, initial_version, timeout=None)
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def catalog_version():
+    return get_version(VERSION_CACHE_KEY)
+
+
+def bump_catalog_version():
+    return bump_version(VERSION_CACHE_KEY)
+
+
+def cached_json_response(request, name, build):
+    """
+    Serve the payload for name from the cache, building it with build() on a
+    miss. Absolute media URLs depend on the host, so it is part of the key.
+    """
+    key = f'catalog:{catalog_version()}:{name}:{request.build_absolute_uri("/")}'
+    body = cache.get(key)
+    if body is None:
+        body = JSONRenderer().render(build())
+        cache.set(key, body, timeout=PAYLOAD_TIMEOUT)
+    return HttpResponse(body, content_type='application/json')
@@ -0,0 +1,293 @@
+"""
+Streaming catalog import.
+
+Feeds are CSV or JSONL with one row per variant; product columns repeat on
+every variant row of the same style_code. Rows are read lazily and applied in
+batches, one transaction each: categories are created by name, products are
+upserted on Product.style_code and variants on sku with bulk_create and
+bulk_update, so a batch costs a fixed handful of queries whatever its size.
+
+Bulk writes skip model signals, so the search index, facet index and catalog
+caches are refreshed once at the end instead of per row. After each batch the
+byte offset reached in the file is written to a checkpoint so an interrupted
+import can resume where it stopped.
+"""
+import csv
+import json
+import os
+import tempfile
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Category, Product, ProductImage, ProductVariant
+
+PRODUCT_FIELDS = ('name', 'description', 'price', 'discount_price', 'gender', 'brand', 'material', 'is_active', 'is_featured')
+VARIANT_FIELDS = ('product_id', 'size', 'color', 'stock_quantity')
+REQUIRED_COLUMNS = ('style_code', 'name', 'category', 'price', 'gender', 'sku', 'size', 'color', 'stock_quantity')
+GENDERS = {choice for choice, label in Product.GENDER_CHOICES}
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+
+DEFAULT_BATCH_SIZE = 2000
+# bulk_update builds one CASE per field; keep statements a sensible size
+UPDATE_BATCH_SIZE = 500
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_lines(handle, position):
+    """
+    Decoded lines of a binary file, keeping position[0] at the byte offset
+    just past the last line handed out
+    """
+    for line in handle:
+        position[0] += len(line)
+        yield line.decode('utf-8-sig')
+
+
+def read_rows(path, file_format, offset=0):
+    """
+    Yield (row, end_offset) from a CSV or JSONL feed starting at byte offset
+    """
+    with open(path, 'rb') as handle:
+        position = [0]
+        if file_format == 'csv':
+            header = next(csv.reader(read_lines(handle, position)), None)
+            if header is None:
+                return
+            offset = max(offset, position[0])
+            handle.seek(offset)
+            position[0] = offset
+            # csv pulls lines only as far as the current record, so position
+            # is exact even for quoted fields spanning lines
+            for values in csv.reader(read_lines(handle, position)):
+                if values:
+                    yield dict(zip(header, values)), position[0]
+        else:
+            handle.seek(offset)
+            position[0] = offset
+            for line in read_lines(handle, position):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        row = None
+                    yield row, position[0]
+
+
+def batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def text(row, column):
+    value = row.get(column)
+    return '' if value is None else str(value).strip()
+
+
+def decimal(row, column, required=False):
+    value = text(row, column)
+    if not value:
+        if required:
+            raise RowError(f'{column} is required')
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise RowError(f'{column} is not a number')
+
+
+def boolean(row, column, default):
+    value = text(row, column).lower()
+    return default if not value else value in TRUE_VALUES
+
+
+def parse_row(row):
+    """
+    Normalised (product, variant, category, image names) for one feed row
+    """
+    if not isinstance(row, dict):
+        raise RowError('row is not an object')
+    missing = [column for column in REQUIRED_COLUMNS if not text(row, column)]
+    if missing:
+        raise RowError(f'missing {", ".join(missing)}')
+    gender = text(row, 'gender').lower()
+    if gender not in GENDERS:
+        raise RowError(f'unknown gender {gender}')
+    try:
+        stock_quantity = int(text(row, 'stock_quantity'))
+    except ValueError:
+        raise RowError('stock_quantity is not an integer')
+    if stock_quantity < 0:
+        raise RowError('stock_quantity is negative')
+
+    product = {
+        'style_code': text(row, 'style_code'),
+        'name': text(row, 'name'),
+        'description': text(row, 'description'),
+        'price': decimal(row, 'price', required=True),
+        'discount_price': decimal(row, 'discount_price'),
+        'gender': gender,
+        'brand': text(row, 'brand'),
+        'material': text(row, 'material'),
+        'is_active': boolean(row, 'is_active', True),
+        'is_featured': boolean(row, 'is_featured', False),
+    }
+    variant = {
+        'sku': text(row, 'sku'),
+        'size': text(row, 'size'),
+        'color': text(row, 'color'),
+        'stock_quantity': stock_quantity,
+    }
+    images = row.get('images') or []
+    if isinstance(images, str):
+        images = [name.strip() for name in images.split('|') if name.strip()]
+    return product, variant, text(row, 'category'), images
+
+
+class CatalogImporter:
+    """
+    Applies feed batches. Categories are cached by name for the whole run;
+    everything else is looked up per batch so memory stays flat.
+    """
+
+    def __init__(self):
+        self.categories = {}
+        for category_id, name in Category.objects.order_by('-id').values_list('id', 'name'):
+            self.categories[name] = category_id
+        self.stats = {'rows': 0, 'errors': 0, 'products_created': 0, 'products_updated': 0,
+                      'variants_created': 0, 'variants_updated': 0, 'images_created': 0}
+
+    def category_ids(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.categories]
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in missing])
+            # bulk_create does not return ids on every backend
+            for category_id, name in Category.objects.filter(name__in=missing).order_by('-id').values_list('id', 'name'):
+                self.categories.setdefault(name, category_id)
+        return self.categories
+
+    def apply(self, rows):
+        """
+        Write one batch of (product, variant, category, images) tuples and
+        return [(image_id, name)] for the images created
+        """
+        products = {}
+        variants = {}
+        images = {}
+        for product, variant, category, image_names in rows:
+            products[product['style_code']] = dict(product, category=category)
+            variants[variant['sku']] = dict(variant, style_code=product['style_code'])
+            images.setdefault(product['style_code'], []).extend(image_names)
+
+        with transaction.atomic():
+            categories = self.category_ids(product['category'] for product in products.values())
+            product_ids = self.upsert_products(products, categories)
+            self.upsert_variants(variants, product_ids)
+            created_images = self.add_images(images, product_ids)
+        self.stats['rows'] += len(rows)
+        return created_images
+
+    def upsert_products(self, products, categories):
+        existing = {product.style_code: product for product in Product.objects.filter(style_code__in=list(products))}
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        for style_code, values in products.items():
+            product = existing.get(style_code) or Product(style_code=style_code)
+            product.category_id = categories[values['category']]
+            for field in PRODUCT_FIELDS:
+                setattr(product, field, values[field])
+            # bulk_update does not run auto_now
+            product.updated_at = now
+            (to_update if product.pk else to_create).append(product)
+
+        Product.objects.bulk_create(to_create)
+        Product.objects.bulk_update(to_update, PRODUCT_FIELDS + ('category_id', 'updated_at'), batch_size=UPDATE_BATCH_SIZE)
+        self.stats['products_created'] += len(to_create)
+        self.stats['products_updated'] += len(to_update)
+        return dict(Product.objects.filter(style_code__in=list(products)).values_list('style_code', 'id'))
+
+    def upsert_variants(self, variants, product_ids):
+        existing = ProductVariant.objects.in_bulk(list(variants), field_name='sku')
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        for sku, values in variants.items():
+            variant = existing.get(sku) or ProductVariant(sku=sku)
+            variant.product_id = product_ids[values['style_code']]
+            variant.size = values['size']
+            variant.color = values['color']
+            variant.stock_quantity = values['stock_quantity']
+            variant.updated_at = now
+            (to_update if variant.pk else to_create).append(variant)
+
+        ProductVariant.objects.bulk_update(to_update, VARIANT_FIELDS + ('updated_at',), batch_size=UPDATE_BATCH_SIZE)
+        ProductVariant.objects.bulk_create(to_create)
+        self.stats['variants_created'] += len(to_create)
+        self.stats['variants_updated'] += len(to_update)
+
+    def add_images(self, images, product_ids):
+        wanted = {product_ids[style_code]: list(dict.fromkeys(names)) for style_code, names in images.items() if names}
+        if not wanted:
+            return []
+        existing = {}
+        for product_id, name in ProductImage.objects.filter(product_id__in=list(wanted)).values_list('product_id', 'image'):
+            existing.setdefault(product_id, set()).add(name)
+
+        to_create = []
+        for product_id, names in wanted.items():
+            has_images = product_id in existing
+            for name in names:
+                if name in existing.get(product_id, ()):
+                    continue
+                to_create.append(ProductImage(product_id=product_id, image=name, is_primary=not has_images))
+                has_images = True
+
+        ProductImage.objects.bulk_create(to_create)
+        self.stats['images_created'] += len(to_create)
+        if not to_create:
+            return []
+        created = {(image.product_id, image.image.name) for image in to_create}
+        return [
+            (image_id, name) for image_id, product_id, name in
+            ProductImage.objects.filter(product_id__in={product_id for product_id, name in created})
+            .values_list('id', 'product_id', 'image')
+            if (product_id, name) in created
+        ]
+
+
+def load_checkpoint(path, source):
+    try:
+        with open(path) as handle:
+            checkpoint = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(source)
+    # A checkpoint only applies to the exact file it was written for
+    if checkpoint.get('source') != os.path.abspath(source) or checkpoint.get('size') != stat.st_size \
+            or checkpoint.get('mtime_ns') != stat.st_mtime_ns:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path, source, offset, stats):
+    stat = os.stat(source)
+    checkpoint = {
+        'source': os.path.abspath(source), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+        'offset': offset, 'stats': stats,
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as handle:
+        json.dump(checkpoint, handle)
+    os.replace(tmp_path, path)
@@ -0,0 +1,61 @@
+"""
+Change logs in Django's cache for the in-process indexes (search,
+autocomplete).
+
+A writer takes a sequence number with an atomic incr and stores its entry
+under that number with add. A reader that finds a number taken but still
+empty cannot tell a writer between those two steps from one that never got
+there, so it claims the slot with a SKIPPED marker, also with add. Only one
+of the two adds can win; when the reader's does, the writer takes a new
+number. Every number thus ends up holding either a change or a marker, and
+a reader that looks in the middle of a write never has to rebuild for it.
+"""
+import time
+
+from django.core.cache import cache
+
+SKIPPED = 'skipped'
+# A writer whose slots keep being claimed gives up after this many numbers
+MAX_ATTEMPTS = 3
+
+
+def head(seq_key):
+    return cache.get(seq_key, 0)
+
+
+def append(seq_key, entry_key, value, timeout):
+    """
+    Store value under a new sequence number and return the number; None
+    when the counter was evicted in between or no slot could be kept
+    """
+    cache.add(seq_key, 0, timeout=None)
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            seq = cache.incr(seq_key)
+        except ValueError:
+            return None
+        if cache.add(entry_key.format(seq), value, timeout=timeout):
+            return seq
+    return None
+
+
+def replay(entry_key, after, upto, synced_at, timeout, max_replay):
+    """
+    The entries numbered after+1..upto in order, for a reader that was in
+    sync at synced_at (a time.time() value). None when the reader should
+    rebuild instead: more than max_replay entries, or out of sync long
+    enough for entries to have expired.
+    """
+    if upto - after > max_replay or time.time() - synced_at > timeout:
+        return None
+    keys = [entry_key.format(number) for number in range(after + 1, upto + 1)]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key in found:
+            continue
+        if cache.add(key, SKIPPED, timeout=timeout):
+            found[key] = SKIPPED
+        else:
+            # The writer stored it in the meantime
+            found[key] = cache.get(key, SKIPPED)
+    return [found[key] for key in keys if found[key] != SKIPPED]
@@ -0,0 +1,163 @@
+"""
+Facet counts for the product listing.
+
+Every active product gets a bit position, and every facet value keeps an
+integer bitset of the products that have it, as does every (size, color,
+in-stock) combination a single variant can match. A listing filtered only
+on those resolves to one bitset without touching the database, and counting
+it is one AND plus a popcount per facet value. The index lives in process
+memory; invalidate() marks it stale and a replacement is built in the
+background (see products/rebuilds.py).
+"""
+from collections import defaultdict
+
+from .catalog_cache import bump_version, get_version
+from .rebuilds import IndexHolder
+
+FACETS = ('category', 'gender', 'brand', 'size', 'color', 'price')
+
+PRICE_BUCKETS = [
+    (0, 500),
+    (500, 1000),
+    (1000, 2000),
+    (2000, 5000),
+    (5000, None),
+]
+
+VERSION_CACHE_KEY = 'products:facets:version'
+
+
+def price_bucket(price):
+    for bucket in PRICE_BUCKETS:
+        low, high = bucket
+        if price >= low and (high is None or price < high):
+            return bucket
+    return PRICE_BUCKETS[0]
+
+
+def bits_from_slots(slots, size):
+    """
+    Build an int bitset from bit positions without quadratic big-int ORs
+    """
+    buffer = bytearray((size + 7) // 8)
+    for slot in slots:
+        buffer[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class FacetIndex:
+    def __init__(self, version=None):
+        self.version = version
+        self.slots = {}  # product_id -> bit position
+        self.product_ids = []  # bit position -> product_id
+        self.bitsets = {facet: {} for facet in FACETS}
+        # (size or None, color or None, in-stock only) -> products with a matching variant
+        self.attributes = {}
+        self.labels = {}  # category id -> name
+
+    @classmethod
+    def build(cls, version=None):
+        from .models import Product, ProductVariant
+
+        index = cls(version)
+        slots_by_value = {facet: defaultdict(list) for facet in FACETS}
+
+        rows = Product.objects.filter(is_active=True).values_list(
+            'id', 'category_id', 'category__name', 'gender', 'brand', 'effective_price'
+        )
+        for slot, (product_id, category_id, category_name, gender, brand, price) in enumerate(
+            rows.iterator(chunk_size=5000)
+        ):
+            index.slots[product_id] = slot
+            index.product_ids.append(product_id)
+            index.labels[category_id] = category_name
+            slots_by_value['category'][category_id].append(slot)
+            slots_by_value['gender'][gender].append(slot)
+            if brand:
+                slots_by_value['brand'][brand].append(slot)
+            slots_by_value['price'][price_bucket(price)].append(slot)
+
+        # Sets, so a product counts once per value no matter how many variants share it
+        slots_by_attribute = defaultdict(set)
+        variants = ProductVariant.objects.filter(product__is_active=True).values_list(
+            'product_id', 'size', 'color', 'stock_quantity'
+        )
+        for product_id, size, color, stock_quantity in variants.iterator(chunk_size=10000):
+            slot = index.slots.get(product_id)
+            if slot is None:
+                continue
+            for key in ((size, None), (None, color), (size, color), (None, None)):
+                slots_by_attribute[key + (False,)].add(slot)
+                if stock_quantity > 0:
+                    slots_by_attribute[key + (True,)].add(slot)
+
+        for (variant_size, color, in_stock), slots in slots_by_attribute.items():
+            if variant_size is not None and color is None and not in_stock:
+                slots_by_value['size'][variant_size] = slots
+            elif color is not None and variant_size is None and not in_stock:
+                slots_by_value['color'][color] = slots
+
+        size = len(index.slots)
+        for facet, values in slots_by_value.items():
+            index.bitsets[facet] = {value: bits_from_slots(slots, size) for value, slots in values.items()}
+        index.attributes = {key: bits_from_slots(slots, size) for key, slots in slots_by_attribute.items()}
+        return index
+
+    def filter_bits(self, category=None, gender=None, brand=None, size=None, color=None, in_stock=False):
+        """
+        Bitset of the products matching every given filter; size, color and
+        in_stock must hold on a single variant
+        """
+        if size or color or in_stock:
+            bits = self.attributes.get((size or None, color or None, bool(in_stock)), 0)
+        else:
+            bits = (1 << len(self.slots)) - 1
+        for facet, value in (('category', category), ('gender', gender), ('brand', brand)):
+            if value is not None:
+                bits &= self.bitsets[facet].get(value, 0)
+        return bits
+
+    def mask(self, product_ids):
+        slots = self.slots
+        return bits_from_slots((slots[pid] for pid in product_ids if pid in slots), len(slots))
+
+    def counts(self, mask):
+        """
+        Facet counts over the products whose bits are set in mask
+        """
+        facets = {}
+        for facet in FACETS:
+            entries = []
+            for value, bits in self.bitsets[facet].items():
+                count = (bits & mask).bit_count()
+                if count:
+                    entries.append((value, count))
+
+            if facet == 'price':
+                entries.sort(key=lambda entry: entry[0][0])
+                facets[facet] = [{'min': low, 'max': high, 'count': count} for (low, high), count in entries]
+            elif facet == 'category':
+                entries.sort(key=lambda entry: (-entry[1], self.labels[entry[0]]))
+                facets[facet] = [
+                    {'value': value, 'label': self.labels[value], 'count': count} for value, count in entries
+                ]
+            else:
+                entries.sort(key=lambda entry: (-entry[1], entry[0]))
+                facets[facet] = [{'value': value, 'count': count} for value, count in entries]
+        return facets
+
+
+_holder = IndexHolder('facet')
+
+
+def current_version():
+    return get_version(VERSION_CACHE_KEY)
+
+
+def invalidate():
+    bump_version(VERSION_CACHE_KEY)
+
+
+def get_index():
+    version = current_version()
+    return _holder.get(lambda index: index.version == version, lambda: FacetIndex.build(version))
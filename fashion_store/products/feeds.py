@@ -0,0 +1,188 @@
+"""
+Catalog feed export.
+
+One row per variant with its product, price, stock and primary image URL,
+read in keyset-paginated chunks and encoded row by row, so memory stays flat
+whatever the catalog size (MySQL buffers whole result sets client-side, so a
+single .iterator() query would not). Full exports cover active products;
+incremental exports (since=<watermark>) cover every variant whose own row,
+product or images changed after the watermark, including deactivated
+products so consumers can delist them. Each export reports the watermark to
+pass as since next time: the database clock at the start of the export, less
+WATERMARK_OVERLAP, so rows stamped by a skewed app server or committed by a
+transaction still open at that moment are not missed. Rows in the overlap are
+sent twice; consumers upsert by sku.
+"""
+import csv
+import json
+from datetime import timedelta
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.db.models.functions import Now
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ProductImage, ProductVariant
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'xml': 'application/xml; charset=utf-8',
+}
+
+COLUMNS = (
+    'sku', 'product_id', 'style_code', 'name', 'brand', 'category', 'gender', 'size', 'color',
+    'price', 'sale_price', 'stock_quantity', 'in_stock', 'is_active', 'image_url', 'updated_at',
+)
+
+CHUNK_SIZE = 2000
+# Rows are buffered into chunks this large before being handed to the response
+WRITE_BATCH = 200
+# Covers app server clock skew and transactions that commit after the export starts
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+def parse_since(value):
+    """
+    Aware datetime from an ISO 8601 watermark, or None if it is not one
+    """
+    try:
+        # A "+" in an unencoded query string arrives as a space
+        since = parse_datetime(value.strip().replace(' ', '+'))
+    except ValueError:
+        return None
+    if since is not None and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def next_watermark():
+    """
+    Watermark for the export starting now, taken from the database clock
+    """
+    now = ProductVariant.objects.annotate(now=Now()).values_list('now', flat=True).first()
+    if now is None:
+        # No variants to read the clock through, so nothing to miss either
+        now = timezone.now()
+    return now - WATERMARK_OVERLAP
+
+
+def feed_queryset(since=None):
+    primary_image = ProductImage.objects.filter(product_id=OuterRef('product_id')).order_by('-is_primary', 'id')
+    variants = ProductVariant.objects.annotate(image=Subquery(primary_image.values('image')[:1]))
+    if since is None:
+        variants = variants.filter(product__is_active=True)
+    else:
+        changed_images = ProductImage.objects.filter(product_id=OuterRef('product_id'), updated_at__gt=since)
+        variants = variants.filter(
+            Q(updated_at__gt=since) | Q(product__updated_at__gt=since) | Exists(changed_images)
+        )
+    return variants.order_by('id').values(
+        'id', 'sku', 'product_id', 'product__style_code', 'product__name', 'product__brand', 'product__category__name',
+        'product__gender', 'size', 'color', 'product__price', 'product__discount_price', 'stock_quantity',
+        'product__is_active', 'image', 'updated_at', 'product__updated_at',
+    )
+
+
+def feed_rows(since=None, build_url=None):
+    """
+    Yield one dict per variant with COLUMNS as keys
+    """
+    build_url = build_url or (lambda url: url)
+    queryset = feed_queryset(since)
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:CHUNK_SIZE])
+        if not chunk:
+            return
+        last_id = chunk[-1]['id']
+        for row in chunk:
+            yield feed_row(row, build_url)
+
+
+def feed_row(row, build_url):
+    discount_price = row['product__discount_price']
+    return {
+        'sku': row['sku'],
+        'product_id': row['product_id'],
+        'style_code': row['product__style_code'] or '',
+        'name': row['product__name'],
+        'brand': row['product__brand'],
+        'category': row['product__category__name'],
+        'gender': row['product__gender'],
+        'size': row['size'],
+        'color': row['color'],
+        'price': str(row['product__price']),
+        'sale_price': str(discount_price) if discount_price else '',
+        'stock_quantity': row['stock_quantity'],
+        'in_stock': row['stock_quantity'] > 0,
+        'is_active': row['product__is_active'],
+        'image_url': build_url(settings.MEDIA_URL + row['image']) if row['image'] else '',
+        'updated_at': max(row['updated_at'], row['product__updated_at']).isoformat(),
+    }
+
+
+class _Line:
+    """
+    File-like target for csv.writer that hands back what was written
+    """
+
+    def write(self, value):
+        return value
+
+
+def encode_csv(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            str(row[column]).lower() if isinstance(row[column], bool) else row[column] for column in COLUMNS
+        ])
+
+
+def encode_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, separators=(',', ':')) + '\n'
+
+
+def encode_xml(rows, watermark):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<catalog watermark="{watermark}">\n'
+    for row in rows:
+        fields = ''.join(
+            f'<{column}>{escape(str(row[column]).lower() if isinstance(row[column], bool) else str(row[column]))}</{column}>'
+            for column in COLUMNS
+        )
+        yield f'  <variant>{fields}</variant>\n'
+    yield '</catalog>\n'
+
+
+def export(feed_format, since=None, build_url=None):
+    """
+    (watermark, iterator of str chunks) for a feed in feed_format
+    """
+    # Taken before reading so rows changed during the export are picked up next time
+    watermark = next_watermark().isoformat()
+    rows = feed_rows(since, build_url)
+    if feed_format == 'csv':
+        lines = encode_csv(rows)
+    elif feed_format == 'jsonl':
+        lines = encode_jsonl(rows)
+    elif feed_format == 'xml':
+        lines = encode_xml(rows, watermark)
+    else:
+        raise ValueError(f'Unknown feed format {feed_format}')
+    return watermark, batched(lines)
+
+
+def batched(lines, size=WRITE_BATCH):
+    # Fewer, larger writes than one per row
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
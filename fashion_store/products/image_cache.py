@@ -0,0 +1,259 @@
+"""
+On-demand resized variants of uploaded media.
+
+Variants are rendered in the image process pool the first time they are
+requested and kept in IMAGE_CACHE_DIR. The directory is bounded by
+IMAGE_CACHE_MAX_BYTES: hits refresh a file's mtime and, once the total goes
+over the limit, the least recently used files are evicted down to
+IMAGE_CACHE_LOW_WATER of it. Concurrent requests for a variant that is still
+rendering wait on the same job instead of starting their own.
+
+Variant keys include the source's mtime, but URLs only do when the client
+passes ?v= with source_version(); only those responses are immutable.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import BrokenExecutor, Future
+
+from django.conf import settings
+from PIL import Image
+
+from .images import discard_executor, get_executor
+
+logger = logging.getLogger(__name__)
+
+# Only uploads under these MEDIA_ROOT folders can be resized
+ALLOWED_PREFIXES = ('products/', 'categories/')
+
+# Requested widths are rounded up to one of these so the cache stays small
+WIDTHS = (160, 240, 320, 480, 640, 800, 1024, 1280, 1600, 2048)
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+DEFAULT_QUALITY = 80
+MIN_QUALITY = 30
+MAX_QUALITY = 95
+QUALITY_STEP = 5
+
+
+class VariantError(ValueError):
+    pass
+
+
+class UnknownImage(VariantError):
+    pass
+
+
+class RenderUnavailable(VariantError):
+    pass
+
+
+def cache_dir():
+    return str(getattr(settings, 'IMAGE_CACHE_DIR', settings.BASE_DIR / 'image_cache'))
+
+
+def max_bytes():
+    return getattr(settings, 'IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+
+def source_path(name):
+    """
+    Absolute path of an upload, refusing anything outside the allowed folders
+    """
+    name = name.replace('\\', '/')
+    if not name.startswith(ALLOWED_PREFIXES) or '..' in name.split('/'):
+        raise UnknownImage('Unknown image')
+    path = os.path.join(str(settings.MEDIA_ROOT), *name.split('/'))
+    if not os.path.isfile(path):
+        raise UnknownImage('Unknown image')
+    return path
+
+
+def source_version(name):
+    """
+    Token that changes whenever the upload behind name is replaced
+    """
+    return format(os.stat(source_path(name)).st_mtime_ns, 'x')
+
+
+def snap_width(width):
+    for allowed in WIDTHS:
+        if width <= allowed:
+            return allowed
+    return WIDTHS[-1]
+
+
+def snap_quality(quality):
+    quality = min(max(quality, MIN_QUALITY), MAX_QUALITY)
+    return QUALITY_STEP * round(quality / QUALITY_STEP)
+
+
+def variant_key(name, mtime_ns, width, extension, quality):
+    raw = f'{name}:{mtime_ns}:{width}:{extension}:{quality}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def variant_path(key, extension):
+    return os.path.join(cache_dir(), key[:2], f'{key}.{extension}')
+
+
+def render_variant(source, destination, width, extension, quality):
+    """
+    Resize source to at most width pixels wide and write it atomically to
+    destination. Runs in a worker process.
+    """
+    image_format = FORMATS[extension][0]
+    with Image.open(source) as image:
+        image.load()
+        # Bounded by width only, and never upscaled
+        image.thumbnail((width, image.height), Image.LANCZOS)
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+            image = image.convert('RGBA')
+
+        directory = os.path.dirname(destination)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                options = {'optimize': True} if image_format == 'PNG' else {'quality': quality}
+                image.save(handle, image_format, **options)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return os.path.getsize(destination)
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_usage = {'bytes': None}
+_usage_lock = threading.Lock()
+
+
+def get_variant(name, width, extension, quality=DEFAULT_QUALITY):
+    """
+    Path and cache key of the requested variant, rendering it if needed
+    """
+    if extension not in FORMATS:
+        raise VariantError('Unsupported format')
+    source = source_path(name)
+    width = snap_width(width)
+    quality = snap_quality(quality)
+    key = variant_key(name, os.stat(source).st_mtime_ns, width, extension, quality)
+    path = variant_path(key, extension)
+
+    try:
+        # Refresh recency for LRU eviction
+        os.utime(path)
+        return path, key
+    except FileNotFoundError:
+        pass
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    try:
+        if owner:
+            _render(future, source, path, width, extension, quality)
+        size = future.result()
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.error(f"Resizing {name} failed: {str(e)}")
+        raise VariantError('Image could not be processed') from e
+    except BrokenExecutor as e:
+        logger.error(f"Resizing {name} failed: image workers died: {str(e)}")
+        raise RenderUnavailable('Image processing is temporarily unavailable') from e
+    except Exception as e:
+        logger.exception(f"Resizing {name} failed")
+        raise VariantError('Image could not be processed') from e
+    finally:
+        if owner:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+
+    if owner:
+        record_write(size)
+    return path, key
+
+
+def _render(future, *args):
+    # Inline when IMAGE_RENDITIONS_ASYNC is off, otherwise in the image process pool
+    try:
+        if getattr(settings, 'IMAGE_RENDITIONS_ASYNC', True):
+            executor = get_executor()
+            try:
+                result = executor.submit(render_variant, *args).result()
+            except BrokenExecutor:
+                discard_executor(executor)
+                raise
+        else:
+            result = render_variant(*args)
+    except BaseException as e:
+        future.set_exception(e)
+    else:
+        future.set_result(result)
+
+
+def scan_cache():
+    """
+    [(mtime, size, path)] of every cached variant
+    """
+    entries = []
+    for root, dirs, files in os.walk(cache_dir()):
+        for filename in files:
+            # Variants still being written
+            if filename.endswith('.tmp'):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def record_write(size):
+    with _usage_lock:
+        if _usage['bytes'] is None:
+            _usage['bytes'] = sum(entry[1] for entry in scan_cache())
+        else:
+            _usage['bytes'] += size
+        if _usage['bytes'] > max_bytes():
+            _usage['bytes'] = evict()
+
+
+def evict(target=None):
+    """
+    Delete least recently used variants until the cache is under target
+    bytes. Returns the bytes left.
+    """
+    if target is None:
+        target = int(max_bytes() * getattr(settings, 'IMAGE_CACHE_LOW_WATER', 0.9))
+    # Rescan rather than trust the running total: other workers share the directory
+    entries = sorted(scan_cache())
+    total = sum(entry[1] for entry in entries)
+    for mtime, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
+
+
+def reset_usage():
+    with _usage_lock:
+        _usage['bytes'] = None
@@ -0,0 +1,142 @@
+"""
+Product image renditions.
+
+Uploads are stored untouched; a process pool then renders each image at a
+fixed set of widths in WebP and JPEG and records the file names on
+ProductImage.renditions, which serializers expose as a srcset-style map.
+Rendering runs in separate processes so Pillow work is not bound by the
+GIL and never blocks the request that saved the image.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Rendition name -> maximum width/height in pixels
+RENDITIONS = {
+    'thumbnail': 200,
+    'card': 400,
+    'detail': 800,
+    'zoom': 1600,
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+RENDITIONS_DIR = 'renditions'
+
+
+def rendition_name(source_name, rendition, extension):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, RENDITIONS_DIR, f'{stem}_{rendition}.{extension}')
+
+
+def render_renditions(media_root, source_name):
+    """
+    Write every rendition of MEDIA_ROOT/source_name and return
+    {'source': source_name, rendition: {format: name}}. Runs in a worker process.
+    """
+    renditions = {'source': source_name}
+    with Image.open(os.path.join(media_root, source_name)) as source:
+        source.load()
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+
+        for rendition, size in RENDITIONS.items():
+            resized = source.copy()
+            # Never upscale; small sources just get re-encoded
+            resized.thumbnail((size, size), Image.LANCZOS)
+            renditions[rendition] = {}
+            for extension, (image_format, options) in FORMATS.items():
+                image = resized.convert('RGB') if image_format == 'JPEG' else resized
+                name = rendition_name(source_name, rendition, extension)
+                path = os.path.join(media_root, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                image.save(path, image_format, **options)
+                renditions[rendition][extension] = name
+    return renditions
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2))
+        return _executor
+
+
+def discard_executor(executor):
+    """
+    Drop a pool that broke (a worker died), so the next caller starts a new one
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def store_renditions(image_id, renditions, bump=True):
+    from . import catalog_cache
+    from .models import ProductImage
+
+    # Skip if the image was replaced while rendering; that upload has its own job
+    updated = ProductImage.objects.filter(id=image_id, image=renditions['source']).update(
+        renditions=renditions, updated_at=timezone.now()
+    )
+    if updated and bump:
+        catalog_cache.bump_catalog_version()
+    return bool(updated)
+
+
+def _on_rendered(image_id, future):
+    # Done callbacks run on an executor thread, outside any request
+    close_old_connections()
+    try:
+        store_renditions(image_id, future.result())
+    except Exception as e:
+        logger.error(f"Rendering image {image_id} failed: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(image_id, source_name):
+    """
+    Render in the process pool (or inline when IMAGE_RENDITIONS_ASYNC is off)
+    """
+    media_root = str(settings.MEDIA_ROOT)
+    if not getattr(settings, 'IMAGE_RENDITIONS_ASYNC', True):
+        store_renditions(image_id, render_renditions(media_root, source_name))
+        return None
+
+    future = get_executor().submit(render_renditions, media_root, source_name)
+    future.add_done_callback(lambda done: _on_rendered(image_id, done))
+    return future
+
+
+def srcset(image, build_url):
+    """
+    {rendition: {format: url}} for a ProductImage, empty until rendered
+    """
+    renditions = image.renditions or {}
+    if renditions.get('source') != image.image.name:
+        return {}
+    storage = image.image.storage
+    return {
+        rendition: {extension: build_url(storage.url(name)) for extension, name in formats.items()}
+        for rendition, formats in renditions.items() if rendition in RENDITIONS
+    }
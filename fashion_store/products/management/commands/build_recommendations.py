@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the co-purchase neighbour table used by outfit suggestions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=recommendations.DEFAULT_TOP_K)
+        parser.add_argument('--max-basket', type=int, default=recommendations.DEFAULT_MAX_BASKET,
+                            help='Ignore orders with more distinct products than this')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = recommendations.build_recommendations(top_k=options['top_k'], max_basket=options['max_basket'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} recommendations in {elapsed:.2f}s'))
@@ -0,0 +1,118 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from products import autocomplete, catalog_cache, catalog_import, facets, images, search
+from products.models import Product
+from products.signals import products_bulk_updated
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or JSONL supplier feed (one row per SKU) into the catalog with batched upserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Feed format; defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=catalog_import.DEFAULT_BATCH_SIZE)
+        parser.add_argument('--checkpoint', help='Checkpoint file; defaults to <path>.checkpoint')
+        parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint of a previous run')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes rendering image renditions')
+        parser.add_argument('--skip-images', action='store_true',
+                            help='Do not render renditions for new images (render_product_images can do it later)')
+        parser.add_argument('--max-errors', type=int, default=1000, help='Abort after this many invalid rows')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'{path} does not exist')
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+
+        offset = 0
+        importer = catalog_import.CatalogImporter()
+        if options['resume']:
+            checkpoint = catalog_import.load_checkpoint(checkpoint_path, path)
+            if checkpoint is None:
+                raise CommandError(f'No usable checkpoint at {checkpoint_path}')
+            offset = checkpoint['offset']
+            importer.stats.update(checkpoint['stats'])
+            self.stdout.write(f'Resuming at byte {offset} after {importer.stats["rows"]} rows')
+
+        executor = None
+        if not options['skip_images']:
+            executor = ProcessPoolExecutor(max_workers=options['workers'])
+        pending = {}
+        started = time.monotonic()
+        rows_at_start = importer.stats['rows']
+
+        try:
+            for batch in catalog_import.batches(catalog_import.read_rows(path, file_format, offset), options['batch_size']):
+                parsed = []
+                for row, end in batch:
+                    try:
+                        parsed.append(catalog_import.parse_row(row))
+                    except catalog_import.RowError as e:
+                        importer.stats['errors'] += 1
+                        self.stderr.write(f'Skipped row ending at byte {end}: {str(e)}')
+                        if importer.stats['errors'] > options['max_errors']:
+                            raise CommandError('Too many invalid rows, aborting')
+
+                try:
+                    created_images = importer.apply(parsed) if parsed else []
+                except DatabaseError as e:
+                    raise CommandError(f'Batch ending at byte {batch[-1][1]} failed: {str(e)}')
+                catalog_import.save_checkpoint(checkpoint_path, path, batch[-1][1], importer.stats)
+
+                if executor:
+                    media_root = str(settings.MEDIA_ROOT)
+                    for image_id, name in created_images:
+                        pending[executor.submit(images.render_renditions, media_root, name)] = image_id
+                    # Bound the backlog so memory stays flat on image-heavy feeds
+                    while len(pending) > options['workers'] * 64:
+                        self.collect(pending, wait(pending, return_when=FIRST_COMPLETED).done)
+
+                self.report(importer.stats, rows_at_start, started)
+
+            if pending:
+                self.collect(pending, wait(pending).done)
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+        # Bulk writes bypass signals: refresh derived state once
+        search.save_index(search.build_index())
+        search.reset_index()
+        facets.invalidate()
+        autocomplete.invalidate()
+        catalog_cache.bump_catalog_version()
+        products_bulk_updated.send(sender=Product, product_ids=None)
+
+        elapsed = time.monotonic() - started
+        stats = importer.stats
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats["rows"]} rows in {elapsed:.2f}s: '
+            f'{stats["products_created"]} products created, {stats["products_updated"]} updated, '
+            f'{stats["variants_created"]} variants created, {stats["variants_updated"]} updated, '
+            f'{stats["images_created"]} images, {stats["errors"]} invalid rows'
+        ))
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    def collect(self, pending, done):
+        for future in done:
+            image_id = pending.pop(future)
+            try:
+                images.store_renditions(image_id, future.result(), bump=False)
+            except Exception as e:
+                self.stderr.write(f'Image {image_id}: {str(e)}')
+
+    def report(self, stats, rows_at_start, started):
+        elapsed = time.monotonic() - started
+        rows = stats['rows'] - rows_at_start
+        self.stdout.write(f'{stats["rows"]} rows ({rows / elapsed if elapsed else 0:.0f} rows/s)')
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from products.models import Product, Review
+
+RATING_FIELDS = ['rating_sum', 'review_count'] + [f'rating_{i}_count' for i in range(1, 6)]
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored rating aggregates on every product from the Review table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # One grouped query for every product that has reviews
+        aggregates = Review.objects.values('product_id').annotate(
+            rating_sum=Sum('rating'),
+            review_count=Count('id'),
+            **{f'rating_{i}_count': Count('id', filter=Q(rating=i)) for i in range(1, 6)}
+        )
+        by_product = {row.pop('product_id'): row for row in aggregates}
+
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        with transaction.atomic():
+            for start in range(0, len(product_ids), batch_size):
+                batch = []
+                for product_id in product_ids[start:start + batch_size]:
+                    values = by_product.get(product_id, {})
+                    batch.append(Product(id=product_id, **{
+                        field: values.get(field) or 0 for field in RATING_FIELDS
+                    }))
+                Product.objects.bulk_update(batch, RATING_FIELDS)
+
+        updated = len(product_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} products'))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index from the database and write it to SEARCH_INDEX_PATH'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        index = search.build_index()
+        search.save_index(index)
+        search.reset_index()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index)} products ({len(index.postings)} terms) in {elapsed:.2f}s'
+        ))
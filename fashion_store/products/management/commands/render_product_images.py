@@ -0,0 +1,36 @@
+import time
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products import images
+from products.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Render missing or stale image renditions using the image process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render images that already have renditions')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        media_root = str(settings.MEDIA_ROOT)
+        pending = [
+            (image_id, name) for image_id, name, renditions in
+            ProductImage.objects.exclude(image='').values_list('id', 'image', 'renditions').iterator()
+            if options['all'] or (renditions or {}).get('source') != name
+        ]
+
+        executor = images.get_executor()
+        futures = {executor.submit(images.render_renditions, media_root, name): image_id for image_id, name in pending}
+        rendered = 0
+        for future in as_completed(futures):
+            try:
+                images.store_renditions(futures[future], future.result())
+                rendered += 1
+            except Exception as e:
+                self.stderr.write(f'Image {futures[future]}: {str(e)}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} of {len(pending)} images in {elapsed:.2f}s'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products import autocomplete, catalog_cache, trending
+
+
+class Command(BaseCommand):
+    help = 'Fold new orders and reviews into the time-decayed trending scores (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Discard stored scores and replay all history')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        items, reviews = trending.update_trending_scores(full=options['full'])
+        # The trending endpoint payload is cached per catalog version
+        catalog_cache.bump_catalog_version()
+        # Suggestions are ranked by the scores
+        autocomplete.invalidate()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Folded in {items} order items and {reviews} reviews in {elapsed:.2f}s'
+        ))
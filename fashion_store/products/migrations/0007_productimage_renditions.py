@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_productimage_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='style_code',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:45
+
+from django.db import migrations, models
+from django.db.models import Case, F, When
+
+
+def backfill_effective_price(apps, schema_editor):
+    # Product.current_price as of this migration; the live helper may change
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(effective_price=Case(
+        When(discount_price__gt=0, then=F('discount_price')),
+        default=F('price'),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_review_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_effective_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'category', 'gender', '-created_at'], name='product_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'is_featured'], name='product_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'effective_price'], name='product_price_idx'),
+        ),
+    ]
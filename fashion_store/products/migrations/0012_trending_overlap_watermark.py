@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_rating_aggregates_not_editable'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='trendingstate',
+            name='last_order_item_id',
+        ),
+        migrations.RemoveField(
+            model_name='trendingstate',
+            name='last_review_id',
+        ),
+        migrations.AddField(
+            model_name='trendingstate',
+            name='recent_order_item_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='trendingstate',
+            name='recent_review_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='trendingstate',
+            name='recent_tracking_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
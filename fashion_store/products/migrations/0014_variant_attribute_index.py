@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=models.Index(fields=['product', 'size', 'color', 'stock_quantity'], name='variant_attribute_idx'),
+        ),
+    ]
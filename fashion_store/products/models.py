@@ -1,15 +1,64 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import GreaterThan
 from django.contrib.auth import get_user_model
-from PIL import Image
 
 User = get_user_model()
 
+PRICE_FIELDS = ('price', 'discount_price')
+
+def effective_price_expression(price=None, discount_price=None):
+    """
+    SQL for Product.current_price: the discount price when set and non-zero,
+    else the list price. Arguments override the stored columns, so an UPDATE
+    can compute the new value from the values it is setting.
+    """
+    price = F('price') if price is None else price
+    discount_price = F('discount_price') if discount_price is None else discount_price
+    price, discount_price = (
+        value if hasattr(value, 'resolve_expression') else Value(value) for value in (price, discount_price)
+    )
+    return Case(
+        When(GreaterThan(discount_price, 0), then=discount_price),
+        default=price,
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Keeps effective_price in step with price and discount_price on bulk writes
+    """
+
+    def update(self, **kwargs):
+        if any(field in kwargs for field in PRICE_FIELDS) and 'effective_price' not in kwargs:
+            overrides = {field: kwargs[field] for field in PRICE_FIELDS if field in kwargs}
+            # Some backends can hold NULL as a plain value only
+            if overrides.get('discount_price', 0) is None:
+                overrides['discount_price'] = Value(None, output_field=models.DecimalField())
+            kwargs['effective_price'] = effective_price_expression(**overrides)
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.effective_price = obj.current_price
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if any(field in fields for field in PRICE_FIELDS) and 'effective_price' not in fields:
+            for obj in objs:
+                obj.effective_price = obj.current_price
+            fields = list(fields) + ['effective_price']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -33,39 +82,88 @@ class Product(models.Model):
     gender = models.CharField(max_length=10, choices=GENDER_CHOICES)
     brand = models.CharField(max_length=100, blank=True)
     material = models.CharField(max_length=100, blank=True)
+    # Supplier style code, the key catalog imports upsert products on
+    style_code = models.CharField(max_length=100, unique=True, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # current_price stored so it can be filtered and sorted on; kept by save() and ProductQuerySet
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+
+    # Rating aggregates, maintained by Review.save and the review post_delete signal
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        # Match the storefront's list, featured and price-range queries. Listings
+        # are paginated newest first with the id as tiebreaker (see
+        # fashion_store/pagination.py), so both listing indexes end with it
+        indexes = [
+            models.Index(fields=['is_active', '-created_at', '-id'], name='product_newest_idx'),
+            models.Index(fields=['is_active', 'category', 'gender', '-created_at', '-id'], name='product_listing_idx'),
+            models.Index(fields=['is_active', 'is_featured'], name='product_featured_idx'),
+            models.Index(fields=['is_active', 'effective_price'], name='product_price_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.effective_price = self.current_price
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and any(field in update_fields for field in PRICE_FIELDS):
+            kwargs['update_fields'] = set(update_fields) | {'effective_price'}
+        super().save(*args, **kwargs)
+
     @property
     def current_price(self):
         return self.discount_price if self.discount_price else self.price
 
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
+        if self.review_count:
+            return round(self.rating_sum / self.review_count, 2)
         return 0
 
+    @property
+    def rating_histogram(self):
+        return {str(i): getattr(self, f'rating_{i}_count') for i in range(1, 6)}
+
+    @classmethod
+    def apply_rating_delta(cls, product_id, rating, delta):
+        """
+        Add (delta=1) or remove (delta=-1) a single rating from the stored aggregates
+        """
+        cls.objects.filter(id=product_id).update(**{
+            'rating_sum': F('rating_sum') + rating * delta,
+            'review_count': F('review_count') + delta,
+            f'rating_{rating}_count': F(f'rating_{rating}_count') + delta,
+        })
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
     alt_text = models.CharField(max_length=200, blank=True)
     is_primary = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Resized copies written by products.images, keyed by rendition and format
+    renditions = models.JSONField(default=dict, blank=True)
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        # Resize image
-        img = Image.open(self.image.path)
-        if img.height > 800 or img.width > 800:
-            output_size = (800, 800)
-            img.thumbnail(output_size)
-            img.save(self.image.path)
+        # Render sizes in the background once the upload is committed
+        if self.image and self.renditions.get('source') != self.image.name:
+            from .images import schedule_renditions
+            image_id, source_name = self.id, self.image.name
+            transaction.on_commit(lambda: schedule_renditions(image_id, source_name))
 
 class ProductVariant(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants')
@@ -73,9 +171,14 @@ class ProductVariant(models.Model):
     color = models.CharField(max_length=50)
     stock_quantity = models.PositiveIntegerField()
     sku = models.CharField(max_length=50, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('product', 'size', 'color')
+        # Covers the listing's size/color/in-stock semi-join, stock included
+        indexes = [
+            models.Index(fields=['product', 'size', 'color', 'stock_quantity'], name='variant_attribute_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.size} - {self.color}"
@@ -84,15 +187,102 @@ class ProductVariant(models.Model):
     def is_in_stock(self):
         return self.stock_quantity > 0
 
+    @property
+    def indexed_attributes(self):
+        # What the facet index, search index and cart payloads know about this variant
+        return (self.product_id, self.size, self.color, self.is_in_stock)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(field in instance.__dict__ for field in ('product_id', 'size', 'color', 'stock_quantity')):
+            instance._stored_attributes = instance.indexed_attributes
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._stored_attributes = self.indexed_attributes
+
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     rating = models.PositiveIntegerField(choices=[(i, i) for i in range(1, 6)])
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('product', 'user')
+        # Serve the paginated review sorts and the detail payload's ETag
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='review_product_created_idx'),
+            models.Index(fields=['product', 'rating', 'created_at'], name='review_product_rating_idx'),
+            models.Index(fields=['product', 'updated_at'], name='review_product_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.product.name} - {self.rating}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so edits can move the product aggregates
+        instance._stored_rating = instance.__dict__.get('rating')
+        instance._stored_product_id = instance.__dict__.get('product_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            stored_rating = getattr(self, '_stored_rating', None)
+            stored_product_id = getattr(self, '_stored_product_id', None)
+            if not is_new:
+                if stored_rating is None:
+                    # Rating was not loaded; rebuild_rating_aggregates corrects any drift
+                    return
+                if stored_rating == self.rating and stored_product_id == self.product_id:
+                    return
+                Product.apply_rating_delta(stored_product_id, stored_rating, -1)
+            Product.apply_rating_delta(self.product_id, self.rating, 1)
+        self._stored_rating = self.rating
+        self._stored_product_id = self.product_id
+
+class TrendingScore(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField(default=0)  # time-decayed as of TrendingState.scored_at
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'], name='trending_score_idx')]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.score:.3f}"
+
+class TrendingState(models.Model):
+    """
+    Single row recording how far update_trending_scores has folded in
+    """
+    scored_at = models.DateTimeField(blank=True, null=True)
+    # Ids already folded in from the overlap window before scored_at (see products/trending.py)
+    recent_order_item_ids = models.JSONField(default=list, blank=True)
+    recent_review_ids = models.JSONField(default=list, blank=True)
+    recent_tracking_ids = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return f"Trending scored at {self.scored_at}"
+
+
+class ProductRecommendation(models.Model):
+    """
+    Top-K co-purchase neighbours per product, rebuilt by build_recommendations
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_for')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('product', 'rank')
 
     def __str__(self):
-        return f"{self.user.username} - {self.product.name} - {self.rating}"
\ No newline at end of file
+        return f"{self.product_id} -> {self.recommended_id} ({self.score:.3f})"
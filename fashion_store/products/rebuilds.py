@@ -0,0 +1,61 @@
+"""
+Rebuilding the in-process indexes (facets, autocomplete) off the request path.
+
+A process without an index builds one in the first request that needs it,
+since there is nothing to serve in the meantime. After that, an out-of-date
+index keeps being served while a background thread builds its replacement,
+and the new one is swapped in when it is done, so catalog writes never put a
+full rebuild on a request. With INDEX_REBUILD_IN_BACKGROUND off, stale indexes
+are rebuilt inline instead (the test runner does this, since test data sits
+in a transaction that a rebuild thread cannot see).
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class IndexHolder:
+    def __init__(self, name):
+        self.name = name
+        self.index = None
+        self.building = False
+        self.lock = threading.Lock()
+
+    def get(self, is_current, build):
+        """
+        The index to serve. is_current(index) says whether an index is up to
+        date; build() makes a new one.
+        """
+        with self.lock:
+            index = self.index
+            if index is not None and is_current(index):
+                return index
+            if index is None or not getattr(settings, 'INDEX_REBUILD_IN_BACKGROUND', True):
+                self.index = build()
+                return self.index
+            if self.building:
+                return index
+            self.building = True
+        threading.Thread(target=self.rebuild, args=(build,), name=f'{self.name}-rebuild', daemon=True).start()
+        return index
+
+    def rebuild(self, build):
+        try:
+            index = build()
+            with self.lock:
+                self.index = index
+        except Exception:
+            logger.exception(f'Failed to rebuild the {self.name} index')
+        finally:
+            with self.lock:
+                self.building = False
+            # The thread's own connection would otherwise stay open
+            connection.close()
+
+    def reset(self):
+        with self.lock:
+            self.index = None
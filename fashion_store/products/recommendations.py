@@ -0,0 +1,121 @@
+"""
+Item-to-item co-purchase recommendations.
+
+Orders form a binary order x product matrix A. The co-occurrence matrix
+C = A^T A is built sparsely by expanding every basket into its product pairs
+and counting the encoded pairs with np.unique. Cosine similarity
+C[a, b] / sqrt(n_a * n_b) is then cut to the top K neighbours per product
+and written to ProductRecommendation, which serving reads with one indexed
+lookup.
+"""
+import numpy as np
+from django.db import transaction
+
+from .models import Product, ProductRecommendation
+
+DEFAULT_TOP_K = 12
+# Very large baskets (bulk or B2B orders) add quadratic pairs and little signal
+DEFAULT_MAX_BASKET = 50
+
+
+def load_baskets():
+    """
+    Distinct (order index, product index) pairs as int arrays plus the
+    product id for each product index
+    """
+    from orders.models import OrderItem
+
+    rows = OrderItem.objects.exclude(order__status__in=('cancelled', 'refunded')).values_list(
+        'order_id', 'product_variant__product_id'
+    ).iterator(chunk_size=100000)
+    pairs = np.fromiter((value for row in rows for value in row), dtype=np.int64).reshape(-1, 2)
+    if not len(pairs):
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+
+    # Several variants of one product in an order count once
+    pairs = np.unique(pairs, axis=0)
+    _, orders = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, products = np.unique(pairs[:, 1], return_inverse=True)
+    return orders, products, product_ids
+
+
+def co_occurrence(orders, products, max_basket=DEFAULT_MAX_BASKET):
+    """
+    Sparse upper/lower entries of A^T A (without the diagonal) as
+    (left, right, count) arrays; orders must be sorted
+    """
+    group_starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(orders)])
+    keep = (group_sizes > 1) & (group_sizes <= max_basket)
+    group_starts, group_sizes = group_starts[keep], group_sizes[keep]
+    if not len(group_starts):
+        empty = np.empty(0, np.int64)
+        return empty, empty, empty
+
+    # Expand every basket of size k into its k * k (i, j) element pairs
+    element_group = np.repeat(np.arange(len(group_starts)), group_sizes)
+    elements = np.repeat(group_starts, group_sizes) + (
+        np.arange(group_sizes.sum()) - np.repeat(np.cumsum(group_sizes) - group_sizes, group_sizes)
+    )
+    per_element = group_sizes[element_group]
+    left = np.repeat(elements, per_element)
+    right = np.repeat(group_starts[element_group], per_element) + (
+        np.arange(per_element.sum()) - np.repeat(np.cumsum(per_element) - per_element, per_element)
+    )
+    distinct = left != right
+    left, right = products[left[distinct]], products[right[distinct]]
+
+    product_count = int(products.max()) + 1
+    keys, counts = np.unique(left * product_count + right, return_counts=True)
+    return keys // product_count, keys % product_count, counts
+
+
+def top_k_neighbours(orders, products, top_k=DEFAULT_TOP_K, max_basket=DEFAULT_MAX_BASKET):
+    """
+    (left, right, score) arrays holding each product's best top_k
+    neighbours, sorted by left then descending score
+    """
+    left, right, counts = co_occurrence(orders, products, max_basket)
+    if not len(left):
+        return left, right, counts.astype(np.float64)
+
+    baskets_per_product = np.bincount(products)
+    scores = counts / np.sqrt(baskets_per_product[left] * baskets_per_product[right])
+
+    # Ties broken by co-purchase count, then product index, for stable output
+    order = np.lexsort((right, -counts, -scores, left))
+    left, right, scores = left[order], right[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, left[1:] != left[:-1]])
+    rank = np.arange(len(left)) - np.repeat(starts, np.diff(np.r_[starts, len(left)]))
+    keep = rank < top_k
+    return left[keep], right[keep], scores[keep]
+
+
+def build_recommendations(top_k=DEFAULT_TOP_K, max_basket=DEFAULT_MAX_BASKET, batch_size=5000):
+    """
+    Replace the neighbour table from all order history. Returns rows written.
+    """
+    orders, products, product_ids = load_baskets()
+    left, right, scores = top_k_neighbours(orders, products, top_k, max_basket)
+
+    # Products deleted since they were ordered, checked in batches to bound each statement
+    existing = set()
+    ids = product_ids.tolist()
+    for start in range(0, len(ids), batch_size):
+        existing.update(Product.objects.filter(id__in=ids[start:start + batch_size]).values_list('id', flat=True))
+    rows = []
+    previous = None
+    rank = 0
+    for left_index, right_index, score in zip(left.tolist(), right.tolist(), scores.tolist()):
+        product_id, recommended_id = int(product_ids[left_index]), int(product_ids[right_index])
+        rank = rank + 1 if left_index == previous else 0
+        previous = left_index
+        if product_id in existing and recommended_id in existing:
+            rows.append(ProductRecommendation(
+                product_id=product_id, recommended_id=recommended_id, score=score, rank=rank
+            ))
+
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
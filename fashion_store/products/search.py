@@ -0,0 +1,342 @@
+"""
+In-process full-text search for the product catalog.
+
+Product text is tokenized, stemmed and kept in an inverted index that is
+scored with BM25. Full rebuilds pickle the index to SEARCH_INDEX_PATH, tagged
+with the position of a change log kept in Django's cache that they started
+from, and workers load that snapshot at startup. Product and variant saves
+only append the product id to the log (see products.signals and
+products.change_log); every worker replays new entries into its own index on
+its next search, so no request ever rewrites the file. A snapshot plus the log after its tag is always complete,
+so rebuilds racing each other cannot drop a change: whichever file wins, the
+log covers what it missed. Run rebuild_search_index periodically to keep the
+replay short.
+"""
+import logging
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from . import change_log
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'the', 'this', 'to', 'with', 'your',
+}
+
+# How much a token counts towards term frequency depending on where it appears
+FIELD_WEIGHTS = {
+    'name': 3,
+    'brand': 2,
+    'category': 2,
+    'colors': 1,
+    'description': 1,
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+CHANGE_SEQ_KEY = 'products:search:seq'
+CHANGE_KEY = 'products:search:change:{}'
+CHANGE_TIMEOUT = 24 * 60 * 60
+# Past this many pending changes a rebuild is cheaper than replaying them
+MAX_REPLAY = 500
+
+
+def stem(token):
+    """
+    Light suffix-stripping stemmer, enough to match plurals and verb forms
+    """
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith('ies') and len(token) > 4:
+        return token[:-3] + 'y'
+    if token.endswith('sses'):
+        return token[:-2]
+    if token.endswith('es') and token[-3] in 'xz':
+        return token[:-2]
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        token = token[:-1]
+    for suffix in ('ing', 'ed'):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            # running -> run, but keep dress, fall, buzz
+            if len(token) > 3 and token[-1] == token[-2] and token[-1] not in 'lsz':
+                token = token[:-1]
+            break
+    return token
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN_RE.findall((text or '').lower()) if token not in STOPWORDS]
+
+
+def product_document(product, colors=()):
+    """
+    Weighted term frequencies for a product and its variant colors
+    """
+    fields = {
+        'name': product.name,
+        'brand': product.brand,
+        'category': product.category.name if product.category_id else '',
+        'colors': ' '.join(colors),
+        'description': product.description,
+    }
+    terms = Counter()
+    for field, text in fields.items():
+        for token in tokenize(text):
+            terms[token] += FIELD_WEIGHTS[field]
+    return terms
+
+
+class SearchIndex:
+    def __init__(self, seq=0):
+        self.seq = seq  # last change log entry reflected in the index
+        self.synced_at = time.time()  # when every entry up to seq was in the log
+        self.postings = defaultdict(dict)  # term -> {product_id: tf}
+        self.documents = {}  # product_id -> Counter of terms
+        self.lengths = {}  # product_id -> document length
+        self.total_length = 0
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        state['postings'] = dict(state['postings'])
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('seq', 0)
+        state.setdefault('synced_at', 0)
+        self.__dict__.update(state)
+        self.postings = defaultdict(dict, self.postings)
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, product_id, terms):
+        with self.lock:
+            self.remove(product_id)
+            if not terms:
+                return
+            for term, tf in terms.items():
+                self.postings[term][product_id] = tf
+            length = sum(terms.values())
+            self.documents[product_id] = terms
+            self.lengths[product_id] = length
+            self.total_length += length
+
+    def remove(self, product_id):
+        with self.lock:
+            terms = self.documents.pop(product_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(product_id, None)
+                    if not postings:
+                        del self.postings[term]
+            self.total_length -= self.lengths.pop(product_id)
+
+    def search(self, query, limit=None):
+        """
+        Return [(product_id, score)] for products containing every query term,
+        best match first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self.lock:
+            postings = [self.postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+
+            total_docs = len(self.documents)
+            avg_length = self.total_length / total_docs
+            # Intersect starting from the rarest term
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for term_postings in postings[1:]:
+                candidates.intersection_update(term_postings)
+                if not candidates:
+                    return []
+
+            scores = dict.fromkeys(candidates, 0.0)
+            for term_postings in postings:
+                df = len(term_postings)
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                for product_id in candidates:
+                    tf = term_postings[product_id]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[product_id] / avg_length)
+                    scores[product_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+
+def index_path():
+    return getattr(settings, 'SEARCH_INDEX_PATH', settings.BASE_DIR / 'search_index.pkl')
+
+
+def current_seq():
+    return change_log.head(CHANGE_SEQ_KEY)
+
+
+def product_colors(product_ids=None):
+    from .models import ProductVariant
+
+    variants = ProductVariant.objects.all()
+    if product_ids is not None:
+        variants = variants.filter(product_id__in=product_ids)
+    colors = defaultdict(set)
+    for product_id, color in variants.values_list('product_id', 'color').iterator(chunk_size=5000):
+        colors[product_id].add(color)
+    return colors
+
+
+def build_index():
+    from .models import Product
+
+    # Read first: changes committed while building are replayed again, harmlessly
+    index = SearchIndex(current_seq())
+    colors = product_colors()
+    products = Product.objects.select_related('category').only(
+        'id', 'name', 'brand', 'description', 'category__name'
+    )
+    for product in products.iterator(chunk_size=2000):
+        index.add(product.id, product_document(product, sorted(colors.get(product.id, ()))))
+    return index
+
+
+def apply_changes(index, product_ids):
+    """
+    Bring the given products up to date in index, in two queries
+    """
+    from .models import Product
+
+    products = {
+        product.id: product for product in Product.objects.select_related('category').filter(id__in=product_ids)
+    }
+    colors = product_colors(list(products))
+    with index.lock:
+        for product_id in product_ids:
+            product = products.get(product_id)
+            if product is None:
+                index.remove(product_id)
+            else:
+                index.add(product_id, product_document(product, sorted(colors.get(product_id, ()))))
+
+
+def save_index(index, path=None):
+    path = str(path or index_path())
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    # Write then rename so workers never read a half-written file
+    with index.lock:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as handle:
+            pickle.dump(index, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return os.stat(path).st_mtime_ns
+
+
+def load_index(path=None):
+    with open(str(path or index_path()), 'rb') as handle:
+        return pickle.load(handle)
+
+
+_state = {'index': None, 'mtime': None}
+_state_lock = threading.Lock()
+
+
+def load_or_build(path):
+    """
+    (index, mtime) from the snapshot at path, or freshly built and saved
+    there when there is none
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    if mtime is not None:
+        try:
+            return load_index(path), mtime
+        except Exception as e:
+            logger.error(f"Failed to load search index from {path}: {str(e)}")
+    return rebuild(path)
+
+
+def rebuild(path):
+    index = build_index()
+    try:
+        return index, save_index(index, path)
+    except OSError as e:
+        logger.error(f"Failed to persist search index to {path}: {str(e)}")
+        return index, None
+
+
+def get_index():
+    """
+    Process-wide index: loaded from the snapshot (or built from the database
+    when there is none), reloaded when a rebuild has written a newer one, and
+    caught up with the change log
+    """
+    path = index_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    now = time.time()
+    seq = current_seq()
+
+    with _state_lock:
+        index = _state['index']
+        if index is None or (mtime is not None and mtime != _state['mtime']):
+            index, _state['mtime'] = load_or_build(path)
+        if seq > index.seq:
+            changes = change_log.replay(CHANGE_KEY, index.seq, seq, index.synced_at, CHANGE_TIMEOUT, MAX_REPLAY)
+            if changes is not None:
+                apply_changes(index, set(changes))
+                index.seq, index.synced_at = seq, now
+            else:
+                # Too far behind, or log entries may have expired
+                index, _state['mtime'] = rebuild(path)
+        elif seq < index.seq:
+            # The log was reset (cache cleared), so the tag means nothing
+            index, _state['mtime'] = rebuild(path)
+        _state['index'] = index
+        return index
+
+
+def reset_index():
+    with _state_lock:
+        _state['index'] = None
+        _state['mtime'] = None
+
+
+def record_change(product_id):
+    """
+    Append a product whose document may have changed to the shared log
+    (call on commit)
+    """
+    # None only when the counter was evicted; workers see the reset and rebuild
+    return change_log.append(CHANGE_SEQ_KEY, CHANGE_KEY, product_id, CHANGE_TIMEOUT)
+
+
+def search_product_ids(query, limit=None):
+    if limit is None:
+        limit = getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+    return [product_id for product_id, score in get_index().search(query, limit=limit)]
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
+from .images import srcset
 from .models import Category, Product, ProductImage, ProductVariant, Review
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -6,12 +8,16 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = '__all__'
 
+def build_url_for(request):
+    return request.build_absolute_uri if request else (lambda url: url)
+
 class ProductImageSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text', 'is_primary']
+        fields = ['id', 'image', 'srcset', 'alt_text', 'is_primary']
     
     def get_image(self, obj):
         request = self.context.get('request')
@@ -21,6 +27,9 @@ class ProductImageSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+    def get_srcset(self, obj):
+        return srcset(obj, build_url_for(self.context.get('request')))
+
 class ProductVariantSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductVariant
@@ -37,6 +46,7 @@ class ReviewSerializer(serializers.ModelSerializer):
 class ProductListSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     primary_image = serializers.SerializerMethodField()
+    primary_image_srcset = serializers.SerializerMethodField()
     current_price = serializers.ReadOnlyField()
     average_rating = serializers.ReadOnlyField()
 
@@ -45,39 +55,88 @@ class ProductListSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'price', 'discount_price', 'current_price',
             'category_name', 'gender', 'brand', 'primary_image',
-            'average_rating', 'is_featured'
+            'primary_image_srcset', 'average_rating', 'review_count', 'is_featured'
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load everything the list payload needs in a fixed number of queries
+        """
+        return queryset.select_related('category').prefetch_related(
+            Prefetch(
+                'images',
+                queryset=ProductImage.objects.order_by('-is_primary', 'id'),
+                to_attr='ordered_images'
+            )
+        )
+
+    def primary_image_instance(self, obj):
+        # Primary image first, then the oldest one
+        if not hasattr(obj, 'ordered_images'):
+            obj.ordered_images = list(obj.images.order_by('-is_primary', 'id')[:1])
+        return obj.ordered_images[0] if obj.ordered_images else None
+
     def get_primary_image(self, obj):
         request = self.context.get('request')
-        
-        # Try to get primary image first
-        primary_image = obj.images.filter(is_primary=True).first()
-        if primary_image:
-            if request:
-                return request.build_absolute_uri(primary_image.image.url)
-            return primary_image.image.url
-        
-        # Fallback to first image
-        first_image = obj.images.first()
-        if first_image:
+        image = self.primary_image_instance(obj)
+
+        if image:
             if request:
-                return request.build_absolute_uri(first_image.image.url)
-            return first_image.image.url
-        
+                return request.build_absolute_uri(image.image.url)
+            return image.image.url
+
         return None
 
+    def get_primary_image_srcset(self, obj):
+        image = self.primary_image_instance(obj)
+        if image:
+            return srcset(image, build_url_for(self.context.get('request')))
+        return {}
+
 class ProductDetailSerializer(serializers.ModelSerializer):
+    # Full review lists are paginated under products/<id>/reviews/
+    RECENT_REVIEWS = 3
+
     category = CategorySerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True, context={'request': None})
     variants = ProductVariantSerializer(many=True, read_only=True)
-    reviews = ReviewSerializer(many=True, read_only=True)
+    review_summary = serializers.SerializerMethodField()
     current_price = serializers.ReadOnlyField()
     average_rating = serializers.ReadOnlyField()
+    rating_histogram = serializers.ReadOnlyField()
 
     class Meta:
         model = Product
         fields = '__all__'
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """
+        Load everything the detail payload needs in a fixed number of queries,
+        however many products are serialized
+        """
+        return queryset.select_related('category').prefetch_related(
+            'images', 'variants',
+            # Sliced, so one windowed query fetches the newest few per product
+            Prefetch(
+                'reviews',
+                queryset=Review.objects.select_related('user').order_by('-created_at', '-id')[:cls.RECENT_REVIEWS],
+                to_attr='recent_reviews'
+            )
+        )
+
+    def get_review_summary(self, obj):
+        # Counts come from the stored aggregates; only the newest reviews are read
+        if not hasattr(obj, 'recent_reviews'):
+            obj.recent_reviews = list(obj.reviews.select_related('user').order_by('-created_at', '-id')[:self.RECENT_REVIEWS])
+        recent = obj.recent_reviews
+        return {
+            'count': obj.review_count,
+            'average': obj.average_rating,
+            'histogram': obj.rating_histogram,
+            'recent': ReviewSerializer(recent, many=True).data,
+        }
     
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -94,4 +153,35 @@ class ProductDetailSerializer(serializers.ModelSerializer):
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class ProductBulkFilterSerializer(serializers.Serializer):
+    category = serializers.IntegerField(required=False)
+    gender = serializers.ChoiceField(choices=Product.GENDER_CHOICES, required=False)
+    brand = serializers.CharField(required=False)
+    is_active = serializers.BooleanField(required=False)
+    is_featured = serializers.BooleanField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=10000)
+    filter = ProductBulkFilterSerializer(required=False)
+    # Percentage off the list price; null clears the discount
+    discount_percent = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=99.99, required=False, allow_null=True
+    )
+    stock_delta = serializers.IntegerField(required=False)
+    is_active = serializers.BooleanField(required=False)
+    is_featured = serializers.BooleanField(required=False)
+
+    OPERATIONS = ('discount_percent', 'stock_delta', 'is_active', 'is_featured')
+
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError('Provide either ids or filter')
+        if 'filter' in data and not data['filter']:
+            raise serializers.ValidationError('An empty filter would select every product')
+        if not any(operation in data for operation in self.OPERATIONS):
+            raise serializers.ValidationError(f'Provide at least one of: {", ".join(self.OPERATIONS)}')
+        return data
@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from . import autocomplete, catalog_cache, facets, search
+from .models import Category, Product, ProductImage, ProductVariant, Review
+
+# Sent after queryset-level writes that skip model signals, with the affected
+# product_ids (None for "possibly all")
+products_bulk_updated = Signal()
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_aggregates(sender, instance, **kwargs):
+    # Runs inside the deletion transaction, including cascades from Product/User
+    rating = getattr(instance, '_stored_rating', None) or instance.rating
+    product_id = getattr(instance, '_stored_product_id', None) or instance.product_id
+    Product.apply_rating_delta(product_id, rating, -1)
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    product_id = instance.id
+    transaction.on_commit(lambda: search.record_change(product_id))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    product_id = instance.id
+    transaction.on_commit(lambda: search.record_change(product_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def record_product_suggestion(sender, instance, **kwargs):
+    product_id = instance.id
+    transaction.on_commit(lambda: autocomplete.record_change('product', product_id))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def record_category_suggestion(sender, instance, **kwargs):
+    category_id = instance.id
+    transaction.on_commit(lambda: autocomplete.record_change('category', category_id))
+
+
+def variant_attributes_changed(instance):
+    # Stock moving between two positive values changes neither index
+    return getattr(instance, '_stored_attributes', None) != instance.indexed_attributes
+
+
+def reindex_variant_product(instance):
+    # Variant colors are part of the product search document
+    product_id = instance.product_id
+    transaction.on_commit(lambda: search.record_change(product_id))
+
+
+@receiver(post_save, sender=ProductVariant)
+def index_saved_variant(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_attributes', None)
+    if stored is None or (stored[0], stored[2]) != (instance.product_id, instance.color):
+        reindex_variant_product(instance)
+
+
+@receiver(post_delete, sender=ProductVariant)
+def index_deleted_variant(sender, instance, **kwargs):
+    reindex_variant_product(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=ProductVariant)
+def invalidate_facets(sender, **kwargs):
+    transaction.on_commit(facets.invalidate)
+
+
+@receiver(post_save, sender=ProductVariant)
+def invalidate_facets_for_variant(sender, instance, **kwargs):
+    if variant_attributes_changed(instance):
+        transaction.on_commit(facets.invalidate)
+
+
+# Not variants: no cached catalog payload includes them, so stock moves from
+# orders and restocks leave the cache alone
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def bump_catalog_version(sender, **kwargs):
+    transaction.on_commit(catalog_cache.bump_catalog_version)
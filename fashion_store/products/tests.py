@@ -1,3 +1,1165 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Now
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from cart.models import Cart, CartItem
+from fashion_store.pagination import KeysetPagination
+from orders.models import Order, OrderItem, OrderTracking
+from orders.placement import place_order
+
+from . import (
+    autocomplete, bulk, catalog_cache, catalog_import, change_log, facets, feeds, image_cache, images, rebuilds,
+    recommendations, search, trending
+)
+from .models import Category, Product, ProductImage, ProductRecommendation, ProductVariant, Review, TrendingScore
+from .serializers import ProductDetailSerializer
+from .signals import products_bulk_updated
+from .views import ProductListView
+
+User = get_user_model()
+
+
+def make_user(username):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345')
+
+
+def make_product(category, **kwargs):
+    defaults = {
+        'name': 'Test Shirt',
+        'description': 'A plain cotton shirt',
+        'category': category,
+        'price': '100.00',
+        'gender': 'men',
+        'brand': 'Acme',
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+def make_order(user, lines, status='pending'):
+    order = Order.objects.create(
+        user=user, status=status, shipping_name='Buyer', shipping_email='buyer@example.com',
+        shipping_phone='1', shipping_address_line1='Street', shipping_city='City', shipping_state='State',
+        shipping_postal_code='1', payment_method='cod', subtotal=0, total_amount=0
+    )
+    for variant, quantity in lines:
+        OrderItem.objects.create(order=order, product_variant=variant, quantity=quantity, price=1)
+    return order
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Shirts')
+        self.product = make_product(self.category)
+        self.users = [make_user(f'user{i}') for i in range(3)]
+
+    def test_review_create_edit_delete_keeps_aggregates(self):
+        first = Review.objects.create(product=self.product, user=self.users[0], rating=5, comment='Great')
+        Review.objects.create(product=self.product, user=self.users[1], rating=2, comment='Meh')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.review_count), (7, 2))
+        self.assertEqual(self.product.average_rating, 3.5)
+
+        first = Review.objects.get(id=first.id)
+        first.rating = 4
+        first.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_histogram, {'1': 0, '2': 1, '3': 0, '4': 1, '5': 0})
+
+        first.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.review_count), (2, 1))
+
+    def test_add_review_view_updates_aggregates(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.post(f'/api/products/{self.product.id}/reviews/', {'rating': 4, 'comment': 'Nice'})
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.review_count, self.product.rating_4_count), (4, 1, 1))
+
+    def test_admin_writes_cannot_set_aggregates(self):
+        Review.objects.create(product=self.product, user=self.users[0], rating=3, comment='Ok')
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass12345', is_staff=True
+        ))
+        response = client.patch(f'/api/products/{self.product.id}/update/', {'name': 'Renamed', 'rating_sum': 50, 'review_count': 10})
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.rating_sum, self.product.review_count), ('Renamed', 3, 1))
+
+    def test_rebuild_command_fixes_drift(self):
+        Review.objects.create(product=self.product, user=self.users[0], rating=3, comment='Ok')
+        Product.objects.filter(id=self.product.id).update(rating_sum=99, review_count=7, rating_3_count=0)
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.review_count, self.product.rating_3_count), (3, 1, 1))
+
+
+class ProductListQueryTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Shirts')
+        products = [make_product(self.category, name=f'Shirt {i}') for i in range(100)]
+        # bulk_create skips ProductImage.save, so no image file is needed
+        ProductImage.objects.bulk_create(
+            [ProductImage(product=product, image=f'products/extra{product.id}.jpg') for product in products] +
+            [ProductImage(product=product, image=f'products/main{product.id}.jpg', is_primary=True) for product in products]
+        )
+
+    def test_product_list_query_count_is_fixed(self):
+        facets.invalidate()
+        self.client.get('/api/products/')  # build the facet index
+        # Products and images prefetch, regardless of how many products are listed
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/products/', {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 100)
+        for product in response.json()['results']:
+            self.assertIn(f'/media/products/main{product["id"]}.jpg', product['primary_image'])
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(SEARCH_INDEX_PATH=f'{tmp_dir.name}/index.pkl')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        search.reset_index()
+        self.addCleanup(search.reset_index)
+
+        self.category = Category.objects.create(name='Dresses')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.summer = make_product(
+                self.category, name='Floral Summer Dress', brand='Bloom',
+                description='Light cotton dress for summer days', gender='women'
+            )
+            self.evening = make_product(
+                self.category, name='Evening Gown', brand='Noir',
+                description='Silk dress with a long train', gender='women'
+            )
+            make_product(
+                Category.objects.create(name='Footwear'), name='Running Shoes', description='Trainers for jogging'
+            )
+
+    def search(self, query, **params):
+        response = self.client.get('/api/products/', {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.json()['results']]
+
+    def test_stemming_and_bm25_ranking(self):
+        self.assertEqual(search.tokenize('Dresses running shirts'), ['dress', 'run', 'shirt'])
+        # Name matches outweigh description-only matches
+        self.assertEqual(self.search('dresses'), [self.summer.id, self.evening.id])
+        self.assertEqual(self.search('summer cotton'), [self.summer.id])
+        self.assertEqual(self.search('tuxedo'), [])
+
+    def test_signals_keep_index_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.create(product=self.evening, size='M', color='Burgundy', stock_quantity=3, sku='EG-M-BU')
+        self.assertEqual(self.search('burgundy'), [self.evening.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evening.delete()
+        self.assertEqual(self.search('dress'), [self.summer.id])
+
+    def test_workers_replay_changes_without_rewriting_the_snapshot(self):
+        self.assertEqual(self.search('gown'), [self.evening.id])
+        mtime = os.stat(search.index_path()).st_mtime_ns
+        with self.captureOnCommitCallbacks(execute=True):
+            self.evening.name = 'Evening Kaftan'
+            self.evening.save()
+            ProductVariant.objects.create(product=self.summer, size='S', color='Coral', stock_quantity=2, sku='FS-S-CO')
+        with self.assertNumQueries(2):
+            index = search.get_index()
+        self.assertEqual([pid for pid, score in index.search('kaftan coral')], [])
+        self.assertEqual([pid for pid, score in index.search('kaftan')], [self.evening.id])
+        self.assertEqual(os.stat(search.index_path()).st_mtime_ns, mtime)
+
+        # Another worker starts from the stale snapshot and catches up the same way
+        search.reset_index()
+        self.assertEqual(self.search('coral'), [self.summer.id])
+        self.assertEqual(self.search('gown'), [])
+        self.assertEqual(search.load_index().seq, search.get_index().seq - 2)
+
+    def test_reader_between_incr_and_add_does_not_rebuild(self):
+        index = search.get_index()
+        # A writer has taken the next number but not stored its entry yet
+        cache.incr(search.CHANGE_SEQ_KEY)
+        with self.assertNumQueries(0):
+            self.assertIs(search.get_index(), index)
+        self.assertEqual(cache.get(search.CHANGE_KEY.format(index.seq)), change_log.SKIPPED)
+
+        # A writer whose slot a reader claimed first moves on to the next number
+        self.evening.name = 'Evening Kaftan'
+        self.evening.save()
+        cache.add(search.CHANGE_KEY.format(index.seq + 1), change_log.SKIPPED)
+        self.assertEqual(search.record_change(self.evening.id), index.seq + 2)
+        self.assertEqual(self.search('kaftan'), [self.evening.id])
+
+    def test_index_is_persisted_and_reloaded(self):
+        self.search('dress')
+        search.reset_index()
+        index = search.load_index()
+        self.assertEqual(len(index), 3)
+        self.assertEqual([pid for pid, score in index.search('gown')], [self.evening.id])
+
+
+class FacetCountTests(TestCase):
+    def setUp(self):
+        facets.invalidate()
+        self.addCleanup(facets.invalidate)
+        shirts = Category.objects.create(name='Shirts')
+        dresses = Category.objects.create(name='Dresses')
+        self.oxford = make_product(shirts, name='Oxford', price='800.00', brand='Acme')
+        self.linen = make_product(shirts, name='Linen', price='1500.00', discount_price='450.00', brand='Breeze')
+        self.gown = make_product(dresses, name='Gown', price='6000.00', gender='women', brand='Acme')
+        ProductVariant.objects.bulk_create([
+            ProductVariant(product=self.oxford, size='M', color='Blue', stock_quantity=2, sku='OX-M-B'),
+            ProductVariant(product=self.oxford, size='L', color='Blue', stock_quantity=2, sku='OX-L-B'),
+            ProductVariant(product=self.linen, size='M', color='White', stock_quantity=2, sku='LI-M-W'),
+            ProductVariant(product=self.gown, size='S', color='Black', stock_quantity=2, sku='GO-S-B'),
+        ])
+
+    def test_facets_cover_filtered_set(self):
+        data = self.client.get('/api/products/', {'with_count': 'true'}).json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['facets']['brand'], [{'value': 'Acme', 'count': 2}, {'value': 'Breeze', 'count': 1}])
+        # Variants sharing a color count the product once
+        self.assertIn({'value': 'Blue', 'count': 1}, data['facets']['color'])
+        self.assertEqual(data['facets']['price'], [
+            {'min': 0, 'max': 500, 'count': 1},
+            {'min': 500, 'max': 1000, 'count': 1},
+            {'min': 5000, 'max': None, 'count': 1},
+        ])
+
+        data = self.client.get('/api/products/', {'gender': 'men'}).json()
+        self.assertNotIn('count', data)
+        self.assertEqual([entry['label'] for entry in data['facets']['category']], ['Shirts'])
+        self.assertEqual(data['facets']['size'], [{'value': 'M', 'count': 2}, {'value': 'L', 'count': 1}])
+
+    def test_indexed_filters_count_from_bitsets(self):
+        facets.get_index()
+        # The page and its images; no query walks the matching set
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/products/', {'size': 'M', 'in_stock': 'true', 'page_size': 1}).json()
+        self.assertEqual(data['facets']['brand'], [{'value': 'Acme', 'count': 1}, {'value': 'Breeze', 'count': 1}])
+        with self.assertNumQueries(2):
+            data = self.client.get(data['next']).json()
+        self.assertEqual(data['facets']['size'], [{'value': 'M', 'count': 2}, {'value': 'L', 'count': 1}])
+
+        # A price range needs the ids, so only the first page counts it
+        data = self.client.get('/api/products/', {'max_price': '1000', 'page_size': 1}).json()
+        self.assertEqual(data['facets']['gender'], [{'value': 'men', 'count': 2}])
+        self.assertNotIn('facets', self.client.get(data['next']).json())
+
+    def test_sold_out_order_reaches_in_stock_facets(self):
+        def in_stock_colors():
+            return [entry['value'] for entry in self.client.get('/api/products/', {'in_stock': 'true'}).json()['facets']['color']]
+
+        self.assertIn('Black', in_stock_colors())
+        user = make_user('buyer')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product_variant=ProductVariant.objects.get(sku='GO-S-B'), quantity=2)
+        shipping = {
+            'shipping_name': 'Buyer', 'shipping_email': 'buyer@example.com', 'shipping_phone': '1',
+            'shipping_address_line1': 'Street', 'shipping_city': 'City', 'shipping_state': 'State',
+            'shipping_postal_code': '1',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(user, cart, shipping, 'cod')
+        self.assertNotIn('Black', in_stock_colors())
+
+    def test_variant_attribute_filters(self):
+        def ids(**params):
+            return sorted(product['id'] for product in self.client.get('/api/products/', params).json()['results'])
+
+        self.assertEqual(ids(size='M'), sorted([self.oxford.id, self.linen.id]))
+        # Size and color must match on the same variant
+        self.assertEqual(ids(size='L', color='White'), [])
+        self.assertEqual(ids(size='M', color='White'), [self.linen.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            variant = ProductVariant.objects.get(sku='LI-M-W')
+            variant.stock_quantity = 0
+            variant.save()
+        self.assertEqual(ids(size='M', in_stock='true'), [self.oxford.id])
+        self.assertEqual(ids(size='M'), sorted([self.oxford.id, self.linen.id]))
+
+    def test_variant_filters_stay_a_subquery(self):
+        # More matching products than SQLite allows bound parameters
+        shirts = Category.objects.get(name='Shirts')
+        products = Product.objects.bulk_create([
+            Product(name=f'Tee {i}', description='Tee', category=shirts, price='10.00', gender='men')
+            for i in range(1200)
+        ])
+        ProductVariant.objects.bulk_create([
+            ProductVariant(product=product, size='M', color='Grey', stock_quantity=1, sku=f'TEE{product.id}')
+            for product in products
+        ])
+        facets.invalidate()
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/products/', {'size': 'M', 'in_stock': 'true', 'with_count': 'true'}).json()
+        self.assertEqual(data['count'], 1202)
+        self.assertTrue(any('EXISTS' in query['sql'] for query in queries))
+        # No statement carries the matching ids as a literal list
+        self.assertLess(max(len(query['sql']) for query in queries), 3000)
+
+
+class IndexRebuildTests(SimpleTestCase):
+    @override_settings(INDEX_REBUILD_IN_BACKGROUND=True)
+    def test_stale_index_is_served_while_rebuilding(self):
+        holder = rebuilds.IndexHolder('test')
+        release = threading.Event()
+
+        def build(version):
+            def run():
+                release.wait(5)
+                return version
+            return run
+
+        self.assertEqual(holder.get(lambda index: index == 2, lambda: 1), 1)
+        # Stale: the old index comes back at once while version 2 builds
+        self.assertEqual(holder.get(lambda index: index == 2, build(2)), 1)
+        self.assertEqual(holder.get(lambda index: index == 2, build(2)), 1)
+        release.set()
+        for attempt in range(100):
+            if holder.get(lambda index: index == 2, build(2)) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(holder.index, 2)
+        self.assertFalse(holder.building)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Shirts')
+        # Repeated prices force the id tiebreaker to matter
+        self.products = [make_product(category, name=f'Shirt {i:02d}', price=f'{100 + i % 4}.00') for i in range(11)]
+
+    def walk(self, **params):
+        pages = []
+        response = self.client.get('/api/products/', {'page_size': 3, **params}).json()
+        pages.append(response)
+        while response['next']:
+            response = self.client.get(response['next']).json()
+            pages.append(response)
+        return pages
+
+    def test_pages_follow_ordering_without_gaps(self):
+        pages = self.walk(ordering='price', with_count='true')
+        ids = [product['id'] for page in pages for product in page['results']]
+        expected = [p.id for p in sorted(self.products, key=lambda p: (p.price, p.id))]
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages[0]['previous'], None)
+        self.assertEqual(pages[-1]['count'], 11)
+
+        # Walking back from the last page returns the same pages
+        previous = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual(previous['results'], pages[-2]['results'])
+        first = self.client.get(pages[1]['previous']).json()
+        self.assertEqual(first['results'], pages[0]['results'])
+        self.assertEqual(first['previous'], None)
+
+    def test_default_newest_first_and_bad_cursor(self):
+        ids = [product['id'] for page in self.walk() for product in page['results']]
+        self.assertEqual(ids, [p.id for p in reversed(self.products)])
+        self.assertEqual(self.client.get('/api/products/', {'cursor': 'bm9wZQ'}).status_code, 404)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.category = Category.objects.create(name='Shirts')
+        self.product = make_product(self.category, is_featured=True)
+
+    def test_featured_served_from_cache_until_catalog_changes(self):
+        first = self.client.get('/api/products/featured/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/featured/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed Shirt'
+            self.product.save()
+        self.assertEqual(self.client.get('/api/products/featured/').json()[0]['name'], 'Renamed Shirt')
+
+    def test_stock_moves_keep_the_cache(self):
+        variant = ProductVariant.objects.create(product=self.product, size='M', color='Blue', stock_quantity=5, sku='CC-M')
+        self.client.get('/api/products/featured/')
+        version = catalog_cache.catalog_version()
+
+        user = make_user('buyer')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product_variant=variant, quantity=1)
+        shipping = {
+            'shipping_name': 'Buyer', 'shipping_email': 'buyer@example.com', 'shipping_phone': '1',
+            'shipping_address_line1': 'Street', 'shipping_city': 'City', 'shipping_state': 'State',
+            'shipping_postal_code': '1',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(user, cart, shipping, 'cod')
+            variant.refresh_from_db()
+            variant.stock_quantity += 10
+            variant.save()
+            bulk.apply_changes(bulk.select_products(ids=[self.product.id]), stock_delta=-2)
+        self.assertEqual(catalog_cache.catalog_version(), version)
+        with self.assertNumQueries(0):
+            self.client.get('/api/products/featured/')
+
+    def test_category_list_cached_and_invalidated(self):
+        self.assertEqual([c['name'] for c in self.client.get('/api/products/categories/').json()], ['Shirts'])
+        with self.assertNumQueries(0):
+            self.client.get('/api/products/categories/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Accessories')
+        names = [c['name'] for c in self.client.get('/api/products/categories/').json()]
+        self.assertEqual(names, ['Accessories', 'Shirts'])
+
+
+class ProductDetailConditionalTests(TestCase):
+    def setUp(self):
+        self.product = make_product(Category.objects.create(name='Shirts'))
+        self.variant = ProductVariant.objects.create(
+            product=self.product, size='M', color='Blue', stock_quantity=5, sku='TS-M-B'
+        )
+        self.url = f'/api/products/{self.product.id}/'
+
+    def test_if_none_match_short_circuits(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # Only the validator query runs on a match
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_child_changes_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.variant.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        Review.objects.create(product=self.product, user=make_user('reviewer'), rating=5, comment='Great')
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+    def test_category_changes_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        category = self.product.category
+        category.name = 'Tops'
+        category.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['category']['name'], 'Tops')
+
+    def test_missing_product_is_404(self):
+        self.assertEqual(self.client.get('/api/products/999999/').status_code, 404)
+
+
+@override_settings(TRENDING_HALF_LIFE_HOURS=24, TRENDING_REVIEW_WEIGHT=0)
+class TrendingScoreTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Shirts')
+        self.old_hit, self.new_hit, self.unsold = [make_product(category, name=name) for name in ('Old', 'New', 'Unsold')]
+        self.variants = {
+            product.id: ProductVariant.objects.create(product=product, size='M', color='Blue', stock_quantity=50, sku=f'SKU{product.id}')
+            for product in (self.old_hit, self.new_hit, self.unsold)
+        }
+        self.user = make_user('buyer')
+        self.now = timezone.now()
+
+    def order(self, product, quantity, age_hours, status='pending'):
+        order = make_order(self.user, [(self.variants[product.id], quantity)], status=status)
+        Order.objects.filter(id=order.id).update(created_at=self.now - timedelta(hours=age_hours))
+        return order
+
+    def cancel(self, order, age_hours, status='cancelled'):
+        Order.objects.filter(id=order.id).update(status=status)
+        entry = OrderTracking.objects.create(order=order, status=status, message='Cancelled')
+        OrderTracking.objects.filter(id=entry.id).update(created_at=self.now - timedelta(hours=age_hours))
+
+    def assert_matches_full_rebuild(self):
+        incremental = dict(TrendingScore.objects.filter(score__gt=0).values_list('product_id', 'score'))
+        trending.update_trending_scores(full=True, now=self.now)
+        full = dict(TrendingScore.objects.filter(score__gt=0).values_list('product_id', 'score'))
+        self.assertEqual(incremental.keys(), full.keys())
+        for product_id, score in full.items():
+            self.assertAlmostEqual(incremental[product_id], score)
+
+    def test_recent_sales_outrank_older_larger_sales(self):
+        self.order(self.old_hit, 6, age_hours=72)  # 6 units, three half-lives ago -> 0.75
+        self.order(self.new_hit, 1, age_hours=0)
+        self.order(self.unsold, 9, age_hours=0, status='cancelled')
+        trending.update_trending_scores(now=self.now)
+
+        self.assertEqual(trending.trending_products(), [self.new_hit.id, self.old_hit.id])
+        self.assertAlmostEqual(TrendingScore.objects.get(product=self.old_hit).score, 0.75)
+
+    def test_incremental_run_matches_full_rebuild(self):
+        self.order(self.old_hit, 4, age_hours=30)
+        trending.update_trending_scores(now=self.now - timedelta(hours=12))
+        self.order(self.new_hit, 2, age_hours=1)
+        self.assertEqual(trending.update_trending_scores(now=self.now), (1, 0))
+        self.assert_matches_full_rebuild()
+
+    def test_late_committed_order_is_counted_once(self):
+        self.order(self.old_hit, 4, age_hours=30)
+        trending.update_trending_scores(now=self.now - timedelta(minutes=10))
+        # Created before the last run but committed after it, with a higher id
+        self.order(self.new_hit, 2, age_hours=0.25)
+        self.assertEqual(trending.update_trending_scores(now=self.now - timedelta(minutes=5)), (1, 0))
+        self.assertEqual(trending.update_trending_scores(now=self.now), (0, 0))
+        self.assert_matches_full_rebuild()
+
+    def test_cancelled_order_is_taken_back_once(self):
+        self.order(self.old_hit, 4, age_hours=30)
+        refunded = self.order(self.new_hit, 2, age_hours=2)
+        trending.update_trending_scores(now=self.now - timedelta(hours=1))
+        self.cancel(refunded, age_hours=0.5)
+        trending.update_trending_scores(now=self.now - timedelta(minutes=5))
+        self.assertAlmostEqual(TrendingScore.objects.get(product=self.new_hit).score, 0)
+        # A second excluded status and later runs take nothing more
+        self.cancel(refunded, age_hours=0, status='refunded')
+        trending.update_trending_scores(now=self.now)
+        self.assertAlmostEqual(TrendingScore.objects.get(product=self.new_hit).score, 0)
+        self.assertEqual(trending.trending_products(), [self.old_hit.id])
+        self.assert_matches_full_rebuild()
+
+    def test_trending_endpoint_uses_scores(self):
+        self.order(self.old_hit, 3, age_hours=0)
+        trending.update_trending_scores(now=self.now)
+        cache.clear()
+        ids = [product['id'] for product in self.client.get('/api/products/trending/').json()]
+        self.assertEqual(ids[0], self.old_hit.id)
+        self.assertEqual(sorted(ids), sorted([self.old_hit.id, self.new_hit.id, self.unsold.id]))
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.shirts = Category.objects.create(name='Shirts')
+        self.shirt, self.tie, self.belt, self.socks = [
+            make_product(self.shirts, name=name) for name in ('Shirt', 'Tie', 'Belt', 'Socks')
+        ]
+        self.cold = make_product(self.shirts, name='Cold Start')
+        self.variants = {
+            product.id: ProductVariant.objects.create(product=product, size='M', color='Blue', stock_quantity=50, sku=f'SKU{product.id}')
+            for product in (self.shirt, self.tie, self.belt, self.socks, self.cold)
+        }
+        self.user = make_user('buyer')
+
+    def buy(self, *products):
+        make_order(self.user, [(self.variants[product.id], 1) for product in products])
+
+    def test_neighbours_ranked_by_cosine_similarity(self):
+        self.buy(self.shirt, self.tie)
+        self.buy(self.shirt, self.tie)
+        self.buy(self.shirt, self.belt)
+        self.buy(self.belt, self.socks)
+        self.buy(self.belt, self.socks)
+        self.assertEqual(recommendations.build_recommendations(top_k=2), 6)
+
+        neighbours = list(ProductRecommendation.objects.filter(product=self.shirt).order_by('rank')
+                          .values_list('recommended_id', flat=True))
+        self.assertEqual(neighbours, [self.tie.id, self.belt.id])
+        # tie: 2 / sqrt(3 * 2)
+        self.assertAlmostEqual(ProductRecommendation.objects.get(product=self.shirt, rank=0).score, 2 / 6 ** 0.5)
+
+        # Four ordered products checked two at a time; the result does not change
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(recommendations.build_recommendations(top_k=2, batch_size=2), 6)
+        table = connection.ops.quote_name(Product._meta.db_table)
+        product_queries = [query['sql'] for query in queries if f'FROM {table} WHERE' in query['sql']]
+        self.assertEqual(len(product_queries), 2)
+
+    def test_outfit_suggestions_use_neighbours_then_fall_back(self):
+        self.buy(self.shirt, self.socks)
+        recommendations.build_recommendations()
+
+        ids = [p['id'] for p in self.client.get(f'/api/products/{self.shirt.id}/outfit-suggestions/').json()]
+        self.assertEqual(ids[0], self.socks.id)
+        self.assertEqual(len(ids), 4)
+        self.assertNotIn(self.shirt.id, ids)
+
+        # No purchase history: same category and gender only
+        ids = [p['id'] for p in self.client.get(f'/api/products/{self.cold.id}/outfit-suggestions/').json()]
+        self.assertEqual(len(ids), 4)
+        self.assertNotIn(self.cold.id, ids)
+
+
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_RENDITIONS_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.product = make_product(Category.objects.create(name='Shirts'))
+
+    def upload(self, width, height):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile('shirt.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_renders_every_size_and_format(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=self.upload(1000, 500), is_primary=True)
+        image.refresh_from_db()
+
+        self.assertEqual(image.renditions['source'], image.image.name)
+        with Image.open(os.path.join(self.media_root, image.renditions['card']['webp'])) as card:
+            self.assertEqual(card.size, (400, 200))
+        # The original is kept and never upscaled
+        with Image.open(os.path.join(self.media_root, image.renditions['zoom']['jpeg'])) as zoom:
+            self.assertEqual(zoom.size, (1000, 500))
+        with Image.open(image.image.path) as original:
+            self.assertEqual(original.size, (1000, 500))
+
+    def test_payloads_expose_srcset_once_rendered(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            image = ProductImage.objects.create(product=self.product, image=self.upload(300, 300), is_primary=True)
+        client = APIClient()
+        product = client.get('/api/products/').json()['results'][0]
+        self.assertEqual(product['primary_image_srcset'], {})
+
+        for callback in callbacks:
+            callback()
+        cache.clear()
+        product = client.get('/api/products/').json()['results'][0]
+        self.assertEqual(set(product['primary_image_srcset']), set(images.RENDITIONS))
+        self.assertTrue(product['primary_image_srcset']['thumbnail']['webp'].endswith('_thumbnail.webp'))
+
+        detail = client.get(f'/api/products/{self.product.id}/').json()
+        self.assertEqual(detail['images'][0]['srcset'], product['primary_image_srcset'])
+
+
+class ResizedImageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, IMAGE_CACHE_DIR=self.cache_dir, IMAGE_RENDITIONS_ASYNC=False
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(image_cache.reset_usage)
+        image_cache.reset_usage()
+        os.makedirs(os.path.join(self.media_root, 'products'))
+        for name in ('a.png', 'b.png'):
+            Image.new('RGB', (1200, 600), 'blue').save(os.path.join(self.media_root, 'products', name))
+
+    def test_resizes_and_caches_variant(self):
+        response = self.client.get('/api/products/images/products/a.png?width=300&format=webp&quality=70')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as variant:
+            # Width snaps up to the next allowed size
+            self.assertEqual(variant.size, (320, 160))
+
+        again = self.client.get('/api/products/images/products/a.png?width=310&format=webp&quality=70')
+        self.assertEqual(again['ETag'], response['ETag'])
+        self.assertEqual(len(image_cache.scan_cache()), 1)
+        not_modified = self.client.get('/api/products/images/products/a.png?width=310&format=webp&quality=70',
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_only_versioned_urls_are_immutable(self):
+        url = '/api/products/images/products/a.png?width=300&format=png'
+        version = image_cache.source_version('products/a.png')
+        response = self.client.get(f'{url}&v={version}')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        # Replacing the upload changes the version; the old one is no longer cached for good
+        path = os.path.join(self.media_root, 'products', 'a.png')
+        Image.new('RGB', (600, 600), 'red').save(path)
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(image_cache.source_version('products/a.png'), version)
+        stale = self.client.get(f'{url}&v={version}')
+        self.assertNotIn('immutable', stale['Cache-Control'])
+        self.assertNotEqual(stale['ETag'], response['ETag'])
+
+    @override_settings(IMAGE_RENDITIONS_ASYNC=True)
+    def test_dead_image_workers_are_a_503_and_replaced(self):
+        executor = images.get_executor()
+        executor.submit(os.getpid).result()
+        for process in list(executor._processes.values()):
+            process.kill()
+            process.join()
+        response = self.client.get('/api/products/images/products/a.png?width=300&format=png')
+        self.assertEqual(response.status_code, 503)
+        self.assertIsNot(images.get_executor(), executor)
+        self.assertEqual(self.client.get('/api/products/images/products/a.png?width=300&format=png').status_code, 200)
+
+    def test_rejects_paths_outside_uploads(self):
+        self.assertEqual(self.client.get('/api/products/images/../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/api/products/images/products/missing.png').status_code, 404)
+        self.assertEqual(self.client.get('/api/products/images/products/a.png?format=gif').status_code, 400)
+
+    def test_evicts_least_recently_used(self):
+        old_path, _ = image_cache.get_variant('products/a.png', 800, 'png')
+        os.utime(old_path, (1, 1))
+        size = os.path.getsize(old_path)
+        with override_settings(IMAGE_CACHE_MAX_BYTES=size + 1):
+            new_path, _ = image_cache.get_variant('products/b.png', 640, 'png')
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(new_path))
+
+
+class CatalogImportTests(TestCase):
+    HEADER = 'style_code,name,category,price,discount_price,gender,brand,sku,size,color,stock_quantity\n'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        settings_override = override_settings(SEARCH_INDEX_PATH=os.path.join(self.tmp_dir, 'index.pkl'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(search.reset_index)
+        self.path = os.path.join(self.tmp_dir, 'feed.csv')
+
+    def write_feed(self, lines):
+        with open(self.path, 'w', newline='') as handle:
+            handle.write(self.HEADER + ''.join(lines))
+
+    def run_import(self, *args, **options):
+        call_command('import_catalog', self.path, *args, skip_images=True, stdout=StringIO(), stderr=StringIO(), **options)
+
+    def test_upserts_products_variants_and_categories(self):
+        Category.objects.create(name='Shirts')
+        self.write_feed([
+            'ST1,Oxford Shirt,Shirts,1200,,men,Acme,ST1-M-BL,M,Blue,5\n',
+            'ST1,Oxford Shirt,Shirts,1200,,men,Acme,ST1-L-BL,L,Blue,0\n',
+            'ST2,"Linen Dress, long",Dresses,2500,1999,women,Acme,ST2-S-WH,S,White,3\n',
+            'ST3,Broken,Dresses,abc,,women,Acme,ST3-S,S,Red,1\n',
+        ])
+        self.run_import(batch_size=2)
+
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(Category.objects.filter(name='Shirts').count(), 1)
+        dress = Product.objects.get(style_code='ST2')
+        self.assertEqual((dress.name, dress.category.name, str(dress.discount_price)), ('Linen Dress, long', 'Dresses', '1999.00'))
+        self.assertEqual(ProductVariant.objects.filter(product__style_code='ST1').count(), 2)
+        self.assertEqual([p['id'] for p in self.client.get('/api/products/?search=linen').json()['results']], [dress.id])
+
+        # Re-importing updates in place, keyed by style code and SKU
+        self.write_feed(['ST1,Oxford Shirt,Shirts,1100,,men,Acme,ST1-L-BL,L,Navy,7\n'])
+        self.run_import()
+        self.assertEqual(Product.objects.count(), 2)
+        variant = ProductVariant.objects.get(sku='ST1-L-BL')
+        self.assertEqual((variant.color, variant.stock_quantity, str(variant.product.price)), ('Navy', 7, '1100.00'))
+
+    def test_resume_skips_committed_rows(self):
+        self.write_feed([
+            'ST1,Shirt,Shirts,100,,men,Acme,SKU1,M,Blue,1\n',
+            'ST2,Tee,Shirts,100,,men,Acme,SKU2,M,Blue,1\n',
+        ])
+        (first_row, first_end), = list(catalog_import.read_rows(self.path, 'csv'))[:1]
+        catalog_import.save_checkpoint(self.path + '.checkpoint', self.path, first_end, {'rows': 1})
+
+        self.run_import(resume=True)
+        self.assertEqual(list(ProductVariant.objects.values_list('sku', flat=True)), ['SKU2'])
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+
+class CatalogFeedTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Shirts')
+        self.shirt = make_product(category, name='Shirt, "Oxford"')
+        self.hidden = make_product(category, name='Hidden', is_active=False)
+        ProductVariant.objects.create(product=self.shirt, size='M', color='Blue', stock_quantity=4, sku='SH-M')
+        ProductVariant.objects.create(product=self.shirt, size='L', color='Blue', stock_quantity=0, sku='SH-L')
+        ProductVariant.objects.create(product=self.hidden, size='M', color='Red', stock_quantity=1, sku='HI-M')
+        ProductImage.objects.bulk_create([ProductImage(product=self.shirt, image='products/shirt.jpg', is_primary=True)])
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass12345', is_staff=True
+        ))
+
+    def stream(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_feed_lists_active_variants(self):
+        response, body = self.stream('/api/products/feed.csv')
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual([row['sku'] for row in rows], ['SH-M', 'SH-L'])
+        self.assertEqual(rows[0]['name'], 'Shirt, "Oxford"')
+        self.assertEqual((rows[0]['in_stock'], rows[1]['in_stock']), ('true', 'false'))
+        self.assertEqual(rows[0]['image_url'], 'http://testserver/media/products/shirt.jpg')
+        self.assertIsNotNone(feeds.parse_since(response['X-Feed-Watermark']))
+
+    def test_incremental_jsonl_and_xml(self):
+        watermark = timezone.now()
+        ProductVariant.objects.filter(sku='SH-L').update(stock_quantity=9, updated_at=watermark + timedelta(seconds=1))
+        Product.objects.filter(id=self.hidden.id).update(updated_at=watermark + timedelta(seconds=1))
+
+        since = watermark.isoformat().replace('+', '%2B')
+        response, body = self.stream(f'/api/products/feed.jsonl?since={since}')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([(row['sku'], row['is_active']) for row in rows], [('SH-L', True), ('HI-M', False)])
+
+        response, body = self.stream(f'/api/products/feed.xml?since={since}')
+        self.assertEqual(body.count('<variant>'), 2)
+        self.assertIn('<name>Hidden</name>', body)
+
+    def test_watermark_overlaps_rows_committed_as_the_export_starts(self):
+        earlier = timezone.now() - timedelta(hours=1)
+        for model in (Product, ProductVariant, ProductImage):
+            model.objects.update(updated_at=earlier)
+        response, body = self.stream('/api/products/feed.csv')
+        watermark = feeds.parse_since(response['X-Feed-Watermark'])
+        self.assertLessEqual(watermark, timezone.now() - feeds.WATERMARK_OVERLAP)
+        # Stamped by a lagging app server, or by a transaction still open when the export read the clock
+        ProductVariant.objects.filter(sku='SH-L').update(updated_at=Now() - timedelta(minutes=1))
+
+        since = watermark.isoformat().replace('+', '%2B')
+        response, body = self.stream(f'/api/products/feed.jsonl?since={since}')
+        self.assertEqual([json.loads(line)['sku'] for line in body.splitlines()], ['SH-L'])
+
+    def test_feed_requires_staff_and_known_format(self):
+        self.assertEqual(self.client.get('/api/products/feed.pdf').status_code, 404)
+        self.assertEqual(self.client.get('/api/products/feed.csv?since=yesterday').status_code, 400)
+        self.client.force_authenticate(make_user('shopper'))
+        self.assertEqual(self.client.get('/api/products/feed.csv').status_code, 403)
+
+
+class ProductReviewsTests(TestCase):
+    def setUp(self):
+        self.product = make_product(Category.objects.create(name='Shirts'))
+        self.reviews = []
+        for i, rating in enumerate([3, 5, 1, 4, 5]):
+            review = Review.objects.create(product=self.product, user=make_user(f'reviewer{i}'), rating=rating, comment=f'Review {i}')
+            Review.objects.filter(id=review.id).update(created_at=timezone.now() - timedelta(days=10 - i))
+            self.reviews.append(review)
+
+    def collect(self, url):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(review['id'] for review in data['results'])
+            url = data['next']
+        return ids
+
+    def test_sorted_keyset_pages(self):
+        newest = self.collect(f'/api/products/{self.product.id}/reviews/?page_size=2')
+        self.assertEqual(newest, [review.id for review in reversed(self.reviews)])
+
+        highest = self.collect(f'/api/products/{self.product.id}/reviews/?sort=highest&page_size=2')
+        self.assertEqual(highest, [self.reviews[i].id for i in (4, 1, 3, 0, 2)])
+        lowest = self.collect(f'/api/products/{self.product.id}/reviews/?sort=lowest&page_size=2')
+        self.assertEqual(lowest, [self.reviews[i].id for i in (2, 0, 3, 4, 1)])
+
+        self.assertEqual(self.client.get(f'/api/products/{self.product.id}/reviews/?sort=best').status_code, 400)
+
+    def test_detail_carries_summary_only(self):
+        data = self.client.get(f'/api/products/{self.product.id}/').json()
+        self.assertNotIn('reviews', data)
+        summary = data['review_summary']
+        self.assertEqual((summary['count'], summary['average']), (5, 3.6))
+        self.assertEqual(summary['histogram']['5'], 2)
+        self.assertEqual([review['id'] for review in summary['recent']], [review.id for review in self.reviews[:1:-1]])
+
+    def test_summaries_for_many_products_take_fixed_queries(self):
+        for i in range(4):
+            product = make_product(self.product.category, name=f'Other {i}')
+            Review.objects.create(product=product, user=self.reviews[i].user, rating=4, comment='Fine')
+        products = ProductDetailSerializer.setup_eager_loading(Product.objects.order_by('id'))
+        # Products with categories, images, variants and the windowed recent reviews with users
+        with self.assertNumQueries(4):
+            data = ProductDetailSerializer(products, many=True).data
+        self.assertEqual([len(item['review_summary']['recent']) for item in data], [3, 1, 1, 1, 1])
+        self.assertEqual([review['id'] for review in data[0]['review_summary']['recent']],
+                         [review.id for review in self.reviews[:1:-1]])
+
+
+class EffectivePriceTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Shirts')
+
+    def test_kept_in_step_on_save_and_bulk_writes(self):
+        product = make_product(self.category, price='100.00', discount_price='80.00')
+        self.assertEqual(str(Product.objects.get(id=product.id).effective_price), '80.00')
+
+        Product.objects.filter(id=product.id).update(discount_price=None)
+        self.assertEqual(str(Product.objects.get(id=product.id).effective_price), '100.00')
+        Product.objects.filter(id=product.id).update(price=F('price') * 2)
+        self.assertEqual(str(Product.objects.get(id=product.id).effective_price), '200.00')
+
+        product.refresh_from_db()
+        product.discount_price = Decimal('150.00')
+        Product.objects.bulk_update([product], ['discount_price'])
+        self.assertEqual(str(Product.objects.get(id=product.id).effective_price), '150.00')
+
+    def test_price_filters_and_ordering_use_effective_price(self):
+        cheap = make_product(self.category, name='Sale', price='500.00', discount_price='50.00')
+        make_product(self.category, name='Full', price='100.00')
+        data = self.client.get('/api/products/?max_price=60').json()
+        self.assertEqual([p['id'] for p in data['results']], [cheap.id])
+        data = self.client.get('/api/products/?ordering=effective_price').json()
+        self.assertEqual(data['results'][0]['id'], cheap.id)
+
+
+class QueryPlanTests(TestCase):
+    """
+    The hot list queries, as the views and paginator build them, should be
+    answered from the composite indexes.
+
+    Every backend checks that filters and ordering line up with the index
+    columns. The plan itself is checked where boolean filters are compared to
+    a value, as the MySQL backend emits them; SQLite's tests a bare column,
+    which no index can serve.
+    """
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Shirts')
+        for i in range(20):
+            product = make_product(self.category, name=f'Product {i}', gender='men' if i % 2 else 'women')
+            ProductVariant.objects.create(product=product, size='M', color='Blue', stock_quantity=1, sku=f'QP{i}')
+        # Give the planner statistics, as a populated production database has
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def listing(self, params):
+        request = Request(APIRequestFactory().get('/api/products/', params))
+        view = ProductListView(request=request, kwargs={}, format_kwarg=None)
+        queryset = view.filter_queryset(view.get_queryset())
+        return queryset.order_by(*KeysetPagination().get_ordering(queryset))[:21]
+
+    def assert_served_by(self, queryset, index_name):
+        index = next(index for index in Product._meta.indexes if index.name == index_name)
+        equal = {child.lhs.target.name for child in queryset.query.where.children if child.lookup_name == 'exact'}
+        self.assertEqual(set(index.fields[:len(equal)]), equal)
+        ordering = [field.replace('pk', 'id') if field.lstrip('-') == 'pk' else field for field in queryset.query.order_by]
+        rest = list(index.fields[len(equal):])
+        self.assertEqual(ordering[:len(rest)], rest)
+        # Every index ends with the primary key ascending, declared or not
+        self.assertIn(ordering[len(rest):], ([], ['id']))
+
+        if f"{connection.ops.quote_name('is_active')} = " in str(queryset.query):
+            self.assertIn(index_name, queryset.explain())
+
+    def test_list_queries_use_composite_indexes(self):
+        queries = [
+            (self.listing({}), 'product_newest_idx'),
+            (self.listing({'category': self.category.id, 'gender': 'men'}), 'product_listing_idx'),
+            (self.listing({'min_price': '10', 'max_price': '500', 'ordering': 'effective_price'}), 'product_price_idx'),
+            (Product.objects.filter(is_featured=True, is_active=True)[:8], 'product_featured_idx'),
+        ]
+        for queryset, index_name in queries:
+            with self.subTest(index=index_name):
+                self.assert_served_by(queryset, index_name)
+
+        # Variant lookups are served by the unique (product, size, color) index
+        product = Product.objects.first()
+        unique_index = next(
+            name for name, info in connection.introspection.get_constraints(
+                connection.cursor(), ProductVariant._meta.db_table
+            ).items() if info['unique'] and info['columns'] == ['product_id', 'size', 'color']
+        )
+        self.assertIn(unique_index, ProductVariant.objects.filter(product=product, size='M', color='Blue').explain())
+
+    def test_stock_filters_read_only_the_attribute_index(self):
+        # With both size and color the unique index already pins a single row
+        for params in ({'in_stock': 'true'}, {'size': 'M', 'in_stock': 'true'}, {'color': 'Blue', 'in_stock': 'true'}):
+            with self.subTest(**params):
+                request = Request(APIRequestFactory().get('/api/products/', params))
+                view = ProductListView(request=request, kwargs={}, format_kwarg=None)
+                self.assertIn('variant_attribute_idx', view.filter_queryset(view.get_queryset()).explain())
+
+
+class ProductBulkUpdateTests(TestCase):
+    def setUp(self):
+        self.shirts = Category.objects.create(name='Shirts')
+        self.shoes = Category.objects.create(name='Shoes')
+        self.shirt = make_product(self.shirts, price='100.00')
+        self.polo = make_product(self.shirts, name='Polo', price='50.00', discount_price='45.00')
+        self.boot = make_product(self.shoes, name='Boot', price='200.00')
+        for product in (self.shirt, self.polo, self.boot):
+            ProductVariant.objects.create(product=product, size='M', color='Blue', stock_quantity=3, sku=f'BU{product.id}')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass12345', is_staff=True
+        ))
+
+    def post(self, payload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/products/bulk/', payload, format='json')
+
+    def test_filter_discount_and_stock_in_few_statements(self):
+        version = catalog_cache.catalog_version()
+        # Savepoint, selection, one UPDATE per table, release, then carts to refresh on commit
+        with self.assertNumQueries(6):
+            response = self.post({'filter': {'category': self.shirts.id}, 'discount_percent': '20', 'stock_delta': -5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'matched_products': 2, 'products_updated': 2, 'variants_updated': 2})
+
+        prices = dict(Product.objects.values_list('id', 'effective_price'))
+        self.assertEqual((str(prices[self.shirt.id]), str(prices[self.polo.id]), str(prices[self.boot.id])),
+                         ('80.00', '40.00', '200.00'))
+        stock = dict(ProductVariant.objects.values_list('product_id', 'stock_quantity'))
+        self.assertEqual((stock[self.shirt.id], stock[self.boot.id]), (0, 3))
+        self.assertNotEqual(catalog_cache.catalog_version(), version)
+
+    def test_negative_stock_delta_larger_than_stock_stops_at_zero(self):
+        ProductVariant.objects.filter(product=self.polo).update(stock_quantity=10)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post({'ids': [self.shirt.id, self.polo.id], 'stock_delta': -4})
+        self.assertEqual(response.json()['variants_updated'], 2)
+        stock = dict(ProductVariant.objects.values_list('product_id', 'stock_quantity'))
+        self.assertEqual((stock[self.shirt.id], stock[self.polo.id], stock[self.boot.id]), (0, 6, 3))
+        # Rows the delta would take below zero never compute stock_quantity + delta,
+        # which is out of range for MySQL's unsigned column
+        update = next(query['sql'] for query in queries if query['sql'].startswith('UPDATE') and 'products_productvariant' in query['sql'])
+        self.assertIn('CASE WHEN', update)
+        self.post({'ids': [self.polo.id], 'stock_delta': 2})
+        self.assertEqual(ProductVariant.objects.get(product=self.polo).stock_quantity, 8)
+
+    def test_selection_is_a_subquery_and_invalidated_once(self):
+        sent = []
+        receiver = lambda sender, product_ids, **kwargs: sent.append(product_ids)
+        products_bulk_updated.connect(receiver)
+        self.addCleanup(products_bulk_updated.disconnect, receiver)
+
+        payload = {'filter': {'is_active': True}, 'is_active': False, 'stock_delta': 1}
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/products/bulk/', payload, format='json')
+        self.assertEqual(response.json(), {'matched_products': 3, 'products_updated': 3, 'variants_updated': 3})
+        variants, products = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertIn('IN (SELECT', variants)
+        self.assertNotIn(' IN (', products)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(sorted(sent[0]), sorted([self.shirt.id, self.polo.id, self.boot.id]))
+
+        # Too many to name: receivers are told "possibly all"
+        self.addCleanup(setattr, bulk, 'MAX_SIGNALLED_IDS', bulk.MAX_SIGNALLED_IDS)
+        bulk.MAX_SIGNALLED_IDS = 2
+        response = self.post({'filter': {'is_active': False}, 'is_active': True})
+        self.assertEqual(response.json()['matched_products'], 3)
+        self.assertIsNone(sent[1])
+
+    def test_ids_toggle_and_clear_discount(self):
+        response = self.post({'ids': [self.polo.id, self.boot.id], 'discount_percent': None, 'is_featured': True})
+        self.assertEqual(response.json()['products_updated'], 2)
+        polo = Product.objects.get(id=self.polo.id)
+        self.assertEqual((polo.discount_price, str(polo.effective_price), polo.is_featured), (None, '50.00', True))
+
+    def test_validation_and_permissions(self):
+        self.assertEqual(self.post({'is_active': False}).status_code, 400)
+        self.assertEqual(self.post({'filter': {}, 'is_active': False}).status_code, 400)
+        self.assertEqual(self.post({'ids': [self.shirt.id]}).status_code, 400)
+        self.client.force_authenticate(make_user('shopper'))
+        self.assertEqual(self.post({'ids': [self.shirt.id], 'is_active': False}).status_code, 403)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete.invalidate()
+        self.shirts = Category.objects.create(name='Shirts')
+        self.shoes = Category.objects.create(name='Shoes')
+        self.oxford = make_product(self.shirts, name='Oxford Linen Shirt', brand='Shoreditch')
+        self.tee = make_product(self.shirts, name='Shibori Tee', brand='Acme')
+        self.boot = make_product(self.shoes, name='Chelsea Boot', brand='Acme')
+        TrendingScore.objects.create(product=self.tee, score=5)
+        TrendingScore.objects.create(product=self.boot, score=2)
+
+    def get(self, query, **params):
+        return self.client.get('/api/products/autocomplete/', {'q': query, **params}).json()
+
+    def test_word_start_prefixes_ranked_by_popularity(self):
+        data = self.get('sh')
+        self.assertEqual([product['name'] for product in data['products']], ['Shibori Tee', 'Oxford Linen Shirt'])
+        # Shirts holds the tee's score, Shoes only the boot's
+        self.assertEqual([category['name'] for category in data['categories']], ['Shirts', 'Shoes'])
+        self.assertEqual([brand['name'] for brand in data['brands']], ['Shoreditch'])
+        self.assertEqual([product['name'] for product in self.get('linen sh')['products']], ['Oxford Linen Shirt'])
+        self.assertEqual(self.get('s')['products'], [])
+        self.assertEqual(len(self.get('sh', limit=1)['products']), 1)
+
+    def test_saves_are_replayed_into_the_index(self):
+        self.assertEqual(len(self.get('sh')['products']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.oxford.name = 'Oxford Cotton Shirt'
+            self.oxford.save()
+            self.tee.is_active = False
+            self.tee.save()
+            make_product(self.shoes, name='Shearling Slipper', brand='Shoreditch')
+
+        # Replayed from the change log: one query for the changed products, no rebuild
+        with self.assertNumQueries(1):
+            data = self.get('sh')
+        self.assertEqual([product['name'] for product in data['products']], ['Shearling Slipper', 'Oxford Cotton Shirt'])
+        self.assertEqual(self.get('linen')['products'], [])
+        # Acme lost its only Sh- product but keeps the boot
+        self.assertEqual([brand['name'] for brand in self.get('ac')['brands']], ['Acme'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.boot.delete()
+            self.shoes.name = 'Footwear'
+            self.shoes.save()
+        self.assertEqual([category['name'] for category in self.get('foot')['categories']], ['Footwear'])
+        self.assertEqual(self.get('ac')['brands'], [])
+
+    def test_reader_between_incr_and_add_does_not_rebuild(self):
+        index = autocomplete.get_index()
+        # A writer has taken the next number but not stored its entry yet
+        cache.add(autocomplete.CHANGE_SEQ_KEY, 0)
+        cache.incr(autocomplete.CHANGE_SEQ_KEY)
+        with self.assertNumQueries(0):
+            self.assertIs(autocomplete.get_index(), index)
+        self.assertEqual(cache.get(autocomplete.CHANGE_KEY.format(index.seq)), change_log.SKIPPED)
+
+        # A writer whose slot a reader claimed first moves on to the next number
+        cache.add(autocomplete.CHANGE_KEY.format(index.seq + 1), change_log.SKIPPED)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.boot.name = 'Chelsea Shearling Boot'
+            self.boot.save()
+        self.assertEqual(change_log.head(autocomplete.CHANGE_SEQ_KEY), index.seq + 2)
+        self.assertEqual([product['name'] for product in self.get('shear')['products']], ['Chelsea Shearling Boot'])
+        self.assertIs(autocomplete.get_index(), index)
+
+    @override_settings(INDEX_REBUILD_IN_BACKGROUND=True)
+    def test_invalidate_keeps_serving_the_index_while_it_rebuilds(self):
+        index = autocomplete.get_index()
+        # A rebuild is already under way in another thread
+        autocomplete._holder.building = True
+        self.addCleanup(setattr, autocomplete._holder, 'building', False)
+        autocomplete.invalidate()
+        with self.assertNumQueries(0):
+            self.assertIs(autocomplete.get_index(), index)
 
-# Create your tests here.
@@ -0,0 +1,225 @@
+"""
+Sales-driven trending scores.
+
+Each sold unit contributes exp(-rate * age) to its product's score, with the
+rate set by TRENDING_HALF_LIFE_HOURS; new reviews add TRENDING_REVIEW_WEIGHT
+on the same decay. Scores are stored already decayed to the last run, so an
+incremental run only has to decay every stored score by one factor (a single
+UPDATE) and fold in the order items and reviews created since.
+
+"Since" is by timestamp, reaching TRENDING_OVERLAP_SECONDS back past the last
+run so rows whose transaction committed after that run are still picked up;
+the ids already folded in within the overlap are kept on TrendingState and
+skipped. An order cancelled or refunded after being folded in is taken back
+out when its first such OrderTracking entry appears. Status changes that skip
+OrderTracking (e.g. edits in the Django admin) and rows committing later than
+the overlap are only corrected by a --full run.
+"""
+import math
+from datetime import timedelta
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .models import Product, Review, TrendingScore, TrendingState
+
+EXCLUDED_ORDER_STATUSES = ('cancelled', 'refunded')
+CHUNK_SIZE = 100000
+# Taking a cancelled order back leaves rounding residue; anything below is zero
+SCORE_EPSILON = 1e-9
+
+
+def overlap():
+    return timedelta(seconds=getattr(settings, 'TRENDING_OVERLAP_SECONDS', 15 * 60))
+
+
+def decay_rate():
+    half_life_hours = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 72)
+    return math.log(2) / (half_life_hours * 3600)
+
+
+def decayed_totals(rows, now, rate, weight=1.0):
+    """
+    Sum weight * quantity * exp(-rate * age) per product over
+    (product_id, quantity, created_at) rows, one NumPy pass per chunk.
+    Returns (totals, rows_processed).
+    """
+    totals = {}
+    processed = 0
+    now_ts = now.timestamp()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return totals, processed
+        processed += len(chunk)
+        product_ids = np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk))
+        quantities = np.fromiter((row[1] for row in chunk), dtype=np.float64, count=len(chunk))
+        created = np.fromiter((row[2].timestamp() for row in chunk), dtype=np.float64, count=len(chunk))
+
+        contributions = weight * quantities * np.exp(-rate * np.maximum(now_ts - created, 0))
+        unique_ids, inverse = np.unique(product_ids, return_inverse=True)
+        sums = np.bincount(inverse, weights=contributions)
+        for product_id, value in zip(unique_ids.tolist(), sums.tolist()):
+            totals[product_id] = totals.get(product_id, 0.0) + value
+
+
+def new_rows(rows, seen, recent_since, recent):
+    """
+    (product_id, quantity, created_at) for the (id, product_id, quantity,
+    created_at) rows whose id is not in seen. Ids created after recent_since
+    are appended to recent, seen or not.
+    """
+    for row_id, product_id, quantity, created_at in rows:
+        if created_at > recent_since:
+            recent.append(row_id)
+        if row_id not in seen:
+            yield product_id, quantity, created_at
+
+
+def cancelled_totals(since, now, rate, counted_item_ids, seen, recent_since, recent):
+    """
+    Negative totals taking back orders that an earlier run folded in and
+    that have been cancelled or refunded since, found by their first such
+    OrderTracking entry. Bookkeeping of entry ids works as in new_rows.
+    """
+    from orders.models import OrderItem, OrderTracking
+
+    earlier = OrderTracking.objects.filter(order=OuterRef('order'), status__in=EXCLUDED_ORDER_STATUSES, id__lt=OuterRef('id'))
+    entries = OrderTracking.objects.filter(
+        status__in=EXCLUDED_ORDER_STATUSES, created_at__gt=since, created_at__lte=now
+    ).exclude(Exists(earlier)).values_list('id', 'order_id', 'created_at')
+    order_ids = []
+    for entry_id, order_id, created_at in entries:
+        if created_at > recent_since:
+            recent.append(entry_id)
+        if entry_id not in seen:
+            order_ids.append(order_id)
+    if not order_ids:
+        return {}
+
+    items = OrderItem.objects.filter(order_id__in=order_ids).values_list(
+        'id', 'product_variant__product_id', 'quantity', 'order__created_at'
+    )
+    # Orders inside the overlap were folded in only if their items were seen
+    folded = (
+        (product_id, quantity, created_at) for item_id, product_id, quantity, created_at in items
+        if created_at <= since or item_id in counted_item_ids
+    )
+    return decayed_totals(folded, now, rate, weight=-1.0)[0]
+
+
+def update_trending_scores(full=False, now=None):
+    """
+    Fold orders and reviews created since the last run into the stored
+    scores, and take back orders cancelled since. full=True discards the
+    scores and replays all history.
+    Returns (order_items_processed, reviews_processed).
+    """
+    from orders.models import OrderItem, OrderTracking
+
+    now = now or timezone.now()
+    rate = decay_rate()
+    review_weight = getattr(settings, 'TRENDING_REVIEW_WEIGHT', 0.5)
+    recent_since = now - overlap()
+
+    with transaction.atomic():
+        TrendingState.objects.get_or_create(pk=1)
+        state = TrendingState.objects.select_for_update().get(pk=1)
+
+        since = None
+        seen_items = seen_reviews = seen_entries = frozenset()
+        if full:
+            TrendingScore.objects.all().delete()
+        elif state.scored_at:
+            elapsed = max((now - state.scored_at).total_seconds(), 0)
+            TrendingScore.objects.update(score=F('score') * math.exp(-rate * elapsed))
+            since = state.scored_at - overlap()
+            seen_items = set(state.recent_order_item_ids)
+            seen_reviews = set(state.recent_review_ids)
+            seen_entries = set(state.recent_tracking_ids)
+
+        items = OrderItem.objects.filter(order__created_at__lte=now).exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+        reviews = Review.objects.filter(created_at__lte=now)
+        if since is not None:
+            items = items.filter(order__created_at__gt=since)
+            reviews = reviews.filter(created_at__gt=since)
+
+        recent_items, recent_reviews, recent_entries = [], [], []
+        totals, items_processed = decayed_totals(
+            new_rows(
+                items.values_list('id', 'product_variant__product_id', 'quantity', 'order__created_at')
+                .iterator(chunk_size=CHUNK_SIZE),
+                seen_items, recent_since, recent_items
+            ),
+            now, rate
+        )
+        review_totals, reviews_processed = decayed_totals(
+            new_rows(
+                ((review_id, product_id, 1, created_at) for review_id, product_id, created_at in
+                 reviews.values_list('id', 'product_id', 'created_at').iterator(chunk_size=CHUNK_SIZE)),
+                seen_reviews, recent_since, recent_reviews
+            ),
+            now, rate, weight=review_weight
+        )
+        for product_id, value in review_totals.items():
+            totals[product_id] = totals.get(product_id, 0.0) + value
+
+        if since is not None:
+            taken_back = cancelled_totals(since, now, rate, seen_items, seen_entries, recent_since, recent_entries)
+            for product_id, value in taken_back.items():
+                totals[product_id] = totals.get(product_id, 0.0) + value
+        else:
+            # A full run already left cancelled orders out; later runs must
+            # not take back the ones whose entries fall in the overlap
+            recent_entries = list(OrderTracking.objects.filter(
+                status__in=EXCLUDED_ORDER_STATUSES, created_at__gt=recent_since, created_at__lte=now
+            ).values_list('id', flat=True))
+
+        apply_totals(totals)
+
+        state.recent_order_item_ids = recent_items
+        state.recent_review_ids = recent_reviews
+        state.recent_tracking_ids = recent_entries
+        state.scored_at = now
+        state.save()
+
+    return items_processed, reviews_processed
+
+
+def apply_totals(totals, batch_size=1000):
+    if not totals:
+        return
+    product_ids = list(totals)
+    for start in range(0, len(product_ids), batch_size):
+        batch_ids = product_ids[start:start + batch_size]
+        existing = TrendingScore.objects.in_bulk(batch_ids)
+        updated = []
+        created = []
+        for product_id in batch_ids:
+            if product_id in existing:
+                score = existing[product_id]
+                score.score += totals[product_id]
+                if score.score < SCORE_EPSILON:
+                    score.score = 0.0
+                updated.append(score)
+            else:
+                created.append(TrendingScore(product_id=product_id, score=totals[product_id]))
+        TrendingScore.objects.bulk_update(updated, ['score'])
+        # Products deleted since the order was placed have no row to attach to
+        valid_ids = set(Product.objects.filter(id__in=[score.product_id for score in created]).values_list('id', flat=True))
+        TrendingScore.objects.bulk_create([score for score in created if score.product_id in valid_ids])
+
+
+def trending_products(limit=8):
+    """
+    Ids of active products by stored score, best first
+    """
+    return list(
+        TrendingScore.objects.filter(product__is_active=True, score__gt=0)
+        .order_by('-score', 'product_id').values_list('product_id', flat=True)[:limit]
+    )
@@ -8,8 +8,12 @@ urlpatterns = [
     path('create/', views.ProductCreateView.as_view(), name='product-create'),
     path('<int:pk>/update/', views.ProductUpdateView.as_view(), name='product-update'),
     path('<int:pk>/delete/', views.ProductDeleteView.as_view(), name='product-delete'),
+    path('bulk/', views.product_bulk_update_view, name='product-bulk-update'),
+    path('autocomplete/', views.autocomplete_view, name='product-autocomplete'),
     path('featured/', views.featured_products_view, name='featured-products'),
     path('trending/', views.trending_products_view, name='trending-products'),
-    path('<int:product_id>/reviews/', views.add_review_view, name='add-review'),
+    path('<int:product_id>/reviews/', views.product_reviews_view, name='product-reviews'),
     path('<int:product_id>/outfit-suggestions/', views.outfit_suggestions_view, name='outfit-suggestions'),
+    path('images/<path:name>', views.resized_image_view, name='resized-image'),
+    path('feed.<str:feed_format>', views.product_feed_view, name='product-feed'),
 ]
\ No newline at end of file
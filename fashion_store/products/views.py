@@ -1,67 +1,165 @@
 from rest_framework import generics, status, filters
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.db.models import Count, Exists, Max, OuterRef, Q, Subquery
 from django.core.paginator import Paginator
-from .models import Category, Product, ProductVariant, Review
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+import hashlib
+from fashion_store.pagination import KeysetPagination
+from . import autocomplete, bulk, catalog_cache, facets, feeds, image_cache, trending
+from .filters import IndexedSearchFilter
+from .models import Category, Product, ProductImage, ProductVariant, Review
 from .serializers import (
     CategorySerializer, ProductListSerializer, ProductDetailSerializer,
-    ProductCreateUpdateSerializer, ReviewSerializer
+    ProductCreateUpdateSerializer, ReviewSerializer, ProductBulkUpdateSerializer
 )
 
 class CategoryListView(generics.ListAPIView):
     queryset = Category.objects.filter(is_active=True).order_by('name')
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        return catalog_cache.cached_json_response(
+            request, 'categories', lambda: super(CategoryListView, self).list(request, *args, **kwargs).data
+        )
 
 class ProductListView(generics.ListAPIView):
     serializer_class = ProductListSerializer
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # IndexedSearchFilter runs last so it can apply relevance order when no ordering is requested
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, IndexedSearchFilter]
     filterset_fields = ['category', 'gender', 'brand']
-    search_fields = ['name', 'description', 'brand']
-    ordering_fields = ['price', 'created_at', 'name']
+    ordering_fields = ['price', 'effective_price', 'created_at', 'name']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True).select_related('category').prefetch_related('images', 'reviews')
+        queryset = ProductListSerializer.setup_eager_loading(Product.objects.filter(is_active=True))
         
-        # Price range filter
+        # Price range filter, on what the customer pays
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
         if min_price:
             try:
-                queryset = queryset.filter(price__gte=float(min_price))
+                queryset = queryset.filter(effective_price__gte=float(min_price))
             except ValueError:
                 pass
         if max_price:
             try:
-                queryset = queryset.filter(price__lte=float(max_price))
+                queryset = queryset.filter(effective_price__lte=float(max_price))
             except ValueError:
                 pass
         
-        # Size and color filters
+        # Size, color and stock must hold on a single variant. A semi-join that
+        # variant_attribute_idx answers on its own, stock included, so the
+        # statement stays the same size however many products match and every
+        # stock write (orders, bulk deltas) keeps the lookup current
         size = self.request.query_params.get('size')
         color = self.request.query_params.get('color')
-        if size or color:
-            variant_filter = Q()
+        in_stock = self.request.query_params.get('in_stock', '').lower() in ('true', '1')
+        if size or color or in_stock:
+            variants = ProductVariant.objects.filter(product=OuterRef('pk'))
             if size:
-                variant_filter &= Q(variants__size=size)
+                variants = variants.filter(size=size)
             if color:
-                variant_filter &= Q(variants__color=color)
-            queryset = queryset.filter(variant_filter).distinct()
+                variants = variants.filter(color=color)
+            if in_stock:
+                variants = variants.filter(stock_quantity__gt=0)
+            queryset = queryset.filter(Exists(variants))
         
         return queryset
 
-class ProductDetailView(generics.RetrieveAPIView):
-    queryset = Product.objects.filter(is_active=True).select_related('category').prefetch_related(
-        'images', 'variants', 'reviews__user'
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        data = self.paginator.get_paginated_data(serializer.data)
+        facet_counts = self.facet_counts(queryset)
+        if facet_counts is not None:
+            data['facets'] = facet_counts
+        return Response(data)
+
+    def facet_counts(self, queryset):
+        """
+        Facet counts over the filtered set. Filters the facet index covers
+        resolve to a bitset there; a price range or search needs the matching
+        ids from the database, so those are counted on the first page only.
+        """
+        params = self.request.query_params
+        index = facets.get_index()
+        if not any(params.get(name) for name in ('min_price', 'max_price', IndexedSearchFilter.search_param)):
+            try:
+                category = int(params['category']) if params.get('category') else None
+            except ValueError:
+                category = None
+            bits = index.filter_bits(
+                category=category, gender=params.get('gender') or None, brand=params.get('brand') or None,
+                size=params.get('size'), color=params.get('color'),
+                in_stock=params.get('in_stock', '').lower() in ('true', '1')
+            )
+            return index.counts(bits)
+        if params.get(self.paginator.cursor_query_param):
+            return None
+        return index.counts(index.mask(queryset.order_by().values_list('id', flat=True).iterator()))
+
+def child_subquery(model, aggregate):
+    return Subquery(
+        model.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        .annotate(value=aggregate).values('value')[:1]
     )
+
+def product_detail_validators(pk):
+    """
+    (etag, last_modified) for the product detail payload from a single query.
+    Child timestamps catch edits, child counts catch deletions. The nested
+    category is covered by its own timestamp.
+    """
+    row = Product.objects.filter(pk=pk, is_active=True).annotate(
+        variants_updated=child_subquery(ProductVariant, Max('updated_at')),
+        variants_count=child_subquery(ProductVariant, Count('id')),
+        images_updated=child_subquery(ProductImage, Max('updated_at')),
+        images_count=child_subquery(ProductImage, Count('id')),
+        reviews_updated=child_subquery(Review, Max('updated_at')),
+    ).values_list(
+        'updated_at', 'category_id', 'review_count', 'variants_updated', 'variants_count',
+        'images_updated', 'images_count', 'reviews_updated', 'category__updated_at'
+    ).first()
+    if row is None:
+        return None
+
+    etag = hashlib.sha1(repr(row).encode('utf-8')).hexdigest()
+    last_modified = max(value for value in (row[0], row[3], row[5], row[7], row[8]) if value is not None)
+    return f'"{etag}"', last_modified
+
+class ProductDetailView(generics.RetrieveAPIView):
+    queryset = ProductDetailSerializer.setup_eager_loading(Product.objects.filter(is_active=True))
     serializer_class = ProductDetailSerializer
     permission_classes = [AllowAny]
 
+    def retrieve(self, request, *args, **kwargs):
+        validators = product_detail_validators(kwargs['pk'])
+        if validators is None:
+            raise Http404
+        etag, last_modified = validators
+
+        # Answer revalidations before the product is loaded or serialized
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified.timestamp())
+        )
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+        patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+        return response
+
 class ProductCreateView(generics.CreateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductCreateUpdateSerializer
@@ -76,17 +174,60 @@ class ProductDeleteView(generics.DestroyAPIView):
     queryset = Product.objects.all()
     permission_classes = [IsAdminUser]
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def product_bulk_update_view(request):
+    """
+    Reprice, restock or toggle many products selected by ids or filter
+    """
+    serializer = ProductBulkUpdateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+
+    products = bulk.select_products(ids=data.get('ids'), filters=data.get('filter'))
+    summary = bulk.apply_changes(
+        products,
+        discount_percent=data.get('discount_percent'),
+        clear_discount='discount_percent' in data and data['discount_percent'] is None,
+        stock_delta=data.get('stock_delta'),
+        is_active=data.get('is_active'),
+        is_featured=data.get('is_featured'),
+    )
+    return Response(summary)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
-def featured_products_view(request):
+def autocomplete_view(request):
+    query = request.query_params.get('q', '')
     try:
-        products = Product.objects.filter(
+        limit = int(request.query_params.get('limit', autocomplete.MAX_LIMIT))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    suggestions = autocomplete.suggest(query, limit)
+    response = Response({
+        'query': query,
+        'products': [{'id': product_id, 'name': name} for product_id, name in suggestions['product']],
+        'brands': [{'name': name} for brand, name in suggestions['brand']],
+        'categories': [{'id': category_id, 'name': name} for category_id, name in suggestions['category']],
+    })
+    # Every keystroke is a request; let browsers and proxies absorb repeats
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def featured_products_view(request):
+    def build():
+        products = ProductListSerializer.setup_eager_loading(Product.objects.filter(
             is_featured=True, 
             is_active=True
-        ).select_related('category').prefetch_related('images', 'reviews')[:8]
-        
-        serializer = ProductListSerializer(products, many=True, context={'request': request})
-        return Response(serializer.data)
+        ))[:8]
+        return ProductListSerializer(products, many=True, context={'request': request}).data
+
+    try:
+        return catalog_cache.cached_json_response(request, 'featured', build)
     except Exception as e:
         return Response(
             {'error': 'Failed to load featured products'}, 
@@ -96,27 +237,47 @@ def featured_products_view(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def trending_products_view(request):
+    def build():
+        # Ranked by precomputed sales scores (see update_trending_scores), topped up with newest products
+        product_ids = trending.trending_products(limit=8)
+        queryset = ProductListSerializer.setup_eager_loading(Product.objects.filter(is_active=True))
+        ranked = {product.id: product for product in queryset.filter(id__in=product_ids)}
+        products = [ranked[product_id] for product_id in product_ids if product_id in ranked]
+        if len(products) < 8:
+            products += list(queryset.exclude(id__in=product_ids).order_by('-created_at')[:8 - len(products)])
+        return ProductListSerializer(products, many=True, context={'request': request}).data
+
     try:
-        # Simple trending logic - most recently added products
-        products = Product.objects.filter(
-            is_active=True
-        ).select_related('category').prefetch_related('images', 'reviews').order_by('-created_at')[:8]
-        
-        serializer = ProductListSerializer(products, many=True, context={'request': request})
-        return Response(serializer.data)
+        return catalog_cache.cached_json_response(request, 'trending', build)
     except Exception as e:
         return Response(
             {'error': 'Failed to load trending products'}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def add_review_view(request, product_id):
+REVIEW_ORDERINGS = {
+    'newest': ('-created_at',),
+    'highest': ('-rating', '-created_at'),
+    'lowest': ('rating', '-created_at'),
+}
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def product_reviews_view(request, product_id):
     try:
         product = Product.objects.get(id=product_id)
     except Product.DoesNotExist:
         return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        sort = request.query_params.get('sort', 'newest')
+        if sort not in REVIEW_ORDERINGS:
+            return Response({'error': f'sort must be one of: {", ".join(REVIEW_ORDERINGS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        reviews = product.reviews.select_related('user').order_by(*REVIEW_ORDERINGS[sort])
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(reviews, request)
+        return paginator.get_paginated_response(ReviewSerializer(page, many=True).data)
     
     # Check if user already reviewed this product
     if Review.objects.filter(product=product, user=request.user).exists():
@@ -138,14 +299,89 @@ def outfit_suggestions_view(request, product_id):
         return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
     
     try:
-        # Simple suggestion logic - products from same category and gender
-        suggestions = Product.objects.filter(
-            category=product.category,
-            gender=product.gender,
+        # Co-purchase neighbours first (see build_recommendations)
+        suggestions = list(ProductListSerializer.setup_eager_loading(Product.objects.filter(
+            recommended_for__product_id=product_id,
             is_active=True
-        ).exclude(id=product_id).select_related('category').prefetch_related('images', 'reviews')[:4]
+        )).order_by('recommended_for__rank')[:4])
+
+        # Cold start: products from same category and gender
+        if len(suggestions) < 4:
+            suggestions += list(ProductListSerializer.setup_eager_loading(Product.objects.filter(
+                category=product.category,
+                gender=product.gender,
+                is_active=True
+            ).exclude(id__in=[product_id] + [suggestion.id for suggestion in suggestions]))[:4 - len(suggestions)])
         
         serializer = ProductListSerializer(suggestions, many=True, context={'request': request})
         return Response(serializer.data)
     except Exception as e:
-        return Response([], status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response([], status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def product_feed_view(request, feed_format):
+    """
+    Stream the catalog as CSV, JSONL or XML; ?since=<watermark> for changes only
+    """
+    if feed_format not in feeds.FORMATS:
+        return Response({'error': f'Feed format must be one of: {", ".join(feeds.FORMATS)}'}, status=status.HTTP_404_NOT_FOUND)
+
+    since = None
+    if request.query_params.get('since'):
+        since = feeds.parse_since(request.query_params['since'])
+        if since is None:
+            return Response({'error': 'since must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+
+    watermark, chunks = feeds.export(feed_format, since, request.build_absolute_uri)
+    response = StreamingHttpResponse(chunks, content_type=feeds.FORMATS[feed_format])
+    response['Content-Disposition'] = f'attachment; filename="catalog.{feed_format}"'
+    response['X-Feed-Watermark'] = watermark
+    return response
+
+# Plain Django view: DRF reserves the "format" query parameter for renderer selection
+@require_GET
+def resized_image_view(request, name):
+    """
+    Uploaded image resized to ?width= in ?format= (webp, jpeg, png or auto) at ?quality=.
+    Cacheable for good only when ?v= is the source's current image_cache.source_version().
+    """
+    try:
+        width = int(request.GET.get('width', image_cache.WIDTHS[-1]))
+        quality = int(request.GET.get('quality', image_cache.DEFAULT_QUALITY))
+    except ValueError:
+        return JsonResponse({'error': 'width and quality must be integers'}, status=400)
+
+    extension = request.GET.get('format', 'auto').lower()
+    negotiated = extension == 'auto'
+    if negotiated:
+        extension = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    if extension not in image_cache.FORMATS:
+        return JsonResponse({'error': f'format must be one of: auto, {", ".join(image_cache.FORMATS)}'}, status=400)
+
+    try:
+        path, key = image_cache.get_variant(name, width, extension, quality)
+        version = image_cache.source_version(name)
+    except image_cache.UnknownImage as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    except image_cache.RenderUnavailable as e:
+        response = JsonResponse({'error': str(e)}, status=503)
+        response['Retry-After'] = '5'
+        return response
+    except image_cache.VariantError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    etag = f'"{key}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(open(path, 'rb'), content_type=image_cache.FORMATS[extension][1])
+    response['ETag'] = etag
+    if request.GET.get('v') == version:
+        # The URL names this version of the source, so its content never changes
+        patch_cache_control(response, public=True, max_age=365 * 24 * 3600, immutable=True)
+    else:
+        # The source can be replaced under the same URL; revalidate against the ETag
+        patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    if negotiated:
+        response['Vary'] = 'Accept'
+    return response
\ No newline at end of file
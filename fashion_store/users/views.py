@@ -8,6 +8,7 @@ from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
+from cart.guest import merge_request_cart
 from .models import CustomUser, PasswordReset, UserAddress
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, 
@@ -23,6 +24,7 @@ class RegisterView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
+        merge_request_cart(request, user)
         
         refresh = RefreshToken.for_user(user)
         return Response({
@@ -37,6 +39,7 @@ def login_view(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
+        merge_request_cart(request, user)
         refresh = RefreshToken.for_user(user)
         return Response({
             'user': UserProfileSerializer(user).data,
@@ -153,12 +153,14 @@ document.getElementById('loginForm')?.addEventListener('submit', async function(
         const response = await fetch(`${API_BASE_URL}/auth/login/`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ email, password })
+            body: JSON.stringify({ email, password, cart_token: getCartToken() })
         });
         
         const data = await response.json();
         
         if (response.ok) {
+            // The guest cart now lives in the account
+            localStorage.removeItem('cart_token');
             localStorage.setItem('access_token', data.access);
             localStorage.setItem('refresh_token', data.refresh);
             localStorage.setItem('user', JSON.stringify(data.user));
@@ -214,12 +216,13 @@ document.getElementById('signupForm')?.addEventListener('submit', async function
         const response = await fetch(`${API_BASE_URL}/auth/register/`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(formData)
+            body: JSON.stringify({ ...formData, cart_token: getCartToken() })
         });
         
         const data = await response.json();
         
         if (response.ok) {
+            localStorage.removeItem('cart_token');
             localStorage.setItem('access_token', data.access);
             localStorage.setItem('refresh_token', data.refresh);
             localStorage.setItem('user', JSON.stringify(data.user));
@@ -2,16 +2,9 @@ let cart = null;
 let appliedDiscount = null;
 
 async function loadCart() {
-    const token = localStorage.getItem('access_token');
-    if (!token) {
-        showAlert('Please login to view your cart', 'warning');
-        setTimeout(() => window.location.href = 'login.html', 1500);
-        return;
-    }
-    
     try {
         showLoading();
-        const response = await makeAuthenticatedRequest(`${API_BASE_URL}/cart/`);
+        const response = await cartRequest(`${API_BASE_URL}/cart/`);
         
         if (response.ok) {
             cart = await response.json();
@@ -119,32 +112,58 @@ function displayCart() {
     `).join('');
 }
 
-async function updateQuantity(itemId, newQuantity) {
-    if (newQuantity < 1) return;
+// Quantity edits made in quick succession go out as one batch request
+const CART_BATCH_DELAY_MS = 400;
+const pendingOperations = new Map();  // variant id -> latest operation
+let batchTimer = null;
+
+function updateQuantity(itemId, newQuantity) {
+    newQuantity = parseInt(newQuantity);
+    const item = cart && cart.items.find(item => item.id === itemId);
+    if (!item || !(newQuantity >= 1)) return;
+    
+    // Show the change right away; the server's cart replaces it after the batch
+    item.quantity = newQuantity;
+    item.subtotal = item.product_price * newQuantity;
+    cart.total_items = cart.items.reduce((sum, line) => sum + line.quantity, 0);
+    cart.total_price = cart.items.reduce((sum, line) => sum + line.subtotal, 0);
+    displayCart();
+    updateCartSummary();
+    
+    pendingOperations.set(item.product_variant, {
+        op: 'set',
+        product_variant_id: item.product_variant,
+        quantity: newQuantity
+    });
+    clearTimeout(batchTimer);
+    batchTimer = setTimeout(flushCartOperations, CART_BATCH_DELAY_MS);
+}
+
+async function flushCartOperations() {
+    clearTimeout(batchTimer);
+    const operations = [...pendingOperations.values()];
+    pendingOperations.clear();
+    if (operations.length === 0) return;
     
     try {
-        const response = await makeAuthenticatedRequest(`${API_BASE_URL}/cart/items/${itemId}/update/`, {
-            method: 'PUT',
-            body: JSON.stringify({ quantity: parseInt(newQuantity) })
+        const response = await cartRequest(`${API_BASE_URL}/cart/batch/`, {
+            method: 'POST',
+            body: JSON.stringify({ operations })
         });
         
         if (response.ok) {
-            cart = await response.json();
+            const updated = await response.json();
+            // Newer edits are queued; their own batch brings the final cart
+            if (pendingOperations.size > 0) return;
+            cart = updated;
             displayCart();
             updateCartSummary();
             updateCartCount();
         } else {
             const error = await response.json();
             showAlert(error.error || 'Failed to update quantity', 'danger');
-            
-            // Revert the input value on error
-            const input = document.querySelector(`input[onchange*="${itemId}"]`);
-            if (input && cart) {
-                const currentItem = cart.items.find(item => item.id === itemId);
-                if (currentItem) {
-                    input.value = currentItem.quantity;
-                }
-            }
+            // Nothing in the batch was applied; show what the server has
+            await loadCart();
         }
     } catch (error) {
         console.error('Error updating quantity:', error);
@@ -157,8 +176,11 @@ async function updateQuantity(itemId, newQuantity) {
 async function removeFromCart(itemId) {
     if (!confirm('Are you sure you want to remove this item?')) return;
     
+    const item = cart && cart.items.find(item => item.id === itemId);
+    if (item) pendingOperations.delete(item.product_variant);
+    
     try {
-        const response = await makeAuthenticatedRequest(`${API_BASE_URL}/cart/items/${itemId}/remove/`, {
+        const response = await cartRequest(`${API_BASE_URL}/cart/items/${itemId}/remove/`, {
             method: 'DELETE'
         });
         
@@ -184,7 +206,7 @@ async function clearCart() {
     if (!confirm('Are you sure you want to clear your cart?')) return;
     
     try {
-        const response = await makeAuthenticatedRequest(`${API_BASE_URL}/cart/clear/`, {
+        const response = await cartRequest(`${API_BASE_URL}/cart/clear/`, {
             method: 'DELETE'
         });
         
@@ -274,12 +296,20 @@ function updateCartSummary() {
     if (totalElement) totalElement.textContent = formatPrice(total);
 }
 
-function proceedToCheckout() {
+async function proceedToCheckout() {
+    await flushCartOperations();
     if (!cart || cart.items.length === 0) {
         showAlert('Your cart is empty', 'warning');
         return;
     }
     
+    if (!localStorage.getItem('access_token')) {
+        // The guest cart is merged into the account on login
+        showAlert('Please login to checkout', 'warning');
+        setTimeout(() => window.location.href = 'login.html', 1500);
+        return;
+    }
+    
     // Store checkout data
     const checkoutData = {
         cart: cart,
@@ -291,15 +321,8 @@ function proceedToCheckout() {
 
 // Enhanced addToCart function for use across the site
 async function addToCart(variantId, quantity = 1) {
-    const token = localStorage.getItem('access_token');
-    if (!token) {
-        showAlert('Please login to add items to cart', 'warning');
-        setTimeout(() => window.location.href = 'login.html', 1500);
-        return false;
-    }
-    
     try {
-        const response = await makeAuthenticatedRequest(`${API_BASE_URL}/cart/add/`, {
+        const response = await cartRequest(`${API_BASE_URL}/cart/add/`, {
             method: 'POST',
             body: JSON.stringify({
                 product_variant_id: variantId,
@@ -279,10 +279,28 @@ function loadCheckoutData() {
     
     checkoutData = JSON.parse(data);
     displayOrderSummary();
+    reserveStock();
     loadSavedAddresses();
     prefillUserData();
 }
 
+async function reserveStock() {
+    // Hold the cart's items while the user fills in the checkout form
+    try {
+        const response = await makeAuthenticatedRequest(`${API_BASE_URL}/cart/reserve/`, { method: 'POST' });
+        const data = await response.json();
+        if (response.ok) {
+            const expiresAt = new Date(data.expires_at);
+            showAlert(`Your items are reserved until ${expiresAt.toLocaleTimeString()}`, 'info');
+        } else if (response.status === 409) {
+            showAlert(data.error, 'warning');
+            setTimeout(() => { window.location.href = 'cart.html'; }, 2000);
+        }
+    } catch (error) {
+        console.error('Error reserving stock:', error);
+    }
+}
+
 function displayOrderSummary() {
     if (!checkoutData || !checkoutData.cart) return;
     
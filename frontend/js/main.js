@@ -34,6 +34,17 @@ function formatPrice(price) {
     return `₹${parseFloat(price).toLocaleString('en-IN')}`;
 }
 
+// Width of each server-side image rendition (see products/images.py)
+const IMAGE_RENDITION_WIDTHS = { thumbnail: 200, card: 400, detail: 800 };
+
+function imageSrcset(renditions, format = 'webp') {
+    if (!renditions) return '';
+    return Object.entries(IMAGE_RENDITION_WIDTHS)
+        .filter(([name]) => renditions[name] && renditions[name][format])
+        .map(([name, width]) => `${renditions[name][format]} ${width}w`)
+        .join(', ');
+}
+
 function getAuthHeaders() {
     const token = localStorage.getItem('access_token');
     return token ? { 'Authorization': `Bearer ${token}` } : {};
@@ -61,6 +72,30 @@ async function makeAuthenticatedRequest(url, options = {}) {
     return response;
 }
 
+// Anonymous shoppers get a server-side guest cart named by this token; it is merged on login
+function getCartToken() {
+    return localStorage.getItem('cart_token');
+}
+
+async function cartRequest(url, options = {}) {
+    if (localStorage.getItem('access_token')) {
+        return makeAuthenticatedRequest(url, options);
+    }
+
+    const cartToken = getCartToken();
+    const headers = {
+        'Content-Type': 'application/json',
+        ...(cartToken ? { 'X-Cart-Token': cartToken } : {}),
+        ...options.headers
+    };
+    const response = await fetch(url, { ...options, headers });
+    if (response.ok) {
+        const data = await response.clone().json();
+        if (data.cart_token) localStorage.setItem('cart_token', data.cart_token);
+    }
+    return response;
+}
+
 async function refreshToken() {
     const refreshToken = localStorage.getItem('refresh_token');
     if (!refreshToken) return false;
@@ -179,7 +214,7 @@ function updateProductsGrid(products, containerId) {
             <div class="col-lg-3 col-md-6 col-6">
                 <div class="product-card h-100" onclick="window.location.href='product-detail.html?id=${product.id}'" style="cursor: pointer;">
                     <div class="product-image" style="position: relative; overflow: hidden; background: #F5F5F5; height: 400px;">
-                        <img src="${imageUrl}" alt="${product.name}" style="width: 100%; height: 100%; object-fit: cover; transition: transform 0.6s;">
+                        <img src="${imageUrl}" srcset="${imageSrcset(product.primary_image_srcset)}" sizes="(min-width: 992px) 25vw, 50vw" alt="${product.name}" loading="lazy" style="width: 100%; height: 100%; object-fit: cover; transition: transform 0.6s;">
                         ${product.discount_price ? '<span class="product-badge" style="position: absolute; top: 16px; left: 16px; background: #000; color: white; padding: 6px 14px; font-size: 10px; font-weight: 700; letter-spacing: 1px;">SALE</span>' : ''}
                     </div>
                     <div class="product-info" style="padding: 16px 0; text-align: left;">
@@ -222,17 +257,16 @@ async function updateCartCount() {
     const cartBadge = document.getElementById('cartCount');
     if (!cartBadge) return;
     
-    const token = localStorage.getItem('access_token');
-    if (!token) {
+    if (!localStorage.getItem('access_token') && !getCartToken()) {
         cartBadge.textContent = '0';
         return;
     }
     
     try {
-        const response = await makeAuthenticatedRequest(`${API_BASE_URL}/cart/`);
+        const response = await cartRequest(`${API_BASE_URL}/cart/summary/`);
         if (response.ok) {
-            const cart = await response.json();
-            cartBadge.textContent = cart.total_items || 0;
+            const summary = await response.json();
+            cartBadge.textContent = summary.total_items || 0;
         } else {
             cartBadge.textContent = '0';
         }
@@ -243,16 +277,9 @@ async function updateCartCount() {
 }
 
 async function addToCart(productVariantId, quantity = 1) {
-    const token = localStorage.getItem('access_token');
-    if (!token) {
-        showAlert('Please login to add items to cart', 'warning');
-        window.location.href = 'login.html';
-        return;
-    }
-    
     try {
         showLoading();
-        const response = await makeAuthenticatedRequest(`${API_BASE_URL}/cart/add/`, {
+        const response = await cartRequest(`${API_BASE_URL}/cart/add/`, {
             method: 'POST',
             body: JSON.stringify({
                 product_variant_id: productVariantId,
@@ -13,7 +13,8 @@ async function loadOrders() {
         const response = await makeAuthenticatedRequest(`${API_BASE_URL}/orders/`);
         
         if (response.ok) {
-            orders = await response.json();
+            const data = await response.json();
+            orders = data.results || data;
             displayOrders();
         } else {
             showAlert('Error loading orders', 'danger');
@@ -68,7 +68,7 @@ function displayProductDetails() {
                     <div class="rating me-3">
                         ${generateStarRating(currentProduct.average_rating || 0)}
                     </div>
-                    <span class="text-muted">(${currentProduct.reviews?.length || 0} reviews)</span>
+                    <span class="text-muted">(${currentProduct.review_summary?.count || 0} reviews)</span>
                 </div>
                 
                 <div class="price mb-4">
@@ -273,10 +273,26 @@ function loadProductTabs() {
     loadReviews();
 }
 
+function renderReview(review) {
+    return `
+        <div class="review-item border-bottom py-3">
+            <div class="d-flex justify-content-between align-items-start mb-2">
+                <div>
+                    <strong>${review.user_name || 'Anonymous'}</strong>
+                    <div class="rating">${generateStarRating(review.rating)}</div>
+                </div>
+                <small class="text-muted">${formatDate(review.created_at)}</small>
+            </div>
+            <p class="mb-0">${review.comment}</p>
+        </div>
+    `;
+}
+
 function loadReviews() {
     const reviewsContainer = document.getElementById('productReviews');
+    const summary = currentProduct.review_summary || { count: 0, recent: [] };
     
-    if (!currentProduct.reviews || currentProduct.reviews.length === 0) {
+    if (!summary.count) {
         reviewsContainer.innerHTML = `
             <div class="text-center py-4">
                 <p class="text-muted">No reviews yet. Be the first to review this product!</p>
@@ -291,32 +307,54 @@ function loadReviews() {
             <div class="row">
                 <div class="col-md-6">
                     <div class="average-rating">
-                        <span class="h2">${currentProduct.average_rating || 0}</span>
-                        <div class="rating">${generateStarRating(currentProduct.average_rating || 0)}</div>
-                        <small class="text-muted">${currentProduct.reviews.length} review(s)</small>
+                        <span class="h2">${summary.average || 0}</span>
+                        <div class="rating">${generateStarRating(summary.average || 0)}</div>
+                        <small class="text-muted">${summary.count} review(s)</small>
                     </div>
                 </div>
                 <div class="col-md-6 text-md-end">
+                    <select class="form-select d-inline-block w-auto me-2" id="reviewSort" onchange="loadReviewPage()">
+                        <option value="newest">Newest</option>
+                        <option value="highest">Highest rated</option>
+                        <option value="lowest">Lowest rated</option>
+                    </select>
                     <button class="btn btn-primary" onclick="openReviewModal()">Write a Review</button>
                 </div>
             </div>
         </div>
         
-        <div class="reviews-list">
-            ${currentProduct.reviews.map(review => `
-                <div class="review-item border-bottom py-3">
-                    <div class="d-flex justify-content-between align-items-start mb-2">
-                        <div>
-                            <strong>${review.user_name || 'Anonymous'}</strong>
-                            <div class="rating">${generateStarRating(review.rating)}</div>
-                        </div>
-                        <small class="text-muted">${formatDate(review.created_at)}</small>
-                    </div>
-                    <p class="mb-0">${review.comment}</p>
-                </div>
-            `).join('')}
+        <div class="reviews-list" id="reviewsList">
+            ${summary.recent.map(renderReview).join('')}
+        </div>
+        <div class="text-center mt-3">
+            <button class="btn btn-outline-primary" id="moreReviews" onclick="loadReviewPage(reviewsNextUrl)"
+                    style="${summary.count > summary.recent.length ? '' : 'display: none;'}">More reviews</button>
         </div>
     `;
+    reviewsNextUrl = null;
+}
+
+let reviewsNextUrl = null;
+
+// Without a url, starts over with the selected sort
+async function loadReviewPage(url) {
+    const list = document.getElementById('reviewsList');
+    const moreButton = document.getElementById('moreReviews');
+    if (!url) {
+        const sort = document.getElementById('reviewSort').value;
+        url = `${API_BASE_URL}/products/${currentProduct.id}/reviews/?sort=${sort}`;
+        list.innerHTML = '';
+    }
+    
+    try {
+        const response = await fetch(url);
+        const data = await response.json();
+        list.insertAdjacentHTML('beforeend', (data.results || []).map(renderReview).join(''));
+        reviewsNextUrl = data.next;
+        moreButton.style.display = data.next ? '' : 'none';
+    } catch (error) {
+        console.error('Error loading reviews:', error);
+    }
 }
 
 function openReviewModal() {
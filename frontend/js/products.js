@@ -2,15 +2,29 @@
 let currentPage = 1;
 let currentFilters = {};
 let totalPages = 1;
+let totalCount = 0;
+const PAGE_SIZE = 20;
+// The API pages with opaque cursors; remember the cursor that opens each visited page
+let pageCursors = { 1: null };
 
 async function loadProducts(page = 1) {
     try {
         showLoading();
         
+        if (page === 1) {
+            pageCursors = { 1: null };
+        }
+        
         const params = new URLSearchParams({
-            page: page,
+            page_size: PAGE_SIZE,
             ...currentFilters
         });
+        if (pageCursors[page]) {
+            params.set('cursor', pageCursors[page]);
+        } else {
+            // The total only changes with the filters, so ask for it on the first page
+            params.set('with_count', 'true');
+        }
         
         const response = await fetch(`${API_BASE_URL}/products/?${params}`);
         
@@ -22,14 +36,20 @@ async function loadProducts(page = 1) {
         
         // Handle both paginated and non-paginated responses
         const products = data.results || data;
-        const count = data.count || (Array.isArray(data) ? data.length : 0);
+        if (data.count !== undefined) {
+            totalCount = data.count;
+        }
+        const count = Array.isArray(data) ? data.length : totalCount;
         
         displayProducts(products);
         updateResultsCount(count);
         
         // Update pagination only if we have paginated data
         if (data.results) {
-            totalPages = Math.ceil(count / (data.results.length || 10));
+            totalPages = Math.max(1, Math.ceil(count / PAGE_SIZE));
+            if (data.next) {
+                pageCursors[page + 1] = new URL(data.next).searchParams.get('cursor');
+            }
             updatePagination(data, page);
         }
         
@@ -77,6 +97,7 @@ function displayProducts(products) {
             <div class="card product-card h-100">
                 <div class="product-image" onclick="viewProductDetails(${product.id})" style="cursor: pointer;">
                     <img src="${product.primary_image || 'https://via.placeholder.com/300x250'}" 
+                         srcset="${imageSrcset(product.primary_image_srcset)}" sizes="(min-width: 992px) 33vw, 50vw"
                          alt="${product.name}" loading="lazy">
                     ${product.discount_price ? '<span class="product-badge">Sale</span>' : ''}
                     ${product.is_featured ? '<span class="product-badge" style="right: 12px; left: auto; background: #28a745;">Featured</span>' : ''}
@@ -143,11 +164,12 @@ function updatePagination(data, currentPage) {
         </li>
     `;
     
-    // Page numbers
+    // Page numbers (only pages whose cursor is already known can be opened)
     const startPage = Math.max(1, currentPage - 2);
-    const endPage = Math.min(totalPages, currentPage + 2);
+    const endPage = Math.min(totalPages, currentPage + 1);
     
     for (let i = startPage; i <= endPage; i++) {
+        if (!(i in pageCursors)) continue;
         paginationHTML += `
             <li class="page-item ${i === currentPage ? 'active' : ''}">
                 <a class="page-link" href="#" onclick="changePage(${i}); return false;">${i}</a>
@@ -169,7 +191,7 @@ function updatePagination(data, currentPage) {
 }
 
 function changePage(page) {
-    if (page < 1 || page > totalPages) return;
+    if (page < 1 || page > totalPages || !(page in pageCursors)) return;
     loadProducts(page);
     window.scrollTo({ top: 0, behavior: 'smooth' });
 }
@@ -229,16 +251,6 @@ function clearFilters() {
 }
 
 async function quickAddToCart(productId) {
-    // Check authentication first
-    const token = localStorage.getItem('access_token');
-    if (!token) {
-        showAlert('Please login to add items to cart', 'warning');
-        setTimeout(() => {
-            window.location.href = 'login.html';
-        }, 1500);
-        return;
-    }
-
     try {
         // Get the clicked button and show loading state
         const clickedBtn = event.target.closest('button');
@@ -266,8 +278,8 @@ async function quickAddToCart(productId) {
             throw new Error('Product is out of stock');
         }
         
-        // Add to cart using authenticated request
-        const cartResponse = await makeAuthenticatedRequest(`${API_BASE_URL}/cart/add/`, {
+        // Add to the account cart, or the guest cart when not logged in
+        const cartResponse = await cartRequest(`${API_BASE_URL}/cart/add/`, {
             method: 'POST',
             body: JSON.stringify({
                 product_variant_id: availableVariant.id,